@@ -18,6 +18,7 @@ class FriendshipSerializer(serializers.ModelSerializer):
     class Meta:
         model = Friendship
         fields = "__all__"
+        read_only_fields = ("pair_low", "pair_high", "direction")
 
 class GroupSerializer(serializers.ModelSerializer):
     '''
@@ -67,7 +68,9 @@ class NewsSerializer(serializers.ModelSerializer):
     '''
     class Meta:
         model = News
-        fields = '__all__'
+        # tag_names - служебная копия тэгов для поиска, тэги уже есть в поле tags
+        exclude = ('tag_names',)
+        read_only_fields = ('like_count', 'dislike_count')
 
 class ActivityLogSerializer(serializers.ModelSerializer):
     '''
@@ -1,3 +1,50 @@
-from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from main.lookups import FRIENDSHIP_BLOCKED, FRIENDSHIP_REQUESTED, friendship_status_id
+from main.models import Friendship
+from main.tests import LookupTestCase
+
+from .views import FriendshipViewSet
+
+
+class FriendshipApiTests(LookupTestCase):
+    '''API заявок в друзья: одна связь на пару профилей'''
+
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.first = self.create_profile("first")
+        self.second = self.create_profile("second")
+
+    def send_request(self, sender, profile_id):
+        request = self.factory.post(
+            "/api/v1/friendships/send_request/", {"profile_id": profile_id}, format="json"
+        )
+        force_authenticate(request, user=sender.user)
+        return FriendshipViewSet.as_view({"post": "send_request"})(request)
+
+    def test_send_request(self):
+        response = self.send_request(self.first, self.second.id)
+        self.assertEqual(response.status_code, 200)
+        friendship = Friendship.objects.between(self.first, self.second).get()
+        self.assertEqual(friendship.profile_one_id, self.first.id)
+        self.assertEqual(friendship.status_id, friendship_status_id(FRIENDSHIP_REQUESTED))
+
+    def test_counter_request_is_rejected(self):
+        self.send_request(self.first, self.second.id)
+        response = self.send_request(self.second, self.first.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Friendship.objects.count(), 1)
+
+    def test_request_to_blocker_is_rejected(self):
+        Friendship.objects.block(self.second, self.first)
+        response = self.send_request(self.first, self.second.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            Friendship.objects.between(self.first, self.second).get().status_id,
+            friendship_status_id(FRIENDSHIP_BLOCKED),
+        )
+
+    def test_unknown_profile(self):
+        self.assertEqual(self.send_request(self.first, self.second.id + 1000).status_code, 404)
+        self.assertEqual(self.send_request(self.first, "").status_code, 400)
@@ -1,5 +1,5 @@
 from django.shortcuts import get_object_or_404, render
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.http import JsonResponse
 
 from rest_framework.decorators import action
@@ -8,7 +8,12 @@ from rest_framework.response import Response
 
 from .serializers import ProfileSerializer, ActivityLogSerializer, GroupSerializer, FriendshipSerializer, \
     NotificationSerializer
-from main.models import Profile, Friendship, ActivityLog, Group, Notification, FriendshipStatus
+from main.models import Profile, Friendship, ActivityLog, Group, Notification
+from main.friend_graph import friends_of
+from main.lookups import (FRIENDSHIP_BLOCKED, FRIENDSHIP_FRIENDS, FRIENDSHIP_REQUESTED,
+                          friendship_status_id)
+from main.recommendations import get_recommendations
+from main.similarity import get_similar_profiles
 
 
 class ProfileViewSet(viewsets.ModelViewSet):
@@ -23,17 +28,9 @@ class ProfileViewSet(viewsets.ModelViewSet):
         try:
             profile = request.user.profile
 
-            friends_ids = Friendship.objects.filter(
-                Q(profile_one=profile) | Q(profile_two=profile), status="friends"
-            ).values_list("profile_one", "profile_two")
-
-            friends = set(
-                friend for friend_list in friends_ids for friend in friend_list
-            )
-            friends.remove(profile.id)
-
+            # id друзей берем из индекса графа дружбы
             friends_online = Profile.objects.filter(
-                id__in=friends_ids, status_profile__is_online=True
+                id__in=friends_of(profile.id), statusprofile__is_online=True
             )
 
             serializer = self.get_serializer(friends_online, many=True)
@@ -47,16 +44,16 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def get_reccomended_friends(self, request):
-        # Получение рекомендаций о друзьях на основании интересов
+        # Получение рекомендаций о друзьях: друзья друзей и общие интересы.
+        # Рекомендации предрасчитаны задачей refresh_friend_recommendations, поэтому здесь одно чтение
         try:
             profile = request.user.profile
-            user_interests = profile.interests.values_list("id", flat=True)
+            try:
+                limit = int(request.query_params.get("limit", 0))
+            except ValueError:
+                limit = 0
 
-            recomended_profiles = Profile.objects.exclude(id=profile.id).annotate(
-                interests_count=Count(
-                    "interests", filter=Q(interests__in=user_interests)
-                ).order_by("-interests_count")
-            )
+            recomended_profiles = get_recommendations(profile, limit or None)
 
             serializer = self.get_serializer(recomended_profiles, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -67,6 +64,27 @@ class ProfileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
+    @action(detail=False, methods=["get"])
+    def get_similar_profiles(self, request):
+        # Получение похожих по интересам профилей ("люди как вы"), предрасчитанных задачей
+        try:
+            profile = request.user.profile
+            try:
+                limit = int(request.query_params.get("limit", 0))
+            except ValueError:
+                limit = 0
+
+            similar_profiles = get_similar_profiles(profile, limit or None)
+
+            serializer = self.get_serializer(similar_profiles, many=True)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        except Profile.DoesNotExist:
+            return Response(
+                {"detail": "Профиль пользователя не найден"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
 class ActivityLogViewSet(viewsets.ModelViewSet):
     '''Представление для работы с таблицей активность '''
 
@@ -152,23 +170,22 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        if Friendship.objects.filter(
-            (
-                Q(profile_one=profile_one, profile_two=profile_two)
-                | Q(profile_one=profile_two, profile_two=profile_one)
-            )
-            & ~Q(
-                status__name="Заблокирован"
-            )  # Добавим условие, чтобы не учитывать заблокированные
-        ).exists():
+        # Между двумя профилями может быть только одна связь (дружба, заявка или блокировка)
+        existing = Friendship.objects.between(profile_one, profile_two).first()
+        if existing is not None:
+            if existing.status_id == friendship_status_id(FRIENDSHIP_BLOCKED):
+                detail = "Нельзя отправить запрос: пользователь заблокирован"
+            else:
+                detail = "Вы уже друзья или запрос уже отправлен"
             return Response(
-                {"detail": "Вы уже друзья или запрос уже отправлен"},
+                {"detail": detail},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        friendship_status = FriendshipStatus.objects.get(name="Отправлен запрос")
         friendship = Friendship.objects.create(
-            profile_one=profile_one, profile_two=profile_two, status=friendship_status
+            profile_one=profile_one,
+            profile_two=profile_two,
+            status_id=friendship_status_id(FRIENDSHIP_REQUESTED),
         )
 
 
@@ -194,7 +211,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
-            if friendship.status.name != "Отправлен запрос":
+            if friendship.status_id != friendship_status_id(FRIENDSHIP_REQUESTED):
                 return JsonResponse(
                     {
                         "detail": "Невозможно принять запрос. Запрос не найден или уже принят"
@@ -202,7 +219,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            friendship.status = FriendshipStatus.objects.get(name="Друзья")
+            friendship.status_id = friendship_status_id(FRIENDSHIP_FRIENDS)
             friendship.save()
 
 
@@ -223,24 +240,8 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         profile_one = request.user.profile
         profile_two = Profile.objects.get(id=pk)
 
-        # Проверяем наличие дружбы или запроса на дружбу
-        existing_friendship = Friendship.objects.filter(
-            (
-                Q(profile_one=profile_one, profile_two=profile_two)
-                | Q(profile_one=profile_two, profile_two=profile_one)
-            )
-            & Q(status__name__in=["Друзья", "Отправлен запрос"])
-        ).first()  # Используем first() для получения первого найденного объекта или None
-
-        if existing_friendship:
-            # Удаляем существующую дружбу или запрос на дружбу
-            existing_friendship.delete()
-
-        # Создаем запись о блокировке
-        friendship_status = FriendshipStatus.objects.get(name="Заблокирован")
-        Friendship.objects.create(
-            profile_one=profile_one, profile_two=profile_two, status=friendship_status
-        )
+        # Дружба или запрос на дружбу заменяются блокировкой (одна строка на пару профилей)
+        Friendship.objects.block(profile_one, profile_two)
 
 
         return JsonResponse(
@@ -265,16 +266,8 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                 {"detail": "Профиль не найден"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # Проверяем наличие блокировки
-        existing_friendship = Friendship.objects.filter(
-            profile_one=profile_one,
-            profile_two=profile_two,
-            status__name="Заблокирован",
-        ).first()  # Используем first() для получения первого найденного объекта или None
-
-        if existing_friendship:
-            # Удаляем существующую блокировку
-            existing_friendship.delete()
+        # Снимаем блокировку, если она была (при взаимной блокировке остается встречная)
+        if Friendship.objects.unblock(profile_one, profile_two):
 
 
             return JsonResponse(
@@ -327,43 +320,21 @@ class FriendshipViewSet(viewsets.ModelViewSet):
 
         profile_2 = get_object_or_404(Profile, id=pk)
 
-        # Определяем, есть ли дружба между текущим пользователем и владельцем профиля
-        friendship_exists = (
-            Friendship.objects.filter(
-                profile_one__user=request.user,
-                profile_two=profile_2,
-                status__name="Друзья",
-            ).exists()
-            or Friendship.objects.filter(
-                profile_one=profile_2,
-                profile_two__user=request.user,
-                status__name="Друзья",
-            ).exists()
+        # Ищем дружбу между текущим пользователем и владельцем профиля (одна строка на пару)
+        friendship = (
+            Friendship.objects.between(request.user.profile, profile_2)
+            .filter(status_id=friendship_status_id(FRIENDSHIP_FRIENDS))
+            .first()
         )
 
-        if friendship_exists:
-            # Попробуем найти и удалить дружбу
-            try:
-                friendship = Friendship.objects.get(
-                    (
-                        Q(profile_one__user=request.user, profile_two=profile_2)
-                        | Q(profile_one=profile_2, profile_two__user=request.user)
-                    ),
-                    status__name="Друзья",
-                )
-
-                # Удаляем объект дружбы
-                friendship.delete()
-
+        if friendship is not None:
+            # Удаляем объект дружбы
+            friendship.delete()
 
-                return Response(
-                    {"detail": "Дружба успешно удалена."}, status=status.HTTP_200_OK
-                )
 
-            except Friendship.DoesNotExist:
-                return Response(
-                    {"detail": "Дружба не найдена."}, status=status.HTTP_404_NOT_FOUND
-                )
+            return Response(
+                {"detail": "Дружба успешно удалена."}, status=status.HTTP_200_OK
+            )
 
         else:
             return JsonResponse(
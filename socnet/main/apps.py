@@ -1,4 +1,3 @@
-from django.core.cache import cache
 from django.apps import AppConfig
 
 
@@ -10,8 +9,8 @@ class MainConfig(AppConfig):
     def ready(self):
         import main.signals
 
-        # чистим весь кеш при рестарте сервера
-        cache.clear()
+        # Кэш при рестарте больше не чистится: при необходимости
+        # используйте команду manage.py clear_cache
 
 
 
@@ -0,0 +1,206 @@
+"""Версионируемые пространства имен кэша.
+
+Ключ кэша строится как <пространство>_<версия>_<ключ>. Для инвалидации всего
+пространства (например, всех отфильтрованных списков новостей) достаточно
+увеличить его версию - старые ключи перестают читаться и сами истекают по таймауту.
+"""
+
+import math
+import random
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Profile
+
+
+def _version_key(namespace):
+    return f"ns_version_{namespace}"
+
+
+def _initial_version():
+    # Начальная версия берется от времени: если счетчик вытеснят из кэша,
+    # новая версия не совпадет со старой и устаревшие ключи не оживут
+    return int(time.time() * 1000)
+
+
+def get_namespace_version(namespace):
+    """Возвращает текущую версию пространства имен, создавая ее при первом обращении"""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # add атомарна: при гонке воркеров все получат версию, записанную первым
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key, _initial_version())
+    return version
+
+
+def namespaced_key(namespace, key):
+    """Ключ кэша внутри текущей версии пространства имен"""
+    return f"{namespace}_{get_namespace_version(namespace)}_{key}"
+
+
+def bump_namespace(namespace):
+    """Инвалидирует все ключи пространства имен за O(1), увеличивая его версию.
+    Возвращает новую версию"""
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Версии еще нет (или ее вытеснили) - старые ключи и так недоступны
+        cache.add(key, _initial_version(), None)
+        return cache.get(key)
+
+
+def delete_after_commit(*keys):
+    """Удаляет ключи сейчас и повторно после фиксации транзакции: иначе параллельный
+    запрос мог бы успеть закэшировать данные, которые транзакция еще не записала"""
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CacheStats:
+    '''
+    Счетчики попаданий и промахов кэша по пространствам имен.
+    Счетчики общие для процесса (у каждого воркера свои) и нужны, чтобы видеть,
+    как восстанавливается доля попаданий после сброса или инвалидации.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.started_at = timezone.now()
+
+    def record(self, namespace, hit):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self._counters.items():
+                total = counters["hits"] + counters["misses"]
+                namespaces[namespace] = {
+                    **counters,
+                    "hit_rate": round(counters["hits"] / total, 4) if total else None,
+                }
+        return {"since": self.started_at.isoformat(), "namespaces": namespaces}
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self.started_at = timezone.now()
+
+
+cache_stats = CacheStats()
+
+
+def cache_get(namespace, key):
+    """cache.get с учетом попадания/промаха в статистике пространства имен"""
+    value = cache.get(key)
+    cache_stats.record(namespace, value is not None)
+    return value
+
+
+def user_cache_keys(user):
+    """Ключи кэша, принадлежащие одному пользователю"""
+    keys = [
+        f"profile_{user.username}",
+        f"friends_{user.username}",
+        payload_key(f"media_{user.username}"),
+    ]
+    profile_id = Profile.objects.filter(user=user).values_list("id", flat=True).first()
+    if profile_id is not None:
+        keys += [f"sender_mail_{profile_id}", f"recipient_mail_{profile_id}"]
+    return keys
+
+
+def _store(key, value, delta, timeout, stale_timeout):
+    # В кэше лежит конверт (значение, время вычисления, логический срок жизни).
+    # Физически ключ живет дольше на stale_timeout, чтобы было что отдать, пока значение пересчитывается
+    cache.set(key, (value, delta, time.time() + timeout), timeout + stale_timeout)
+
+
+def cached_compute(
+    namespace,
+    key,
+    compute,
+    timeout=86400,
+    stale_timeout=300,
+    lock_timeout=10,
+    beta=1.0,
+    wait_timeout=2.0,
+    cache_if=None,
+):
+    """Получение значения из кэша с защитой от одновременного пересчета (cache stampede).
+
+    - пересчитывает значение только один процесс: блокировка через атомарный cache.add;
+    - незадолго до истечения срока значение с растущей вероятностью пересчитывается заранее
+      (probabilistic early expiration / XFetch), чем дольше считается значение - тем раньше;
+    - пока значение пересчитывается, остальные запросы получают устаревшую копию;
+    - если копии нет совсем, запросы недолго ждут результата от владельца блокировки.
+
+    compute вызывается без аргументов и может вернуть любое сериализуемое значение, в том числе None.
+    cache_if - необязательная проверка значения: если она вернула False, значение не кэшируется.
+    Исключения из compute (например, Http404) пробрасываются наружу.
+    """
+    lock_key = f"{key}_lock"
+    envelope = cache.get(key)
+    cache_stats.record(namespace, envelope is not None)
+
+    if envelope is not None:
+        value, delta, expires = envelope
+        # 1 - random() лежит в (0, 1], поэтому логарифм всегда определен
+        refresh_at = expires + delta * beta * math.log(1 - random.random())
+        if time.time() < refresh_at:
+            return value
+
+        if not cache.add(lock_key, True, lock_timeout):
+            # значение уже пересчитывает другой запрос - отдаем устаревшую копию
+            return value
+    elif not cache.add(lock_key, True, lock_timeout):
+        # Холодный промах и блокировка занята: ждем, пока владелец блокировки положит значение
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            envelope = cache.get(key)
+            if envelope is not None:
+                return envelope[0]
+        # не дождались - считаем сами, чтобы не отдавать ошибку
+        return compute()
+
+    try:
+        start = time.monotonic()
+        value = compute()
+        if cache_if is None or cache_if(value):
+            _store(key, value, time.monotonic() - start, timeout, stale_timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+# Версия формата компактных записей (кортежей) в кэше. Входит в ключ, поэтому при изменении
+# состава полей нужно ее увеличить - записи старого формата просто перестанут читаться
+PAYLOAD_VERSION = 2
+
+# Списки длиннее не кэшируются: запись не должна упираться в лимит memcached (1 МБ)
+PAYLOAD_MAX_ROWS = 1000
+
+
+def payload_key(key):
+    """Ключ кэша для компактной записи текущей версии формата"""
+    return f"v{PAYLOAD_VERSION}_{key}"
+
+
+def fits_payload(rows):
+    """Проверка размера списка перед кэшированием"""
+    return len(rows) <= PAYLOAD_MAX_ROWS
+
+
+def unpack_rows(fields, rows):
+    """Превращает закэшированные кортежи в словари для шаблона"""
+    return [dict(zip(fields, row)) for row in rows]
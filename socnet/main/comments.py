@@ -0,0 +1,89 @@
+"""Загрузка дерева комментариев новости.
+
+Все комментарии новости выбираются одним запросом (вместе с авторами), а иерархия
+собирается в Python: у каждого комментария появляется список children.
+Корневые ветки отдаются страницами по курсору (created_at, id).
+"""
+
+from django.conf import settings
+
+from .models import Comment
+from .pagination import encode_cursor, keyset_after
+
+
+# Сколько живет в кэше HTML одного комментария (сбрасывается сигналами при изменении)
+COMMENT_HTML_TIMEOUT = 86400
+
+
+def comment_html_key(comment_id):
+    """Ключ кэша HTML одного комментария"""
+    return f"comment_html_{comment_id}"
+
+
+def build_comment_tree(comments):
+    """Собирает дерево из списка комментариев, отсортированных по (created_at, id).
+    Возвращает список корневых комментариев"""
+    nodes = {}
+    for comment in comments:
+        comment.children = []
+        nodes[comment.id] = comment
+
+    roots = []
+    for comment in comments:
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.children.append(comment)
+    return roots
+
+
+def load_comment_tree(news_id):
+    """Дерево комментариев новости: один запрос с select_related("author")"""
+    comments = list(
+        Comment.objects.filter(news_id=news_id)
+        .select_related("author")
+        .order_by("created_at", "id")
+    )
+    return build_comment_tree(comments)
+
+
+def comment_cursor(comment):
+    """Курсор на позицию комментария"""
+    return encode_cursor(comment.created_at, comment.id)
+
+
+def last_comment_cursor(roots):
+    """Курсор самого нового комментария дерева (для запроса "новые с момента")"""
+    last = None
+    stack = list(roots)
+    while stack:
+        comment = stack.pop()
+        if last is None or (comment.created_at, comment.id) > (last.created_at, last.id):
+            last = comment
+        stack.extend(comment.children)
+    return comment_cursor(last) if last is not None else None
+
+
+def paginate_roots(roots, cursor=None, limit=None):
+    """Страница корневых веток после курсора. Возвращает (ветки, курсор следующей страницы)"""
+    limit = limit or settings.COMMENT_ROOTS_PAGE_SIZE
+    if cursor is not None:
+        roots = [root for root in roots if (root.created_at, root.id) > cursor]
+
+    page = roots[:limit]
+    next_cursor = comment_cursor(page[-1]) if len(roots) > limit else None
+    return page, next_cursor
+
+
+def comments_since(news_id, cursor, limit=None):
+    """Комментарии новости (любой глубины), добавленные после курсора, от старых к новым"""
+    limit = limit or settings.COMMENTS_SINCE_LIMIT
+    comments = Comment.objects.filter(news_id=news_id).select_related("author")
+    if cursor is not None:
+        comments = keyset_after(comments, cursor)
+
+    comments = list(comments.order_by("created_at", "id")[:limit])
+    for comment in comments:
+        comment.children = []
+    return comments
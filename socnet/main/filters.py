@@ -1,6 +1,8 @@
 from django_filters import rest_framework as filters
 from django_filters import DateFilter
 from .models import *
+from .profile_search import profile_name_index
+from .search import order_by_ids, search_news
 
 
 class FriendshipFilter(filters.FilterSet):
@@ -22,6 +24,8 @@ class ProfileFilter(filters.FilterSet):
     Фильтр профиля
     '''
 
+    # Нечеткий поиск по имени, фамилии и логину (main/profile_search.py), результаты по релевантности
+    q = filters.CharFilter(method='filter_search', label='Поиск по имени')
     firstname = filters.CharFilter(field_name='firstname', lookup_expr='icontains', label='Имя')
     lastname = filters.CharFilter(field_name='lastname', lookup_expr='icontains', label='Фамилия')
     location = filters.CharFilter(field_name='location', lookup_expr='icontains', label='Местоположение')
@@ -34,7 +38,13 @@ class ProfileFilter(filters.FilterSet):
 
     class Meta:
         model = Profile
-        fields = ['firstname', 'lastname', 'gender', 'location', 'interests']
+        fields = ['q', 'firstname', 'lastname', 'gender', 'location', 'interests']
+
+    def filter_search(self, queryset, name, value):
+        ids = profile_name_index.search(value)
+        if not ids:
+            return queryset.none()
+        return order_by_ids(queryset, ids)
 
 class GroupFilter(filters.FilterSet):
     '''
@@ -54,14 +64,31 @@ class NewsFilter(filters.FilterSet):
     Фильтр новостей
     '''
 
-    title = filters.CharFilter(field_name='title', lookup_expr='icontains', label='Название новости')
-    content = filters.CharFilter(field_name='content', lookup_expr='icontains', label='Текст новости')
+    # Поиск идет по полнотекстовому индексу (main/search.py), а не через icontains
+    q = filters.CharFilter(method='filter_search', label='Поиск')
+    title = filters.CharFilter(method='filter_search', label='Название новости')
+    content = filters.CharFilter(method='filter_search', label='Текст новости')
     created_at = DateFilter(field_name='created_at', lookup_expr='gte', label='Дата создания позже:')
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags',
         queryset=Tag.objects.all(),
         label='Тэги'
     )
+    # Поисковые фильтры применяются последними: ранжируются только новости,
+    # уже прошедшие фильтры по дате и тэгам
+    search_filters = ('q', 'title', 'content')
+
     class Meta:
         model = News
-        fields = ['title', 'content', 'created_at', 'tags']
+        fields = ['q', 'title', 'content', 'created_at', 'tags']
+
+    def filter_queryset(self, queryset):
+        data = self.form.cleaned_data
+        for name, value in sorted(data.items(), key=lambda item: item[0] in self.search_filters):
+            queryset = self.filters[name].filter(queryset, value)
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        # q ищет по всем полям, title и content - только по своей колонке
+        column = None if name == 'q' else name
+        return search_news(queryset, value, column=column)
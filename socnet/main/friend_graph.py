@@ -0,0 +1,84 @@
+"""Индекс графа дружбы.
+
+Для каждого профиля в кэше хранится отсортированный кортеж id его друзей.
+Проверка дружбы - бинарный поиск по кортежу (O(log n)), общие друзья - пересечение
+двух кортежей. При промахе кортеж строится одним запросом по индексам profile_one/profile_two.
+Сигналы Friendship сбрасывают кортежи обоих участников.
+"""
+
+import bisect
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .lookups import FRIENDSHIP_FRIENDS, friendship_status_id
+from .models import Friendship
+
+
+# Ключ кэша с друзьями профиля
+FRIEND_IDS_KEY = "friend_ids_{}"
+
+# Сколько живет кортеж друзей, если его не сбросили сигналы
+FRIEND_IDS_TIMEOUT = 86400
+
+
+def _friend_ids_key(profile_id):
+    return FRIEND_IDS_KEY.format(profile_id)
+
+
+def _load_friend_ids(profile_id):
+    rows = Friendship.objects.filter(
+        Q(profile_one_id=profile_id) | Q(profile_two_id=profile_id),
+        status_id=friendship_status_id(FRIENDSHIP_FRIENDS),
+    ).values_list("profile_one_id", "profile_two_id")
+    return tuple(sorted({two if one == profile_id else one for one, two in rows}))
+
+
+def friends_of(profile_id):
+    """Отсортированный кортеж id друзей профиля"""
+    key = _friend_ids_key(profile_id)
+    friend_ids = cache.get(key)
+    if friend_ids is None:
+        friend_ids = _load_friend_ids(profile_id)
+        cache.set(key, friend_ids, FRIEND_IDS_TIMEOUT)
+    return friend_ids
+
+
+def friends_of_many(profile_ids):
+    """Друзья нескольких профилей: {id профиля: кортеж id друзей} (одно обращение к кэшу)"""
+    keys = {_friend_ids_key(profile_id): profile_id for profile_id in profile_ids}
+    cached = cache.get_many(keys)
+
+    result = {keys[key]: friend_ids for key, friend_ids in cached.items()}
+    missing = {}
+    for profile_id in profile_ids:
+        if profile_id not in result:
+            result[profile_id] = missing[_friend_ids_key(profile_id)] = _load_friend_ids(profile_id)
+    if missing:
+        cache.set_many(missing, FRIEND_IDS_TIMEOUT)
+    return result
+
+
+def are_friends(profile_id, other_id):
+    """Являются ли профили друзьями (бинарный поиск по кортежу друзей)"""
+    if profile_id is None or other_id is None or profile_id == other_id:
+        return False
+    friend_ids = friends_of(profile_id)
+    position = bisect.bisect_left(friend_ids, other_id)
+    return position < len(friend_ids) and friend_ids[position] == other_id
+
+
+def mutual_friends(profile_id, other_id):
+    """Отсортированный список id общих друзей двух профилей"""
+    friends = friends_of_many([profile_id, other_id])
+    return sorted(set(friends[profile_id]).intersection(friends[other_id]))
+
+
+def invalidate(*profile_ids):
+    """Сбрасывает кортежи друзей профилей.
+    Сброс повторяется после коммита: иначе параллельный запрос мог бы успеть
+    закэшировать состояние до завершения транзакции"""
+    keys = [_friend_ids_key(profile_id) for profile_id in profile_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,105 @@
+"""Справочники (статусы дружбы, статусы участников групп, уровни приватности).
+
+Справочники почти не меняются, а нужны почти в каждом запросе дружбы и групп, поэтому
+соответствие "имя -> id" хранится в памяти процесса и загружается одним запросом при первом
+обращении. Фильтры строятся по id (status_id=...) без соединения с таблицей справочника.
+
+Сигналы сохранения/удаления сбрасывают справочник в своем процессе, другие процессы узнают
+об изменении по версии пространства имен и перечитывают справочник не чаще, чем раз
+в LOOKUP_MAX_AGE секунд.
+"""
+
+import threading
+import time
+
+from .caching import bump_namespace, get_namespace_version
+from .models import FriendshipStatus, PrivacyLevel, Status
+
+
+# Как долго процесс может работать со справочником, устаревшим из-за изменений в другом процессе
+LOOKUP_MAX_AGE = 60
+
+# Статусы дружбы (FriendshipStatus.name)
+FRIENDSHIP_REQUESTED = "Отправлен запрос"
+FRIENDSHIP_FRIENDS = "Друзья"
+FRIENDSHIP_BLOCKED = "Заблокирован"
+
+# Статусы участников групп (Status.name)
+GROUP_USER = Status.USER
+GROUP_ADMIN = Status.ADMIN
+
+# Уровни приватности профиля (PrivacyLevel.name), PRIVACY_DEFAULT - у нового профиля
+PRIVACY_DEFAULT = "All"
+PRIVACY_FRIENDS_ONLY = "Только друзья"
+PRIVACY_NOBODY = "Никто"
+
+
+class LookupRegistry:
+    '''
+    Соответствие "имя -> id" строк таблицы-справочника.
+    Общее для процесса, сбрасывается сигналами сохранения/удаления строк справочника.
+    '''
+
+    def __init__(self, model, namespace, max_age=LOOKUP_MAX_AGE):
+        self.model = model
+        self.namespace = namespace
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._ids = None
+        self._version = None
+        self._loaded_at = 0
+
+    def _is_stale(self):
+        if self._ids is None:
+            return True
+        if time.monotonic() - self._loaded_at < self.max_age:
+            return False
+        if get_namespace_version(self.namespace) != self._version:
+            return True
+        # справочник не менялся - следующая проверка версии не раньше, чем через max_age
+        self._loaded_at = time.monotonic()
+        return False
+
+    def _load(self):
+        version = get_namespace_version(self.namespace)
+        ids = dict(self.model.objects.values_list("name", "id"))
+        with self._lock:
+            self._ids = ids
+            self._version = version
+            self._loaded_at = time.monotonic()
+        return ids
+
+    def get(self, name):
+        """id строки справочника по имени или None, если такой строки нет"""
+        ids = self._ids
+        if ids is None or self._is_stale():
+            ids = self._load()
+        return ids.get(name)
+
+    def id(self, name):
+        """id строки справочника по имени (DoesNotExist, если такой строки нет)"""
+        lookup_id = self.get(name)
+        if lookup_id is None:
+            raise self.model.DoesNotExist(f'{self.model.__name__} "{name}" не найден')
+        return lookup_id
+
+    def invalidate(self):
+        """Сбрасывает справочник в этом процессе и сообщает об изменении остальным"""
+        with self._lock:
+            self._ids = None
+        bump_namespace(self.namespace)
+
+
+friendship_statuses = LookupRegistry(FriendshipStatus, "lookup_friendship_status")
+group_statuses = LookupRegistry(Status, "lookup_group_status")
+privacy_levels = LookupRegistry(PrivacyLevel, "lookup_privacy_level")
+
+
+def friendship_status_id(name):
+    """id статуса дружбы по имени (FRIENDSHIP_REQUESTED, FRIENDSHIP_FRIENDS, FRIENDSHIP_BLOCKED)"""
+    return friendship_statuses.id(name)
+
+
+def group_status_id(name):
+    """id статуса участника группы по имени (GROUP_USER, GROUP_ADMIN)"""
+    return group_statuses.id(name)
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    '''
+    Нагрузочный тест рассылки в комнаты чата через слой каналов.
+    Создает комнаты с подписчиками, рассылает в них сообщения через group_send
+    и считает, сколько доставок дошло и с какой скоростью.
+    '''
+
+    help = "Замер скорости рассылки сообщений в комнаты чата через слой каналов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            default=settings.CHANNEL_LAYER_BACKEND,
+            help="Слой каналов: memory, redis, redis_pubsub или путь к классу слоя",
+        )
+        parser.add_argument("--groups", type=int, default=10, help="Количество комнат")
+        parser.add_argument("--members", type=int, default=20, help="Подписчиков в комнате")
+        parser.add_argument("--messages", type=int, default=50, help="Сообщений в каждую комнату")
+        parser.add_argument("--timeout", type=float, default=10, help="Сколько ждать доставки, сек")
+
+    def handle(self, *args, **options):
+        config = settings.CHANNEL_LAYER_BACKENDS.get(
+            options["backend"], {"BACKEND": options["backend"]}
+        )
+        try:
+            layer = import_string(config["BACKEND"])(**config.get("CONFIG", {}))
+        except ImportError as e:
+            raise CommandError(f"Не удалось загрузить слой каналов: {e}")
+
+        result = asyncio.run(
+            self.run(
+                layer,
+                options["groups"],
+                options["members"],
+                options["messages"],
+                options["timeout"],
+            )
+        )
+
+        expected = options["groups"] * options["members"] * options["messages"]
+        sent = options["groups"] * options["messages"]
+        self.stdout.write(f"Слой каналов: {config['BACKEND']}")
+        self.stdout.write(f"Отправлено: {sent}, доставлено: {result['delivered']} из {expected}")
+        self.stdout.write(f"Время рассылки: {result['send_time']:.3f} сек ({sent / max(result['send_time'], 1e-9):.0f} group_send/сек)")
+        self.stdout.write(f"Время доставки: {result['total_time']:.3f} сек ({result['delivered'] / max(result['total_time'], 1e-9):.0f} доставок/сек)")
+
+    async def run(self, layer, groups, members, messages, timeout):
+        channels = {}
+        for group_index in range(groups):
+            group = f"chat_bench_{group_index}"
+            channels[group] = []
+            for _ in range(members):
+                channel = await layer.new_channel()
+                await layer.group_add(group, channel)
+                channels[group].append(channel)
+
+        delivered = 0
+
+        async def receiver(channel):
+            # каждый подписчик читает свои сообщения, пока не получит все или не выйдет время
+            nonlocal delivered
+            for _ in range(messages):
+                await layer.receive(channel)
+                delivered += 1
+
+        receivers = [
+            asyncio.ensure_future(receiver(channel))
+            for group_channels in channels.values()
+            for channel in group_channels
+        ]
+
+        start = time.perf_counter()
+        for number in range(messages):
+            for group in channels:
+                await layer.group_send(
+                    group, {"type": "chat_message", "message": f"bench {number}"}
+                )
+        send_time = time.perf_counter() - start
+
+        done, pending = await asyncio.wait(receivers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        total_time = time.perf_counter() - start
+
+        for group, group_channels in channels.items():
+            for channel in group_channels:
+                await layer.group_discard(group, channel)
+
+        return {"delivered": delivered, "send_time": send_time, "total_time": total_time}
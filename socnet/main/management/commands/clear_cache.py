@@ -0,0 +1,31 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from main.caching import bump_namespace
+
+
+class Command(BaseCommand):
+    '''
+    Ручной сброс кэша (раньше кэш очищался при каждом старте сервера).
+    Без аргументов очищает весь кэш, с --namespace - только указанные пространства имен.
+    '''
+
+    help = "Очистка кэша целиком или по пространствам имен"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--namespace",
+            action="append",
+            default=[],
+            help="Пространство имен для инвалидации (news_filter, group_filter, profile_list). Можно указать несколько раз",
+        )
+
+    def handle(self, *args, **options):
+        if options["namespace"]:
+            for namespace in options["namespace"]:
+                bump_namespace(namespace)
+                self.stdout.write(f"Пространство имен {namespace} инвалидировано")
+            return
+
+        cache.clear()
+        self.stdout.write("Кэш очищен")
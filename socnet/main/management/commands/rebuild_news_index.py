@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from main import search
+
+
+class Command(BaseCommand):
+    '''
+    Пересборка полнотекстового индекса новостей: имена тэгов в News.tag_names
+    и таблица FTS5 на SQLite. На PostgreSQL GIN-индекс по колонкам обновляет сама СУБД.
+    '''
+
+    help = "Пересборка поискового индекса новостей"
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        self.stdout.write(f"Проиндексировано новостей: {indexed}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from main import timeline
+from main.models import Profile
+
+
+class Command(BaseCommand):
+    '''
+    Пересборка материализованных лент друзей (TimelineEntry) по текущим дружбам.
+    Нужна для исправления расхождений (ленты существующих дружб заполняет миграция 0030).
+    '''
+
+    help = "Пересборка лент новостей друзей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            type=int,
+            action="append",
+            default=[],
+            help="id профиля (можно указать несколько раз). По умолчанию - все профили",
+        )
+
+    def handle(self, *args, **options):
+        profile_ids = options["profile"] or Profile.objects.order_by("id").values_list(
+            "id", flat=True
+        ).iterator()
+
+        rebuilt = 0
+        entries = 0
+        for profile_id in profile_ids:
+            entries += timeline.rebuild(profile_id)
+            rebuilt += 1
+
+        self.stdout.write(f"Пересобрано лент: {rebuilt}, записей: {entries}")
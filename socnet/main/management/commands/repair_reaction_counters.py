@@ -0,0 +1,58 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from main.models import News, Reaction
+
+
+class Command(BaseCommand):
+    '''
+    Пересчет денормализованных счетчиков реакций News.like_count/dislike_count
+    по таблице Reaction. Выполняется одним UPDATE с подзапросами, без выгрузки новостей в память.
+    '''
+
+    help = "Пересчет счетчиков лайков и дизлайков новостей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать количество новостей с расхождениями",
+        )
+
+    def handle(self, *args, **options):
+        content_type = ContentType.objects.get_for_model(News)
+
+        counts = {
+            field: Coalesce(
+                Subquery(
+                    Reaction.objects.filter(
+                        content_type=content_type,
+                        object_id=OuterRef("pk"),
+                        reaction_type=reaction_type,
+                    )
+                    .order_by()
+                    .values("object_id")
+                    .annotate(total=Count("id"))
+                    .values("total")
+                ),
+                0,
+            )
+            for reaction_type, field in Reaction.COUNTER_FIELDS.items()
+        }
+
+        broken = (
+            News.objects.annotate(
+                actual_likes=counts["like_count"], actual_dislikes=counts["dislike_count"]
+            )
+            .exclude(like_count=F("actual_likes"), dislike_count=F("actual_dislikes"))
+            .count()
+        )
+        self.stdout.write(f"Новостей с неверными счетчиками: {broken}")
+
+        if options["dry_run"] or not broken:
+            return
+
+        updated = News.objects.update(**counts)
+        self.stdout.write(f"Счетчики пересчитаны для {updated} новостей")
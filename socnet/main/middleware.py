@@ -1,5 +1,4 @@
-from django.utils import timezone
-from .models import StatusProfile
+from .presence import record_heartbeat
 
 
 class UserActivityMiddleware:
@@ -10,11 +9,8 @@ class UserActivityMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
-
-            status_profile = StatusProfile.objects.get(profile=request.user.profile)
-            status_profile.is_online = True
-            status_profile.last_updated = timezone.now()
-            status_profile.save()
+            # Активность пишется в БД не на каждый запрос, а раз в PRESENCE_PERSIST_INTERVAL
+            record_heartbeat(request.user.id)
 
         response = self.get_response(request)
         return response
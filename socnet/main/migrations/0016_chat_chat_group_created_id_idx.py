@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_notification_norest_activitylog_norest'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='chat_group_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_chat_chat_group_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivechat',
+            name='messages',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_archivechat_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedmail',
+            name='original_id',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedmail',
+            name='original_parent_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_reaction_counters(apps, schema_editor):
+    # Заполняем счетчики по уже существующим реакциям
+    News = apps.get_model("main", "News")
+    Reaction = apps.get_model("main", "Reaction")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+
+    content_type = ContentType.objects.filter(app_label="main", model="news").first()
+    if content_type is None:
+        return
+
+    def count(reaction_type):
+        return Coalesce(
+            Subquery(
+                Reaction.objects.filter(
+                    content_type=content_type,
+                    object_id=OuterRef("pk"),
+                    reaction_type=reaction_type,
+                )
+                .order_by()
+                .values("object_id")
+                .annotate(total=Count("id"))
+                .values("total")
+            ),
+            0,
+        )
+
+    News.objects.update(like_count=count("like"), dislike_count=count("dislike"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('main', '0018_archivedmail_original_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['content_type', 'object_id'], name='reaction_object_idx'),
+        ),
+        migrations.RunPython(fill_reaction_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_news_reaction_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['created_at', 'id'], name='news_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['profile', 'created_at', 'id'], name='news_profile_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['news', 'created_at', 'id'], name='comment_news_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:10
+
+from django.db import migrations
+
+# Имена продублированы из main/search.py: миграция не должна зависеть от текущего кода приложения
+SEARCH_TABLE = "main_news_search"
+PG_INDEX = "news_search_vector_idx"
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON main_news USING GIN "
+            "(to_tsvector('russian', coalesce(title, '') || ' ' || coalesce(content, '')))"
+        )
+        return
+
+    if vendor != "sqlite":
+        # На остальных СУБД поиск работает через icontains
+        return
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        "USING fts5(title, content, tags, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+    # Индексируем уже существующие новости
+    News = apps.get_model("main", "News")
+    tags = {}
+    for news_id, name in News.tags.through.objects.values_list("news_id", "tag__name"):
+        tags.setdefault(news_id, []).append(name)
+
+    rows = [
+        (news_id, title, content, " ".join(tags.get(news_id, [])))
+        for news_id, title, content in News.objects.values_list("id", "title", "content")
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+    elif vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_comment_news_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
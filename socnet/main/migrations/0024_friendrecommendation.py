@@ -0,0 +1,33 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_news_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('mutual_friends', models.PositiveIntegerField(default=0)),
+                ('common_interests', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_recommendations', to='main.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', '-score'], name='recommendation_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='friendrecommendation',
+            constraint=models.UniqueConstraint(fields=('profile', 'candidate'), name='recommendation_profile_candidate_uniq'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_friendrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('common_interests', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_profiles', to='main.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', '-score'], name='similarity_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='profilesimilarity',
+            constraint=models.UniqueConstraint(fields=('profile', 'neighbor'), name='similarity_profile_neighbor_uniq'),
+        ),
+    ]
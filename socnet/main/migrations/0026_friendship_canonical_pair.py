@@ -0,0 +1,68 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+FORWARD, BACKWARD, MUTUAL = 1, 2, 3
+
+# При нескольких строках на пару остается самая "сильная" связь
+STATUS_PRIORITY = {"Заблокирован": 3, "Друзья": 2, "Отправлен запрос": 1}
+
+
+def fill_pairs_and_dedupe(apps, schema_editor):
+    Friendship = apps.get_model("main", "Friendship")
+
+    pairs = {}
+    for friendship in Friendship.objects.select_related("status").order_by("id"):
+        if friendship.profile_one_id is None or friendship.profile_two_id is None:
+            # участник удален (SET_NULL) - пара не заполняется
+            continue
+        low, high = sorted((friendship.profile_one_id, friendship.profile_two_id))
+        pairs.setdefault((low, high), []).append(friendship)
+
+    for (low, high), rows in pairs.items():
+        # самый высокий приоритет, при равном - самая ранняя строка
+        rows.sort(key=lambda row: (-STATUS_PRIORITY.get(row.status.name, 0), row.id))
+        keep = rows[0]
+
+        direction = FORWARD if keep.profile_one_id == low else BACKWARD
+        if keep.status.name == "Заблокирован" and any(
+            row.status.name == "Заблокирован" and row.profile_one_id != keep.profile_one_id
+            for row in rows[1:]
+        ):
+            # пользователи заблокировали друг друга
+            direction = MUTUAL
+
+        Friendship.objects.filter(id__in=[row.id for row in rows[1:]]).delete()
+        Friendship.objects.filter(id=keep.id).update(
+            pair_low=low, pair_high=high, direction=direction
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_profilesimilarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='friendship',
+            name='direction',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'От меньшего id к большему'), (2, 'От большего id к меньшему'), (3, 'Взаимно')], default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='pair_high',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='pair_low',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_pairs_and_dedupe, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('pair_low', 'pair_high'), name='friendship_pair_uniq'),
+        ),
+    ]
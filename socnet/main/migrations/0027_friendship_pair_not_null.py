@@ -0,0 +1,63 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FORWARD, BACKWARD = 1, 2
+
+
+def drop_orphans_and_fill_pairs(apps, schema_editor):
+    Friendship = apps.get_model("main", "Friendship")
+
+    # Связи, участник которых удален (раньше профили обнулялись через SET_NULL)
+    Friendship.objects.filter(
+        models.Q(profile_one__isnull=True) | models.Q(profile_two__isnull=True)
+    ).delete()
+
+    # Строки, записанные в обход save() (update/bulk_create) после 0026
+    taken = set(
+        Friendship.objects.filter(pair_low__isnull=False).values_list("pair_low", "pair_high")
+    )
+    for friendship in Friendship.objects.filter(pair_low__isnull=True).order_by("id"):
+        low, high = sorted((friendship.profile_one_id, friendship.profile_two_id))
+        if (low, high) in taken:
+            # у пары уже есть строка - лишняя удаляется
+            friendship.delete()
+            continue
+        taken.add((low, high))
+        Friendship.objects.filter(id=friendship.id).update(
+            pair_low=low,
+            pair_high=high,
+            direction=FORWARD if friendship.profile_one_id == low else BACKWARD,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_friendship_canonical_pair'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_orphans_and_fill_pairs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='friendship',
+            name='pair_high',
+            field=models.BigIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='pair_low',
+            field=models.BigIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='profile_one',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='friendships_initiated', to='main.profile'),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='profile_two',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='friendships_received', to='main.profile'),
+        ),
+    ]
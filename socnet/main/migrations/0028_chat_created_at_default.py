@@ -0,0 +1,19 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0027_friendship_pair_not_null'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chat',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
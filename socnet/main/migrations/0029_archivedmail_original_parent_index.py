@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0028_chat_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedmail',
+            name='original_parent_id',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:40
+
+from django.conf import settings
+from django.db import migrations
+
+# Статус дружбы (FriendshipStatus.name), по которому новости попадают в ленту
+FRIENDS_STATUS = "Друзья"
+
+BATCH_SIZE = 1000
+
+
+def backfill_timelines(apps, schema_editor):
+    # Ленты заполнялись только новыми новостями и новыми дружбами - добавляем в них
+    # последние TIMELINE_MAX_ENTRIES новостей уже существующих друзей
+    Friendship = apps.get_model("main", "Friendship")
+    News = apps.get_model("main", "News")
+    TimelineEntry = apps.get_model("main", "TimelineEntry")
+
+    friends = {}
+    for profile_one_id, profile_two_id in Friendship.objects.filter(
+        status__name=FRIENDS_STATUS
+    ).values_list("profile_one_id", "profile_two_id"):
+        friends.setdefault(profile_one_id, set()).add(profile_two_id)
+        friends.setdefault(profile_two_id, set()).add(profile_one_id)
+
+    for owner_id in sorted(friends):
+        rows = (
+            News.objects.filter(profile_id__in=friends[owner_id])
+            .order_by("-created_at", "-id")
+            .values_list("id", "profile_id", "created_at")[: settings.TIMELINE_MAX_ENTRIES]
+        )
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    owner_id=owner_id, news_id=news_id, author_id=author_id, created_at=created_at
+                )
+                for news_id, author_id, created_at in rows
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_archivedmail_original_parent_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.13 on 2026-10-18 18:40
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# Имена и выражение продублированы из main/search.py: миграция не должна зависеть от текущего кода приложения
+PG_CONFIG = "russian"
+PG_INDEX = "news_search_vector_idx"
+
+
+def search_vector_index():
+    # Индекс должен совпадать с выражением search.news_search_vector(), иначе планировщик его не использует
+    return GinIndex(
+        SearchVector("title", weight="A", config=PG_CONFIG)
+        + SearchVector("tag_names", weight="B", config=PG_CONFIG)
+        + SearchVector("content", weight="C", config=PG_CONFIG),
+        name=PG_INDEX,
+    )
+
+
+def fill_tag_names(apps, schema_editor):
+    News = apps.get_model("main", "News")
+    tags = {}
+    for news_id, name in News.tags.through.objects.values_list("news_id", "tag__name"):
+        tags.setdefault(news_id, []).append(name)
+
+    News.objects.bulk_update(
+        [News(id=news_id, tag_names=" ".join(names)) for news_id, names in tags.items()],
+        ["tag_names"],
+        batch_size=1000,
+    )
+
+
+def create_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    # Старый индекс из миграции 0023 не учитывал тэги и веса колонок
+    schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+    schema_editor.add_index(apps.get_model("main", "News"), search_vector_index())
+
+
+def drop_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+    schema_editor.execute(
+        f"CREATE INDEX {PG_INDEX} ON main_news USING GIN "
+        "(to_tsvector('russian', coalesce(title, '') || ' ' || coalesce(content, '')))"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_backfill_timelines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='tag_names',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_tag_names, migrations.RunPython.noop),
+        migrations.RunPython(create_vector_index, drop_vector_index),
+    ]
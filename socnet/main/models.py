@@ -1,8 +1,8 @@
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 
 
@@ -49,7 +49,11 @@ class Interest(models.Model):
 
 
 def get_default_privacy_level():
-    return PrivacyLevel.objects.get(id=1)
+    # Для ForeignKey достаточно id; он берется из справочника в памяти процесса,
+    # поэтому создание Profile не делает запрос (импорт здесь - lookups импортирует модели)
+    from .lookups import PRIVACY_DEFAULT, privacy_levels
+
+    return privacy_levels.id(PRIVACY_DEFAULT)
 
 
 class Profile(models.Model):
@@ -81,13 +85,10 @@ class Profile(models.Model):
         return f"{self.firstname} {self.lastname}"
 
     def is_friend_with(self, other_profile):
-        return Friendship.objects.filter(
-            (
-                Q(profile_one=self, profile_two=other_profile)
-                | Q(profile_one=other_profile, profile_two=self)
-            ),
-            status="friends",
-        ).exists()
+        # импорт здесь, так как friend_graph сам импортирует модели
+        from .friend_graph import are_friends
+
+        return are_friends(self.id, other_profile.id)
 
 
 class Mediafile(models.Model):
@@ -120,24 +121,169 @@ class FriendshipStatus(models.Model):
         return self.name
 
 
+def _profile_id(profile):
+    # хелперы дружбы принимают и профиль, и его id
+    return getattr(profile, "id", profile)
+
+
+def pair_q(profile, other):
+    """Условие на строку связи двух профилей (для объединения с другими условиями через |)"""
+    low, high = sorted((_profile_id(profile), _profile_id(other)))
+    return models.Q(pair_low=low, pair_high=high)
+
+
+class FriendshipQuerySet(models.QuerySet):
+    '''
+    Запросы к дружбе по паре профилей.
+    Пара хранится упорядоченной (pair_low, pair_high), поэтому поиск связи между двумя
+    профилями - одна проверка уникального индекса вместо OR по profile_one/profile_two.
+    Массовые операции, которые обходят save(), тоже поддерживают пару: bulk_create
+    и bulk_update заполняют ее, а update() участников или пары запрещен.
+    Фикстуры (loaddata) сохраняются без save(), поэтому должны содержать pair_low/pair_high.
+    '''
+
+    # Поля, из которых вычисляется пара, и сама пара
+    PAIR_FIELDS = {
+        "profile_one", "profile_one_id", "profile_two", "profile_two_id",
+        "pair_low", "pair_high", "direction",
+    }
+
+    def update(self, **kwargs):
+        # bulk_update передает пару вместе с участниками, поэтому проходит проверку
+        pair_given = {"pair_low", "pair_high", "direction"} <= kwargs.keys()
+        if self.PAIR_FIELDS.intersection(kwargs) and not pair_given:
+            raise ValueError(
+                "Участников дружбы нельзя менять через update(): пара профилей "
+                "вычисляется в save() (используйте save() или bulk_update())"
+            )
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for friendship in objs:
+            friendship.fill_pair()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if self.PAIR_FIELDS.intersection(fields):
+            for friendship in objs:
+                friendship.fill_pair()
+            fields += [name for name in ("pair_low", "pair_high", "direction") if name not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def between(self, profile, other):
+        """Связь между двумя профилями (не больше одной строки)"""
+        return self.filter(pair_q(profile, other))
+
+    def block(self, blocker, target):
+        """Блокировка target профилем blocker. Заменяет дружбу или заявку, если они были"""
+        from .lookups import FRIENDSHIP_BLOCKED, friendship_status_id
+
+        blocked_id = friendship_status_id(FRIENDSHIP_BLOCKED)
+        with transaction.atomic():
+            pair = self.between(blocker, target).select_for_update().first()
+            if pair is None:
+                return self.create(profile_one=blocker, profile_two=target, status_id=blocked_id)
+
+            if pair.status_id == blocked_id:
+                if not pair.is_blocked_by(blocker):
+                    # встречная блокировка: теперь пара заблокирована обеими сторонами
+                    pair.direction = Friendship.MUTUAL
+                    pair.save()
+                return pair
+
+            pair.profile_one_id = _profile_id(blocker)
+            pair.profile_two_id = _profile_id(target)
+            pair.status_id = blocked_id
+            pair.save()
+            return pair
+
+    def unblock(self, blocker, target):
+        """Снимает блокировку target профилем blocker. Возвращает False, если ее не было"""
+        from .lookups import FRIENDSHIP_BLOCKED, friendship_status_id
+
+        with transaction.atomic():
+            pair = (
+                self.between(blocker, target)
+                .filter(status_id=friendship_status_id(FRIENDSHIP_BLOCKED))
+                .select_for_update()
+                .first()
+            )
+            if pair is None or not pair.is_blocked_by(blocker):
+                return False
+
+            if pair.direction == Friendship.MUTUAL:
+                # остается блокировка со стороны target
+                pair.profile_one_id = _profile_id(target)
+                pair.profile_two_id = _profile_id(blocker)
+                pair.direction = None
+                pair.save()
+            else:
+                pair.delete()
+            return True
+
+
 class Friendship(models.Model):
-    ''' Таблица дружбы'''
+    ''' Таблица дружбы.
+    profile_one - инициатор (отправил запрос или заблокировал), profile_two - второй участник.
+    pair_low/pair_high - те же id в порядке возрастания, по ним одна строка на пару профилей'''
+
+    # Направление связи относительно упорядоченной пары
+    FORWARD = 1  # инициатор - pair_low
+    BACKWARD = 2  # инициатор - pair_high
+    MUTUAL = 3  # блокировка с обеих сторон
+    DIRECTION_CHOICES = [
+        (FORWARD, "От меньшего id к большему"),
+        (BACKWARD, "От большего id к меньшему"),
+        (MUTUAL, "Взаимно"),
+    ]
 
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.ForeignKey(FriendshipStatus, on_delete=models.CASCADE)
     description = models.TextField(blank=True, null=True)
+    # Связь без одного из участников бессмысленна: при удалении профиля она удаляется
     profile_one = models.ForeignKey(
         Profile,
-        on_delete=models.SET_NULL,
+        on_delete=models.CASCADE,
         null=True,
         related_name="friendships_initiated",
     )
     profile_two = models.ForeignKey(
         Profile,
-        on_delete=models.SET_NULL,
+        on_delete=models.CASCADE,
         null=True,
         related_name="friendships_received",
     )
+    # Упорядоченная пара и направление заполняются в save() из profile_one/profile_two
+    pair_low = models.BigIntegerField(editable=False)
+    pair_high = models.BigIntegerField(editable=False)
+    direction = models.PositiveSmallIntegerField(
+        choices=DIRECTION_CHOICES, default=FORWARD, editable=False
+    )
+
+    objects = FriendshipQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["pair_low", "pair_high"], name="friendship_pair_uniq")
+        ]
+
+    def fill_pair(self):
+        """Заполняет упорядоченную пару и направление по profile_one/profile_two"""
+        if self.profile_one_id is not None and self.profile_two_id is not None:
+            self.pair_low, self.pair_high = sorted((self.profile_one_id, self.profile_two_id))
+            if self.direction != self.MUTUAL:
+                self.direction = self.FORWARD if self.profile_one_id == self.pair_low else self.BACKWARD
+
+    def save(self, *args, **kwargs):
+        self.fill_pair()
+        super().save(*args, **kwargs)
+
+    def is_blocked_by(self, profile):
+        """Заблокировал ли profile второго участника (статус должен быть "Заблокирован")"""
+        return self.direction == self.MUTUAL or self.profile_one_id == _profile_id(profile)
 
 
 class Mail(models.Model):
@@ -232,11 +378,109 @@ class News(models.Model):
         Profile, related_name="news_posts", on_delete=models.CASCADE
     )
     tags = models.ManyToManyField(Tag, related_name="news_posts", blank=True)
+    # Имена тэгов через пробел для полнотекстового поиска (обновляются сигналами, main/search.py)
+    tag_names = models.TextField(blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Денормализованные счетчики реакций (обновляются в reaction_toggle,
+    # пересчитываются командой repair_reaction_counters)
+    like_count = models.PositiveIntegerField(default=0)
+    dislike_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # курсорная пагинация ленты по (created_at, id): общая лента и новости автора
+            models.Index(fields=["created_at", "id"], name="news_created_id_idx"),
+            models.Index(fields=["profile", "created_at", "id"], name="news_profile_created_id_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def score(self):
+        """Рейтинг новости: лайки минус дизлайки"""
+        return self.like_count - self.dislike_count
+
+
+class TimelineEntry(models.Model):
+    ''' Материализованная лента новостей друзей (fan-out on write)'''
+
+    owner = models.ForeignKey(
+        Profile, related_name="timeline", on_delete=models.CASCADE
+    )  # чья лента
+    news = models.ForeignKey(News, related_name="timeline_entries", on_delete=models.CASCADE)
+    author = models.ForeignKey(
+        Profile, related_name="+", on_delete=models.CASCADE
+    )  # автор новости (нужен, чтобы убирать записи при удалении из друзей)
+    created_at = models.DateTimeField()  # дата новости, копия News.created_at
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "news"], name="timeline_owner_news_uniq")
+        ]
+        indexes = [
+            # чтение ленты - один диапазонный проход по (owner, created_at, news)
+            models.Index(
+                fields=["owner", "created_at", "news"], name="timeline_owner_created_idx"
+            ),
+            models.Index(fields=["owner", "author"], name="timeline_owner_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"Новость {self.news_id} в ленте {self.owner_id}"
+
+
+class FriendRecommendation(models.Model):
+    ''' Предрасчитанные рекомендации друзей (заполняются задачей refresh_friend_recommendations)'''
+
+    profile = models.ForeignKey(
+        Profile, related_name="friend_recommendations", on_delete=models.CASCADE
+    )  # кому рекомендуем
+    candidate = models.ForeignKey(Profile, related_name="+", on_delete=models.CASCADE)
+    score = models.FloatField()
+    mutual_friends = models.PositiveIntegerField(default=0)
+    common_interests = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["profile", "candidate"], name="recommendation_profile_candidate_uniq"
+            )
+        ]
+        indexes = [
+            # выдача рекомендаций - один проход по (profile, score)
+            models.Index(fields=["profile", "-score"], name="recommendation_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate_id} для {self.profile_id}: {self.score}"
+
+
+class ProfileSimilarity(models.Model):
+    ''' Ближайшие по интересам профили (заполняются задачей refresh_profile_similarity)'''
+
+    profile = models.ForeignKey(
+        Profile, related_name="similar_profiles", on_delete=models.CASCADE
+    )
+    neighbor = models.ForeignKey(Profile, related_name="+", on_delete=models.CASCADE)
+    score = models.FloatField()  # коэффициент Жаккара по интересам
+    common_interests = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["profile", "neighbor"], name="similarity_profile_neighbor_uniq"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["profile", "-score"], name="similarity_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.neighbor_id} похож на {self.profile_id}: {self.score}"
+
 
 class Comment(models.Model):
     ''' Таблица комментариев'''
@@ -256,6 +500,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ["created_at"]  # Сортировка комментариев по дате создания
+        indexes = [
+            # загрузка дерева и догрузка новых комментариев новости по курсору (created_at, id)
+            models.Index(fields=["news", "created_at", "id"], name="comment_news_created_id_idx"),
+        ]
 
     def is_parent(self):
         """Проверяет, является ли комментарий родительским."""
@@ -283,8 +531,17 @@ class Reaction(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey("content_type", "object_id")
 
+    # Поле счетчика в News для каждого типа реакции
+    COUNTER_FIELDS = {
+        LIKE: "like_count",
+        DISLIKE: "dislike_count",
+    }
+
     class Meta:
         unique_together = ("profile", "content_type", "object_id", "reaction_type")
+        indexes = [
+            models.Index(fields=["content_type", "object_id"], name="reaction_object_idx"),
+        ]
 
 
 class StatusProfile(models.Model):
@@ -300,7 +557,9 @@ class StatusProfile(models.Model):
 class Chat(models.Model):
     ''' Таблица для чата'''
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default вместо auto_now_add: буфер отложенной записи передает время отправки сообщения,
+    # а auto_now_add перезаписал бы его временем сброса пачки
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     messages = models.TextField()
     profile = models.ForeignKey(
         Profile, related_name="chat_message", on_delete=models.CASCADE
@@ -309,6 +568,14 @@ class Chat(models.Model):
         Group, related_name="chat_members", on_delete=models.CASCADE
     )
 
+    class Meta:
+        # индекс под постраничную загрузку истории комнаты по курсору (created_at, id)
+        indexes = [
+            models.Index(
+                fields=["group", "created_at", "id"], name="chat_group_created_id_idx"
+            )
+        ]
+
     def __str__(self):
         return f"Сообщение от {self.profile} от {self.created_at} "
 
@@ -424,6 +691,9 @@ class ArchivedMail(models.Model):
     is_read = models.BooleanField(default=False)
     is_deleted_sender = models.BooleanField(default=False)
     archived_at = models.DateTimeField(auto_now_add=True)
+    # id письма и его родителя в таблице Mail (по ним восстанавливается parent в архиве)
+    original_id = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    original_parent_id = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
 
 
 class ArchiveChat(models.Model):
@@ -435,5 +705,6 @@ class ArchiveChat(models.Model):
     group = models.ForeignKey(
         Group, related_name="archived_chat_members", on_delete=models.CASCADE
     )
+    messages = models.TextField(blank=True, default="")
     created_at = models.DateTimeField()
     archived_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,43 @@
+"""Утилиты для курсорной (keyset) пагинации по паре (created_at, id)"""
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(created_at, pk):
+    """Кодирует позицию (created_at, id) в непрозрачную строку курсора"""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Разбирает строку курсора. Для некорректного курсора возвращает None"""
+    if not cursor or not isinstance(cursor, str):
+        # курсор приходит и из websocket, где это может быть любое значение JSON
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def keyset_before(queryset, cursor, field="created_at", id_field="id"):
+    """Оставляет строки, идущие после курсора при сортировке (-created_at, -id)"""
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(**{f"{field}__lt": created_at})
+        | Q(**{field: created_at, f"{id_field}__lt": pk})
+    )
+
+
+def keyset_after(queryset, cursor, field="created_at", id_field="id"):
+    """Оставляет строки, идущие после курсора при сортировке (created_at, id)"""
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(**{f"{field}__gt": created_at})
+        | Q(**{field: created_at, f"{id_field}__gt": pk})
+    )
@@ -0,0 +1,25 @@
+"""Учет присутствия пользователей (онлайн/офлайн) с отложенной записью в БД"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import StatusProfile
+
+
+def get_persist_interval():
+    """Как часто активность пользователя записывается в StatusProfile (сек)"""
+    # интервал должен быть заметно меньше порога офлайна, иначе активный пользователь
+    # успеет получить статус офлайн между двумя записями
+    return min(settings.PRESENCE_PERSIST_INTERVAL, settings.PRESENCE_OFFLINE_AFTER // 2)
+
+
+def record_heartbeat(user_id):
+    """Отмечает активность пользователя. В БД пишет только раз в интервал"""
+
+    # cache.add атомарна: во всех воркерах запись в БД делает только первый запрос интервала.
+    # Пока ключ жив, пользователь заведомо отмечен в БД как онлайн
+    if cache.add(f"presence_{user_id}", True, get_persist_interval()):
+        StatusProfile.objects.filter(profile__user_id=user_id).update(
+            is_online=True, last_updated=timezone.now()
+        )
@@ -0,0 +1,93 @@
+"""LRU-кэш имен профилей для чата.
+
+Кэш живет в памяти процесса. Сигналы сохранения/удаления Profile сбрасывают запись в своем
+процессе и увеличивают версию пространства имен в общем кэше; остальные процессы сверяют
+версию не чаще, чем раз в PROFILE_NAMES_MAX_AGE секунд, и при изменении очищают свой кэш.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from .caching import bump_namespace, get_namespace_version
+from .models import Profile
+
+
+# Как долго процесс может показывать имя, измененное в другом процессе
+PROFILE_NAMES_MAX_AGE = 5
+
+
+class ProfileNameCache:
+    '''
+    Общий для процесса LRU-кэш отображаемых имен профилей.
+    Ключ - id пользователя, значение - (id профиля, имя, фамилия).
+    Инвалидируется сигналами сохранения/удаления Profile, в других процессах - по версии
+    пространства имен namespace.
+    '''
+
+    def __init__(self, maxsize=10000, namespace="profile_names", max_age=PROFILE_NAMES_MAX_AGE):
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.max_age = max_age
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+
+    def _check_version(self):
+        # Имена менялись в другом процессе - кэш целиком устарел
+        now = time.monotonic()
+        if now - self._checked_at < self.max_age:
+            return
+        version = get_namespace_version(self.namespace)
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+            self._checked_at = now
+
+    def get(self, user_id):
+        self._check_version()
+        with self._lock:
+            identity = self._items.get(user_id)
+            if identity is not None:
+                self._items.move_to_end(user_id)
+            return identity
+
+    def set(self, user_id, identity):
+        with self._lock:
+            self._items[user_id] = identity
+            self._items.move_to_end(user_id)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Сбрасывает имя в этом процессе и сообщает об изменении остальным"""
+        with self._lock:
+            self._items.pop(user_id, None)
+        bump_namespace(self.namespace)
+
+    def clear(self):
+        """Очищает кэш этого процесса"""
+        with self._lock:
+            self._items.clear()
+            self._version = None
+            self._checked_at = 0
+
+
+profile_names = ProfileNameCache()
+
+
+def get_profile_identity(user_id):
+    """Возвращает (id профиля, имя, фамилия) пользователя или None, если профиля нет"""
+
+    identity = profile_names.get(user_id)
+    if identity is None:
+        identity = (
+            Profile.objects.filter(user_id=user_id)
+            .values_list("id", "firstname", "lastname")
+            .first()
+        )
+        if identity is not None:
+            profile_names.set(user_id, identity)
+    return identity
@@ -0,0 +1,252 @@
+"""Нечеткий поиск людей по имени.
+
+Индекс хранится в памяти процесса: нормализованная строка "имя фамилия логин" каждого
+профиля и обратный индекс триграмм. Поиск считает для каждого профиля число общих
+с запросом триграмм, берет PROFILE_SEARCH_CANDIDATES профилей с наибольшим совпадением
+и ранжирует их через rapidfuzz, поэтому опечатки и перестановка слов не мешают найти человека.
+
+Индекс строится при первом поиске и дальше обновляется по одной записи. Изменения
+профиля или логина записываются в журнал изменений в кэше (номер изменения + запись),
+другие процессы не чаще, чем раз в PROFILE_INDEX_MAX_AGE секунд, применяют новые
+записи журнала к своему индексу. Полная пересборка нужна, только если часть журнала
+уже вытеснена из кэша.
+"""
+
+import heapq
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from rapidfuzz import fuzz, process
+
+from .models import Profile
+
+
+# Сколько кандидатов с наибольшим числом общих триграмм передается в rapidfuzz
+PROFILE_SEARCH_CANDIDATES = 2000
+
+# Сколько результатов возвращает поиск (дальше ранжировать бессмысленно)
+PROFILE_SEARCH_MAX_RESULTS = 1000
+
+# Минимальная оценка rapidfuzz (0-100), ниже которой профиль не считается найденным
+PROFILE_SEARCH_SCORE_CUTOFF = 60
+
+# Как долго процесс может не проверять журнал изменений других процессов
+PROFILE_INDEX_MAX_AGE = 60
+
+# Ключи журнала изменений: номер последнего изменения и сами изменения
+PROFILE_INDEX_SEQ_KEY = "profile_search_seq"
+PROFILE_INDEX_CHANGE_KEY = "profile_search_change_{}"
+
+# Сколько живет запись журнала; процесс, отставший сильнее, пересобирает индекс
+PROFILE_INDEX_CHANGE_TIMEOUT = 86400
+
+# При таком отставании дешевле пересобрать индекс, чем читать журнал
+PROFILE_INDEX_MAX_REPLAY = 5000
+
+
+def normalize_name(text):
+    return " ".join((text or "").lower().replace("ё", "е").split())
+
+
+def trigrams(text):
+    """Триграммы каждого слова, дополненного пробелами (как в pg_trgm)"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def profile_search_text(firstname, lastname, username):
+    return normalize_name(f"{firstname} {lastname} {username}")
+
+
+def _current_seq():
+    return cache.get(PROFILE_INDEX_SEQ_KEY, 0)
+
+
+def _publish_change(profile_id, row):
+    # row - (id пользователя, имя, фамилия, логин) или None, если профиль удален
+    try:
+        seq = cache.incr(PROFILE_INDEX_SEQ_KEY)
+    except ValueError:
+        cache.add(PROFILE_INDEX_SEQ_KEY, 0, None)
+        seq = cache.incr(PROFILE_INDEX_SEQ_KEY)
+    cache.set(PROFILE_INDEX_CHANGE_KEY.format(seq), (profile_id, row), PROFILE_INDEX_CHANGE_TIMEOUT)
+    return seq
+
+
+class ProfileNameIndex:
+    '''
+    Триграммный индекс имен профилей для нечеткого поиска.
+    Общий для процесса, обновляется сигналами Profile и User по одной записи.
+    '''
+
+    def __init__(self, max_age=PROFILE_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._names = {}
+        self._user_profiles = {}
+        self._postings = {}
+        self._seq = None
+        self._checked_at = 0
+
+    def rebuild(self):
+        """Строит индекс заново по всем профилям"""
+        seq = _current_seq()
+        rows = {}
+        names = {}
+        user_profiles = {}
+        postings = {}
+        for profile_id, user_id, firstname, lastname, username in Profile.objects.values_list(
+            "id", "user_id", "firstname", "lastname", "user__username"
+        ).iterator():
+            text = profile_search_text(firstname, lastname, username)
+            rows[profile_id] = (user_id, firstname, lastname, username)
+            names[profile_id] = text
+            user_profiles[user_id] = profile_id
+            for gram in trigrams(text):
+                postings.setdefault(gram, set()).add(profile_id)
+
+        with self._lock:
+            self._rows = rows
+            self._names = names
+            self._user_profiles = user_profiles
+            self._postings = postings
+            self._seq = seq
+            self._checked_at = time.monotonic()
+
+    def _remove_locked(self, profile_id):
+        row = self._rows.pop(profile_id, None)
+        if row is not None and self._user_profiles.get(row[0]) == profile_id:
+            del self._user_profiles[row[0]]
+        text = self._names.pop(profile_id, None)
+        if text is None:
+            return
+        for gram in trigrams(text):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(profile_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def _apply_locked(self, profile_id, row):
+        self._remove_locked(profile_id)
+        if row is None:
+            return
+        text = profile_search_text(*row[1:])
+        self._rows[profile_id] = row
+        self._names[profile_id] = text
+        self._user_profiles[row[0]] = profile_id
+        for gram in trigrams(text):
+            self._postings.setdefault(gram, set()).add(profile_id)
+
+    def _sync(self):
+        # Применяет изменения других процессов из журнала (или пересобирает индекс)
+        if self._seq is None:
+            self.rebuild()
+            return
+        if time.monotonic() - self._checked_at < self.max_age:
+            return
+
+        seq = _current_seq()
+        if seq < self._seq or seq - self._seq > PROFILE_INDEX_MAX_REPLAY:
+            # журнал сброшен (перезапуск кэша) или процесс слишком отстал
+            self.rebuild()
+            return
+
+        keys = [PROFILE_INDEX_CHANGE_KEY.format(number) for number in range(self._seq + 1, seq + 1)]
+        changes = cache.get_many(keys) if keys else {}
+        if len(changes) != len(keys):
+            # часть журнала вытеснена - изменения не восстановить
+            self.rebuild()
+            return
+
+        with self._lock:
+            for key in keys:
+                self._apply_locked(*changes[key])
+            self._seq = seq
+            self._checked_at = time.monotonic()
+
+    def _change(self, profile_id, row):
+        with self._lock:
+            if self._seq is not None:
+                self._apply_locked(profile_id, row)
+        _publish_change(profile_id, row)
+
+    def update(self, profile_id, user_id, firstname, lastname, username=None):
+        """Добавляет или обновляет профиль в индексе.
+        username можно не передавать: тогда берется логин, уже известный индексу"""
+        if username is None:
+            row = self._rows.get(profile_id)
+            if row is not None and row[0] == user_id:
+                username = row[3]
+            else:
+                username = Profile.objects.filter(id=profile_id).values_list(
+                    "user__username", flat=True
+                ).first()
+        row = (user_id, firstname, lastname, username)
+        if self._rows.get(profile_id) == row:
+            # имя не менялось (например, сохранили возраст) - журнал не трогаем
+            return
+        self._change(profile_id, row)
+
+    def update_username(self, user_id, username):
+        """Обновляет логин пользователя в записи его профиля"""
+        profile_id = self._user_profiles.get(user_id)
+        if profile_id is not None:
+            row = self._rows[profile_id]
+            if row[3] == username:
+                return
+            self._change(profile_id, (row[0], row[1], row[2], username))
+            return
+
+        # профиль не в индексе этого процесса - данные берем из базы для журнала
+        found = Profile.objects.filter(user_id=user_id).values_list("id", "firstname", "lastname").first()
+        if found is not None:
+            profile_id, firstname, lastname = found
+            self._change(profile_id, (user_id, firstname, lastname, username))
+
+    def remove(self, profile_id):
+        """Удаляет профиль из индекса"""
+        self._change(profile_id, None)
+
+    def search(self, query, limit=PROFILE_SEARCH_MAX_RESULTS):
+        """Возвращает id профилей, похожих на запрос, от самых похожих"""
+        text = normalize_name(query)
+        if not text:
+            return []
+
+        self._sync()
+
+        with self._lock:
+            # Кандидаты - профили с наибольшим числом общих с запросом триграмм.
+            # Опечатка портит лишь несколько триграмм, остальные по-прежнему совпадают
+            overlap = Counter()
+            for gram in trigrams(text):
+                overlap.update(self._postings.get(gram, ()))
+            if not overlap:
+                return []
+
+            # при равном совпадении выше профиль с меньшим id - результат не зависит от хэшей
+            candidates = heapq.nsmallest(
+                PROFILE_SEARCH_CANDIDATES, overlap.items(), key=lambda item: (-item[1], item[0])
+            )
+            choices = {profile_id: self._names[profile_id] for profile_id, _ in candidates}
+
+        matches = process.extract(
+            text,
+            choices,
+            scorer=fuzz.WRatio,
+            score_cutoff=PROFILE_SEARCH_SCORE_CUTOFF,
+            limit=limit,
+        )
+        # при равной оценке порядок должен быть стабильным между запросами
+        matches.sort(key=lambda match: (-match[1], -overlap[match[2]], match[2]))
+        return [profile_id for _, _, profile_id in matches]
+
+
+profile_name_index = ProfileNameIndex()
@@ -0,0 +1,154 @@
+"""Рекомендации друзей: друзья друзей и общие интересы.
+
+Оценка кандидата = MUTUAL_FRIEND_WEIGHT * число общих друзей
+                 + COMMON_INTEREST_WEIGHT * число общих интересов.
+Граф дружбы и интересы загружаются в память одним проходом, затем профили
+обрабатываются пачками: для каждого считаются оценки всех кандидатов, и лучшие
+FRIEND_RECOMMENDATIONS_TOP_K сохраняются в FriendRecommendation. Выдача рекомендаций -
+чтение готовых строк по индексу (profile, score).
+"""
+
+import heapq
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .lookups import FRIENDSHIP_FRIENDS, friendship_status_id
+from .models import FriendRecommendation, Friendship, Profile
+from .similarity import get_similar_profiles, load_interests
+
+
+MUTUAL_FRIEND_WEIGHT = 1.0
+COMMON_INTEREST_WEIGHT = 0.5
+
+
+def load_graph():
+    """Граф связей одним проходом по Friendship.
+    Возвращает (друзья: {id: set}, исключения: {id: set}) - в исключения попадают
+    все профили, с которыми уже есть любая связь (дружба, заявка, блокировка)"""
+    friends_status_id = friendship_status_id(FRIENDSHIP_FRIENDS)
+    friends = {}
+    related = {}
+    for one, two, status_id in Friendship.objects.values_list(
+        "profile_one_id", "profile_two_id", "status_id"
+    ).iterator():
+        related.setdefault(one, set()).add(two)
+        related.setdefault(two, set()).add(one)
+        if status_id == friends_status_id:
+            friends.setdefault(one, set()).add(two)
+            friends.setdefault(two, set()).add(one)
+    return friends, related
+
+
+def score_candidates(profile_id, friends, related, interests, members, top_k):
+    """Лучшие кандидаты для профиля: список (оценка, кандидат, общих друзей, общих интересов)"""
+    mutual = Counter()
+    for friend_id in friends.get(profile_id, ()):
+        mutual.update(friends.get(friend_id, ()))
+
+    common = Counter()
+    for interest_id in interests.get(profile_id, ()):
+        common.update(members.get(interest_id, ()))
+
+    excluded = related.get(profile_id, set())
+    scored = (
+        (
+            MUTUAL_FRIEND_WEIGHT * mutual[candidate_id] + COMMON_INTEREST_WEIGHT * common[candidate_id],
+            candidate_id,
+            mutual[candidate_id],
+            common[candidate_id],
+        )
+        for candidate_id in mutual.keys() | common.keys()
+        if candidate_id != profile_id and candidate_id not in excluded
+    )
+    # при равной оценке выше кандидат с меньшим id - порядок стабилен между пересчетами
+    return heapq.nsmallest(top_k, scored, key=lambda row: (-row[0], row[1]))
+
+
+def refresh(profile_ids=None, batch_size=None, top_k=None):
+    """Пересчитывает рекомендации для профилей (по умолчанию - для всех).
+    Возвращает число обработанных профилей"""
+    batch_size = batch_size or settings.FRIEND_RECOMMENDATIONS_BATCH
+    top_k = top_k or settings.FRIEND_RECOMMENDATIONS_TOP_K
+
+    friends, related = load_graph()
+    interests, members = load_interests()
+
+    if profile_ids is None:
+        profile_ids = list(Profile.objects.order_by("id").values_list("id", flat=True))
+
+    for start in range(0, len(profile_ids), batch_size):
+        batch = profile_ids[start : start + batch_size]
+        rows = [
+            FriendRecommendation(
+                profile_id=profile_id,
+                candidate_id=candidate_id,
+                score=score,
+                mutual_friends=mutual_count,
+                common_interests=common_count,
+            )
+            for profile_id in batch
+            for score, candidate_id, mutual_count, common_count in score_candidates(
+                profile_id, friends, related, interests, members, top_k
+            )
+        ]
+        with transaction.atomic():
+            FriendRecommendation.objects.filter(profile_id__in=batch).delete()
+            FriendRecommendation.objects.bulk_create(rows, batch_size=1000)
+
+    return len(profile_ids)
+
+
+def forget_pair(profile_id, other_id):
+    """Убирает пару из рекомендаций друг друга (после заявки, дружбы или блокировки)"""
+    FriendRecommendation.objects.filter(
+        Q(profile_id=profile_id, candidate_id=other_id)
+        | Q(profile_id=other_id, candidate_id=profile_id)
+    ).delete()
+
+
+def _live_interest_candidates(profile, excluded_ids, limit):
+    # Профили с общими интересами одним ограниченным запросом - для профиля, у которого
+    # еще нет посчитанных соседей (например, только что зарегистрировался)
+    interest_ids = list(profile.interests.values_list("id", flat=True))
+    if not interest_ids:
+        return []
+
+    return list(
+        Profile.objects.filter(interests__in=interest_ids)
+        .exclude(id__in=excluded_ids)
+        .annotate(common_interests=Count("interests"))
+        .order_by("-common_interests", "id")[:limit]
+    )
+
+
+def _fallback_candidates(profile, limit):
+    # Для профиля, которому рекомендации еще не считались: похожие по интересам
+    # профили без уже связанных, а если соседи тоже не посчитаны - живой запрос по интересам
+    excluded_ids = set()
+    for one, two in Friendship.objects.filter(
+        Q(profile_one=profile) | Q(profile_two=profile)
+    ).values_list("profile_one_id", "profile_two_id"):
+        excluded_ids.update((one, two))
+    excluded_ids.discard(profile.id)
+
+    similar = get_similar_profiles(profile, limit, exclude_ids=excluded_ids)
+    if similar:
+        return similar
+    return _live_interest_candidates(profile, excluded_ids | {profile.id}, limit)
+
+
+def get_recommendations(profile, limit=None):
+    """Рекомендованные профили от лучших к худшим (не больше limit)"""
+    limit = min(limit or settings.FRIEND_RECOMMENDATIONS_TOP_K, settings.FRIEND_RECOMMENDATIONS_TOP_K)
+
+    recommendations = list(
+        FriendRecommendation.objects.filter(profile=profile)
+        .select_related("candidate")
+        .order_by("-score", "candidate_id")[:limit]
+    )
+    if recommendations:
+        return [recommendation.candidate for recommendation in recommendations]
+    return _fallback_candidates(profile, limit)
@@ -0,0 +1,61 @@
+"""Отношение между двумя профилями с точки зрения зрителя.
+
+Связь пары профилей хранится одной строкой Friendship, поэтому все состояния (дружба,
+входящая/исходящая заявка, блокировка с любой стороны) определяются по одной строке.
+Дружба сначала проверяется по индексу графа дружбы - для друзей запрос к базе не нужен.
+"""
+
+from collections import namedtuple
+
+from .friend_graph import are_friends
+from .lookups import (FRIENDSHIP_BLOCKED, FRIENDSHIP_FRIENDS, FRIENDSHIP_REQUESTED,
+                      friendship_status_id)
+from .models import Friendship
+
+
+RelationshipState = namedtuple(
+    "RelationshipState",
+    ["friends", "pending_in", "pending_out", "blocked_in", "blocked_out"],
+)
+
+NO_RELATIONSHIP = RelationshipState(False, False, False, False, False)
+FRIENDS = RelationshipState(True, False, False, False, False)
+
+
+def state_from_pair(pair, viewer_id):
+    """Состояние по строке Friendship пары (None - связи нет)"""
+    if pair is None:
+        return NO_RELATIONSHIP
+
+    if pair.status_id == friendship_status_id(FRIENDSHIP_FRIENDS):
+        return FRIENDS
+
+    outgoing = pair.profile_one_id == viewer_id
+    if pair.status_id == friendship_status_id(FRIENDSHIP_REQUESTED):
+        return NO_RELATIONSHIP._replace(pending_in=not outgoing, pending_out=outgoing)
+
+    if pair.status_id == friendship_status_id(FRIENDSHIP_BLOCKED):
+        mutual = pair.direction == Friendship.MUTUAL
+        return NO_RELATIONSHIP._replace(
+            blocked_in=mutual or not outgoing, blocked_out=mutual or outgoing
+        )
+
+    return NO_RELATIONSHIP
+
+
+def relationship_state(viewer, target):
+    """Отношение target к viewer (профили или их id): индекс графа дружбы или один запрос"""
+    viewer_id = getattr(viewer, "id", viewer)
+    target_id = getattr(target, "id", target)
+    if viewer_id is None or target_id is None or viewer_id == target_id:
+        return NO_RELATIONSHIP
+
+    if are_friends(viewer_id, target_id):
+        return FRIENDS
+
+    pair = (
+        Friendship.objects.between(viewer_id, target_id)
+        .only("status_id", "profile_one_id", "direction")
+        .first()
+    )
+    return state_from_pair(pair, viewer_id)
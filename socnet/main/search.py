@@ -0,0 +1,238 @@
+"""Полнотекстовый поиск по новостям (заголовок, текст и тэги).
+
+На SQLite используется виртуальная таблица FTS5 (обратный индекс), которая
+обновляется сигналами при сохранении/удалении новости и изменении ее тэгов.
+На PostgreSQL - SearchVector по тем же полям с GIN-индексом (см. миграцию 0031).
+Тэги для обоих индексов берутся из News.tag_names, которое сигналы держат актуальным.
+На остальных СУБД поиск сводится к icontains по тем же полям.
+Каждое слово запроса ищется как префикс: "кот" находит "котики".
+"""
+
+import logging
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Case, Count, F, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+
+from .models import News, Tag
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "main_news_search"
+
+# Колонки индекса и их веса в ранжировании: совпадение в заголовке важнее совпадения в тексте
+SEARCH_COLUMNS = ("title", "content", "tags")
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+
+# Сколько лучших совпадений упорядочивается по релевантности (остальные - по дате):
+# поиск должен оставаться дешевым на любом объеме
+SEARCH_MAX_RESULTS = 1000
+
+# Сколько тэгов показывать в фасете
+TAG_FACET_LIMIT = 20
+
+PG_CONFIG = "russian"
+# Вес tsvector для каждой колонки индекса (A - самый важный)
+PG_COLUMN_WEIGHTS = {"title": "A", "tags": "B", "content": "C"}
+# Поле модели для каждой колонки индекса
+COLUMN_FIELDS = {"title": "title", "content": "content", "tags": "tag_names"}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_words(text):
+    """Слова запроса без спецсимволов (чтобы пользователь не мог написать синтаксис FTS)"""
+    return _WORD_RE.findall(text or "")[:20]
+
+
+def uses_fts5():
+    return connection.vendor == "sqlite"
+
+
+def uses_pg_search():
+    return connection.vendor == "postgresql"
+
+
+def _tags_text(news_id):
+    return " ".join(Tag.objects.filter(news_posts=news_id).values_list("name", flat=True))
+
+
+def index_news(news_id):
+    """Добавляет или обновляет новость в индексе"""
+    row = News.objects.filter(pk=news_id).values_list("title", "content", "tag_names").first()
+    if row is not None:
+        title, content, tag_names = row
+        tags = _tags_text(news_id)
+        if tags != tag_names:
+            # update, а не save: без повторного post_save
+            News.objects.filter(pk=news_id).update(tag_names=tags)
+
+    if not uses_fts5():
+        # PostgreSQL строит вектор из колонок таблицы, отдельный индекс не нужен
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [news_id])
+        if row is not None:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)",
+                [news_id, title, content, tags],
+            )
+
+
+def remove_news(news_id):
+    """Удаляет новость из индекса"""
+    if not uses_fts5():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [news_id])
+
+
+def rebuild_index():
+    """Пересобирает индекс целиком (и News.tag_names). Возвращает число проиндексированных новостей"""
+    tags = {}
+    for news_id, name in News.tags.through.objects.values_list("news_id", "tag__name"):
+        tags.setdefault(news_id, []).append(name)
+
+    rows = [
+        (news_id, title, content, " ".join(tags.get(news_id, [])), tag_names)
+        for news_id, title, content, tag_names in News.objects.values_list(
+            "id", "title", "content", "tag_names"
+        ).iterator()
+    ]
+    News.objects.bulk_update(
+        [News(id=row[0], tag_names=row[3]) for row in rows if row[3] != row[4]],
+        ["tag_names"],
+        batch_size=1000,
+    )
+    if not uses_fts5():
+        return len(rows)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)",
+            [row[:4] for row in rows],
+        )
+    return len(rows)
+
+
+def _fts_match(words, column=None):
+    match = " AND ".join('"%s"*' % word for word in words)
+    if column is not None:
+        match = "{%s} : (%s)" % (column, match)
+    return match
+
+
+def _ranked_ids(match, queryset):
+    # Ранжирование только среди новостей queryset (фильтры по дате, тэгам и т.п. уже внутри)
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    try:
+        subquery, params = queryset.order_by().values("id").query.sql_with_params()
+    except EmptyResultSet:
+        # queryset.none() и фильтры, заведомо ничего не находящие
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"AND rowid IN ({subquery}) "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s",
+            [match, *params, SEARCH_MAX_RESULTS],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _ranking(ids):
+    # позиция в списке ids; объекты не из списка - после них
+    return Case(
+        *[When(id=object_id, then=position) for position, object_id in enumerate(ids)],
+        default=len(ids),
+        output_field=IntegerField(),
+    )
+
+
+def news_search_vector():
+    """tsvector новости для PostgreSQL: заголовок, тэги и текст с весами PG_COLUMN_WEIGHTS.
+    Выражение совпадает с GIN-индексом из миграции 0031"""
+    vector = None
+    for column in ("title", "tags", "content"):
+        part = SearchVector(
+            COLUMN_FIELDS[column], weight=PG_COLUMN_WEIGHTS[column], config=PG_CONFIG
+        )
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _pg_query(words, column=None):
+    # Каждое слово - префикс; колонка ограничивается весом ее части вектора ("кот:*A")
+    weight = PG_COLUMN_WEIGHTS[column] if column else ""
+    return SearchQuery(
+        " & ".join(f"{word}:*{weight}" for word in words), search_type="raw", config=PG_CONFIG
+    )
+
+
+def _pg_rank_weights():
+    # Веса SearchRank идут в порядке D, C, B, A и должны лежать в [0, 1]
+    weights = dict(zip(SEARCH_COLUMNS, SEARCH_WEIGHTS))
+    top = max(SEARCH_WEIGHTS)
+    by_letter = {PG_COLUMN_WEIGHTS[column]: weight / top for column, weight in weights.items()}
+    return [by_letter.get(letter, 0.0) for letter in "DCBA"]
+
+
+def order_by_ids(queryset, ids):
+    """Оставляет в queryset только объекты из ids в порядке этого списка (порядок релевантности)"""
+    return queryset.filter(id__in=ids).order_by(_ranking(ids))
+
+
+def search_news(queryset, text, column=None):
+    """Фильтрует queryset новостей по поисковому запросу и сортирует по релевантности.
+    column ограничивает поиск одной колонкой (title или content)"""
+    words = search_words(text)
+    if not words:
+        return queryset
+
+    if uses_fts5():
+        match = _fts_match(words, column)
+        found = queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        )
+        # По релевантности упорядочиваются первые SEARCH_MAX_RESULTS совпадений, остальные
+        # идут за ними от новых к старым - в выдаче (и в счетчике) есть все совпадения
+        ids = _ranked_ids(match, queryset)
+        return found.order_by(_ranking(ids), "-created_at", "-id")
+
+    if uses_pg_search():
+        # Ранжируются все совпадения прямо в запросе - после остальных фильтров queryset
+        query = _pg_query(words, column)
+        return (
+            queryset.annotate(
+                search_document=news_search_vector(),
+                search_rank=SearchRank(F("search_document"), query, weights=_pg_rank_weights()),
+            )
+            .filter(search_document=query)
+            .order_by("-search_rank", "-created_at", "-id")
+        )
+
+    # Запасной вариант без обратного индекса
+    columns = [column] if column else SEARCH_COLUMNS
+    for word in words:
+        condition = Q()
+        for name in columns:
+            condition |= Q(**{f"{COLUMN_FIELDS[name]}__icontains": word})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def tag_facets(queryset, limit=TAG_FACET_LIMIT):
+    """Тэги найденных новостей с числом новостей по каждому (самые частые первыми)"""
+    return list(
+        Tag.objects.filter(news_posts__in=queryset.order_by().values("id"))
+        .annotate(total=Count("news_posts"))
+        .order_by("-total", "name")
+        .values("id", "name", "total")[:limit]
+    )
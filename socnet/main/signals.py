@@ -1,10 +1,25 @@
-from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+import logging
+
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
 from django.contrib.auth import user_logged_in
 from django.dispatch import receiver
 from django.core.cache import cache
+from django.db.models import F
 
-from .models import (Profile, Friendship, Mediafile, News, Comment, Reaction,
-                     Group, Mail, GroupMembership)
+from .models import (User, Profile, Friendship, Mediafile, News, Comment, Reaction,
+                     Group, Mail, GroupMembership, Tag, FriendshipStatus, Status,
+                     PrivacyLevel)
+from .caching import bump_namespace, delete_after_commit, payload_key, user_cache_keys
+from .comments import comment_html_key
+from . import friend_graph
+from .lookups import (FRIENDSHIP_FRIENDS, friendship_status_id, friendship_statuses,
+                      group_statuses, privacy_levels)
+from .profile_names import profile_names
+from .profile_search import profile_name_index
+from .recommendations import forget_pair
+from .search import index_news, remove_news
+from .tasks import backfill_friendship_timelines, fanout_news, prune_friendship_timelines
+from .timeline import enqueue_on_commit
 
 """Добавить сигналы, чтобы профиль автоматически создавался при регистрации
  (но в модели Profile нужно разрешить чтобы поля были пустыми)"""
@@ -20,30 +35,15 @@ from .models import (Profile, Friendship, Mediafile, News, Comment, Reaction,
 # def save_profile(sender, instance, **kwargs):
 #     instance.profile.save()
 
-"""Функции для инвалидации кэша"""
-
+logger = logging.getLogger(__name__)
 
-def set_cache_with_key(cache_key, data, timeout=86400):
-    """Утилитарная функция для кэширования данных с сохранением ключа."""
-    cache.set(cache_key, data, timeout)
-    cache_keys = cache.get('cache_keys', [])
-    if cache_key not in cache_keys:
-        cache_keys.append(cache_key)
-        cache.set('cache_keys', cache_keys, timeout)
+"""Функции для инвалидации кэша"""
 
-def clear_cache_with_prefix(prefix):
-    """Удаляет все ключи кэша, которые начинаются с заданного префикса."""
-    cache_keys = cache.get('cache_keys', [])
-    for key in cache_keys:
-        if key.startswith(prefix):
-            cache.delete(key)
-    # Удаляем ключи из списка
-    cache.set('cache_keys', [key for key in cache_keys if not key.startswith(prefix)], timeout=86400)
 
 @receiver(user_logged_in)
 def clear_cache_on_login(sender, user, request, **kwargs):
-    """Сбрасываем кэш при входе пользователя в систему"""
-    cache.clear()  # Очищает весь кэш
+    """Сбрасываем кэш вошедшего пользователя (остальной кэш не трогаем)"""
+    cache.delete_many(user_cache_keys(user))
 
 @receiver(post_save, sender=Profile)
 @receiver(post_save, sender=Friendship)
@@ -62,56 +62,270 @@ def clear_profile_cache(sender, instance, **kwargs):
         cache.delete(f"friends_{instance.profile_two.user.username}")
 
 
+@receiver(m2m_changed, sender=Profile.interests.through)
+def clear_profile_cache_on_interests(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Функция инвалидации кэша профиля при изменении интересов (они кэшируются вместе с профилем)"""
+    if reverse and action == "pre_clear":
+        # interest.profile_set.clear(): после очистки связей уже не узнать, какие профили затронуты
+        instance._cleared_profile_ids = list(instance.profile_set.values_list("id", flat=True))
+        return
+    if not action.startswith("post_"):
+        return
+
+    if not reverse:
+        cache.delete(f"profile_{instance.user.username}")
+        return
+
+    # изменение со стороны интереса (interest.profile_set.add(...))
+    if action == "post_clear":
+        profile_ids = getattr(instance, "_cleared_profile_ids", [])
+    else:
+        profile_ids = list(pk_set)
+    usernames = Profile.objects.filter(id__in=profile_ids).values_list("user__username", flat=True)
+    cache.delete_many([f"profile_{username}" for username in usernames])
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def clear_profile_name_cache(sender, instance, **kwargs):
+    """ Функция инвалидации LRU-кэша имен профилей (используется чатом)"""
+    profile_names.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+def update_profile_name_index(sender, instance, **kwargs):
+    """ Функция обновления индекса нечеткого поиска людей при изменении профиля"""
+    # логин берем из уже загруженного пользователя, иначе индекс возьмет известный ему логин
+    user_field = Profile._meta.get_field("user")
+    username = instance.user.username if user_field.is_cached(instance) else None
+    profile_name_index.update(
+        instance.id, instance.user_id, instance.firstname, instance.lastname, username
+    )
+
+
+@receiver(post_save, sender=User)
+def update_profile_name_index_on_user(sender, instance, created, update_fields=None, **kwargs):
+    """ Функция обновления логина в индексе нечеткого поиска людей"""
+    if created or (update_fields is not None and "username" not in update_fields):
+        # у нового пользователя профиля еще нет, а вход (last_login) логин не меняет
+        return
+    profile_name_index.update_username(instance.id, instance.username)
+
+
+@receiver(post_delete, sender=Profile)
+def remove_from_profile_name_index(sender, instance, **kwargs):
+    """ Функция удаления профиля из индекса нечеткого поиска людей"""
+    profile_name_index.remove(instance.id)
+
+
 @receiver(post_save, sender=Mediafile)
 @receiver(post_delete, sender=Mediafile)
 def clear_media_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша фотографий при их удалении или добавлении"""
     username = instance.profile.user.username
-    cache_key = f"media_{username}"
+    cache_key = payload_key(f"media_{username}")
     cache.delete(cache_key)
 
+    if instance.file_type == "avatar":
+        # аватар выводится в списке профилей и хранится в кэше профиля
+        bump_namespace("profile_list")
+        cache.delete(f"profile_{username}")
+
 @receiver(post_save, sender=News)
 @receiver(pre_delete, sender=News)
 def clear_news_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша списка новостей при их удалении или добавлении"""
-    # Удаляем все ключи кэша, связанные с новостями
-    clear_cache_with_prefix("news_filter_")
+    # Новая версия пространства имен делает недоступными все закэшированные списки
+    bump_namespace("news_filter")
 
 
 @receiver(post_save, sender=News)
+def update_news_search_index(sender, instance, **kwargs):
+    """ Функция обновления поискового индекса при добавлении или изменении новости"""
+    try:
+        index_news(instance.id)
+    except Exception as e:
+        # Ошибка индекса не должна мешать сохранить новость
+        logger.error(f"Ошибка обновления поискового индекса новости {instance.id}: {str(e)}")
+
+
 @receiver(pre_delete, sender=News)
-def clear_news_detail_cache(sender, instance, **kwargs):
+def remove_news_from_search_index(sender, instance, **kwargs):
+    """ Функция удаления новости из поискового индекса"""
+    try:
+        remove_news(instance.id)
+    except Exception as e:
+        logger.error(f"Ошибка удаления новости {instance.id} из поискового индекса: {str(e)}")
+
+
+@receiver(m2m_changed, sender=News.tags.through)
+def update_news_search_index_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Функция обновления поискового индекса при изменении тэгов новости"""
+    if reverse and action == "pre_clear":
+        # tag.news_posts.clear(): после очистки связей уже не узнать, какие новости затронуты
+        instance._cleared_news_ids = list(instance.news_posts.values_list("id", flat=True))
+        return
+    if not action.startswith("post_"):
+        return
+
+    if not reverse:
+        news_ids = [instance.id]
+    elif action == "post_clear":
+        news_ids = getattr(instance, "_cleared_news_ids", [])
+    else:
+        # изменение со стороны тэга (tag.news_posts.add(...))
+        news_ids = list(pk_set)
+
+    for news_id in news_ids:
+        update_news_search_index(sender, News(id=news_id))
+
+    # тэги выводятся и фильтруются в закэшированных списках новостей
+    bump_namespace("news_filter")
+
+
+@receiver(post_save, sender=Tag)
+def update_news_search_index_on_tag(sender, instance, created, **kwargs):
+    """ Функция обновления поискового индекса при переименовании тэга"""
+    if created:
+        return
+    for news_id in instance.news_posts.values_list("id", flat=True):
+        update_news_search_index(sender, News(id=news_id))
+    bump_namespace("news_filter")
+
+
+@receiver(post_save, sender=News)
+def fanout_news_to_timelines(sender, instance, created, **kwargs):
+    """ Функция рассылки новой новости по лентам друзей (выполняется в Celery после коммита)"""
+    if created:
+        enqueue_on_commit(fanout_news, instance.id)
+
+
+@receiver(post_save, sender=FriendshipStatus)
+@receiver(post_delete, sender=FriendshipStatus)
+def clear_friendship_status_lookup(sender, instance, **kwargs):
+    """ Функция сброса справочника статусов дружбы"""
+    friendship_statuses.invalidate()
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+def clear_group_status_lookup(sender, instance, **kwargs):
+    """ Функция сброса справочника статусов участников групп"""
+    group_statuses.invalidate()
+
+
+@receiver(post_save, sender=PrivacyLevel)
+@receiver(post_delete, sender=PrivacyLevel)
+def clear_privacy_level_lookup(sender, instance, **kwargs):
+    """ Функция сброса справочника уровней приватности"""
+    privacy_levels.invalidate()
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def clear_friend_graph_cache(sender, instance, **kwargs):
+    """ Функция инвалидации индекса графа дружбы для обоих участников"""
+    friend_graph.invalidate(instance.profile_one_id, instance.profile_two_id)
+
+
+@receiver(post_save, sender=Friendship)
+def clear_friend_recommendations(sender, instance, created, **kwargs):
+    """ Функция удаления пары из рекомендаций, как только между профилями появилась связь"""
+    if created:
+        forget_pair(instance.profile_one_id, instance.profile_two_id)
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def update_friendship_timelines(sender, instance, created=False, **kwargs):
+    """ Функция обновления лент при принятии дружбы и при удалении из друзей/блокировке"""
+    is_friends = kwargs["signal"] is post_save and instance.status_id == friendship_status_id(FRIENDSHIP_FRIENDS)
+
+    if is_friends:
+        enqueue_on_commit(
+            backfill_friendship_timelines, instance.profile_one_id, instance.profile_two_id
+        )
+    elif not created:
+        enqueue_on_commit(
+            prune_friendship_timelines, instance.profile_one_id, instance.profile_two_id
+        )
+
+
+@receiver(post_save, sender=News)
+@receiver(pre_delete, sender=News)
+def clear_news_detail_cache_on_news(sender, instance, **kwargs):
     """ Функция инвалидации кэша деталей новости при их удалении или измении"""
-    news_id = instance.id
-    cache_key = f"news_detail_{news_id}"
-    # Очистим список ключей
-    cache.delete(cache_key)
+    delete_after_commit(f"news_detail_{instance.id}")
 
 
 @receiver([post_save, post_delete], sender=Comment)
 @receiver([post_save, post_delete], sender=Reaction)
 def clear_news_detail_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша деталей новости при  удалении или измении реакции или комментария"""
-    cache_key = f"news_detail_{instance.news.id}"  # Очищаем кэш для конкретной новости
-    cache.delete(cache_key)
+    if isinstance(instance, Reaction):
+        # Реакция связана с новостью через content_type/object_id, поля news у нее нет
+        if instance.content_type.model_class() is not News:
+            return
+        news_id = instance.object_id
+    else:
+        news_id = instance.news_id
+    # Очищаем кэш для конкретной новости (счетчики реакций меняются в той же транзакции)
+    delete_after_commit(f"news_detail_{news_id}")
+
+
+@receiver(post_delete, sender=Reaction)
+def update_news_counters_on_reaction_delete(sender, instance, **kwargs):
+    """ Функция уменьшения счетчика реакций новости при удалении реакции,
+    в том числе каскадном (при удалении профиля)"""
+    if instance.content_type.model_class() is not News:
+        return
+    field = Reaction.COUNTER_FIELDS.get(instance.reaction_type)
+    if field is not None:
+        News.objects.filter(pk=instance.object_id, **{f"{field}__gt": 0}).update(
+            **{field: F(field) - 1}
+        )
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def clear_comment_html_cache(sender, instance, **kwargs):
+    """ Функция инвалидации кэша HTML комментария при его изменении или удалении"""
+    cache.delete(comment_html_key(instance.id))
+
+
+@receiver(post_save, sender=Profile)
+def clear_author_comments_html_cache(sender, instance, created, **kwargs):
+    """ Функция инвалидации кэша HTML комментариев автора (в них выводится его имя)"""
+    if created:
+        return
+    rows = Comment.objects.filter(author=instance).values_list("id", "news_id")
+    keys = set()
+    for comment_id, news_id in rows:
+        keys.add(comment_html_key(comment_id))
+        # в кэше деталей новости лежат комментарии вместе с автором
+        keys.add(f"news_detail_{news_id}")
+    cache.delete_many(list(keys))
 
 
 @receiver(post_save, sender=Group)
 @receiver(pre_delete, sender=Group)
-def clear_group_cache(sender, instance, **kwargs):
+def clear_group_list_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша списка групп при их удалении или измении"""
-    # Удаляем все ключи кэша
-    clear_cache_with_prefix("group_filter_")
+    # Новая версия пространства имен делает недоступными все закэшированные списки
+    bump_namespace("group_filter")
 
 @receiver(post_save, sender=Profile)
 @receiver(post_delete, sender=Profile)
+@receiver(m2m_changed, sender=Profile.interests.through)
 def clear_profile_list_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша деталей списка профилей их удалении или измении"""
-    clear_cache_with_prefix("profile_list_")
+    if kwargs.get("action", "post").startswith("pre_"):
+        # изменение интересов: достаточно одной инвалидации после записи
+        return
+    bump_namespace("profile_list")
 
 @receiver(pre_save, sender=GroupMembership)
 @receiver(pre_delete, sender=GroupMembership)
-def clear_group_cache(sender, instance, **kwargs):
+def clear_group_membership_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша деталей группы при удалении или измении участников группы"""
     group_id = instance.group.id
     cache_key = f"group_detail_{group_id}"
@@ -120,7 +334,7 @@ def clear_group_cache(sender, instance, **kwargs):
 
 @receiver(pre_save, sender=Group)
 @receiver(pre_delete, sender=Group)
-def clear_group_cache(sender, instance, **kwargs):
+def clear_group_detail_cache(sender, instance, **kwargs):
     """ Функция инвалидации кэша деталей группы при удалении или измении конкретной группы"""
     cache_key = f"group_detail_{instance.id}"
     # Удаляем конкретный ключ из кэша
@@ -0,0 +1,94 @@
+"""Похожие по интересам профили ("люди как вы").
+
+Матрица профиль x интерес хранится разреженно: множество интересов каждого профиля
+и обратный индекс интерес -> профили. Для профиля число общих интересов со всеми
+остальными считается одним проходом по обратному индексу (это строка произведения
+матрицы на транспонированную), а сходство - коэффициент Жаккара:
+общие / (интересы A + интересы B - общие). Профили обрабатываются блоками, лучшие
+PROFILE_SIMILARITY_TOP_N соседей сохраняются в ProfileSimilarity, поэтому при запросе
+соседи читаются без соединений по интересам.
+"""
+
+import heapq
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Profile, ProfileSimilarity
+
+
+# Интересы, которые есть у большего числа профилей, почти ничего не говорят о близости
+# и сильнее всего удорожают расчет - такие интересы не учитываются
+INTEREST_MAX_PROFILES = 5000
+
+
+def load_interests():
+    """Интересы профилей и обратный индекс: ({профиль: set интересов}, {интерес: список профилей})"""
+    interests = {}
+    members = {}
+    for profile_id, interest_id in Profile.interests.through.objects.values_list(
+        "profile_id", "interest_id"
+    ).iterator():
+        interests.setdefault(profile_id, set()).add(interest_id)
+        members.setdefault(interest_id, []).append(profile_id)
+    members = {
+        interest_id: profile_ids
+        for interest_id, profile_ids in members.items()
+        if len(profile_ids) <= INTEREST_MAX_PROFILES
+    }
+    return interests, members
+
+
+def top_neighbors(profile_id, interests, members, top_n):
+    """Ближайшие соседи профиля: список (сходство, сосед, общих интересов)"""
+    own = interests.get(profile_id)
+    if not own:
+        return []
+
+    common = Counter()
+    for interest_id in own:
+        common.update(members.get(interest_id, ()))
+    common.pop(profile_id, None)
+
+    scored = (
+        (shared / (len(own) + len(interests[neighbor_id]) - shared), neighbor_id, shared)
+        for neighbor_id, shared in common.items()
+    )
+    return heapq.nsmallest(top_n, scored, key=lambda row: (-row[0], row[1]))
+
+
+def refresh(block_size=None, top_n=None):
+    """Пересчитывает соседей для всех профилей. Возвращает число обработанных профилей"""
+    block_size = block_size or settings.PROFILE_SIMILARITY_BLOCK
+    top_n = top_n or settings.PROFILE_SIMILARITY_TOP_N
+
+    interests, members = load_interests()
+    profile_ids = list(Profile.objects.order_by("id").values_list("id", flat=True))
+
+    for start in range(0, len(profile_ids), block_size):
+        block = profile_ids[start : start + block_size]
+        rows = [
+            ProfileSimilarity(
+                profile_id=profile_id, neighbor_id=neighbor_id, score=score, common_interests=shared
+            )
+            for profile_id in block
+            for score, neighbor_id, shared in top_neighbors(profile_id, interests, members, top_n)
+        ]
+        with transaction.atomic():
+            ProfileSimilarity.objects.filter(profile_id__in=block).delete()
+            ProfileSimilarity.objects.bulk_create(rows, batch_size=1000)
+
+    return len(profile_ids)
+
+
+def get_similar_profiles(profile, limit=None, exclude_ids=()):
+    """Похожие профили от самых похожих (не больше limit)"""
+    limit = min(limit or settings.PROFILE_SIMILARITY_TOP_N, settings.PROFILE_SIMILARITY_TOP_N)
+    return [
+        similarity.neighbor
+        for similarity in ProfileSimilarity.objects.filter(profile=profile)
+        .exclude(neighbor_id__in=exclude_ids)
+        .select_related("neighbor")
+        .order_by("-score", "neighbor_id")[:limit]
+    ]
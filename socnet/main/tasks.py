@@ -1,57 +1,192 @@
+import logging
 from datetime import timedelta
+from django.conf import settings
 from django.utils import timezone
+from django.db import connection, transaction
+from django.db.models import Count, Max
 from celery import shared_task
 
-from .models import ArchiveChat, ArchivedMail, Chat, Mail, StatusProfile
+from . import friend_graph, recommendations, similarity, timeline
+from .models import ArchiveChat, ArchivedMail, Chat, Mail, StatusProfile, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+# Сколько сообщений чата переносится в архив за одну транзакцию
+CHAT_ARCHIVE_CHUNK_SIZE = 1000
+
 
 @shared_task
-def archive_chat():
+def archive_chat(chunk_size=CHAT_ARCHIVE_CHUNK_SIZE):
     '''Архивация чата'''
 
-    chats = Chat.objects.all()
-    for chat in chats:
-        ArchiveChat.objects.create(
-            created_at=chat.created_at, profile=chat.profile, group=chat.group
-        )
-    chats.delete()
+    # Идем по таблице порциями по возрастанию id (keyset), поэтому память ограничена
+    # размером порции. Каждая порция копируется в архив и удаляется в одной транзакции
+    last_id = 0
+    archived = 0
 
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Chat.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "created_at", "messages", "profile_id", "group_id")[
+                    :chunk_size
+                ]
+            )
+            if not rows:
+                break
+
+            ArchiveChat.objects.bulk_create(
+                [
+                    ArchiveChat(
+                        created_at=created_at,
+                        messages=messages,
+                        profile_id=profile_id,
+                        group_id=group_id,
+                    )
+                    for _, created_at, messages, profile_id, group_id in rows
+                ]
+            )
+            Chat.objects.filter(id__in=[row[0] for row in rows]).delete()
+
+        last_id = rows[-1][0]
+        archived += len(rows)
+
+    return archived
 
-@shared_task
-def archive_mail():
-    '''Архивация почты'''
 
+# Сколько писем переносится в архив за одну транзакцию
+MAIL_ARCHIVE_BATCH_SIZE = 500
 
-    mails = Mail.objects.all()
-    for mail in mails:
-        ArchivedMail.objects.create(
-            sender=mail.sender,
-            recipient=mail.recipient,
-            content=mail.content,
-            timestamp=mail.timestamp,
-            parent=mail.parent,
-            is_read=mail.is_read,
-            is_deleted_sender=mail.is_deleted_sender,
+
+def _move_mail_batch(ids, archived_at):
+    """Переносит порцию писем в архив на стороне БД (INSERT ... SELECT) и удаляет их из почты"""
+
+    qn = connection.ops.quote_name
+    mail_table = qn(Mail._meta.db_table)
+    archive_table = qn(ArchivedMail._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(ids))
+
+    columns = ["sender_id", "recipient_id", "content", "timestamp", "is_read", "is_deleted_sender"]
+    column_list = ", ".join(qn(column) for column in columns)
+
+    with connection.cursor() as cursor:
+        # id и parent_id исходного письма сохраняем, чтобы восстановить связь parent в архиве
+        cursor.execute(
+            f"INSERT INTO {archive_table} ({column_list}, archived_at, original_id, original_parent_id) "
+            f"SELECT {column_list}, %s, id, parent_id FROM {mail_table} WHERE id IN ({placeholders})",
+            [archived_at, *ids],
         )
-    mails.delete()
+        cursor.execute(f"DELETE FROM {mail_table} WHERE id IN ({placeholders})", ids)
 
+    _relink_archived_parents(ids)
 
-@shared_task
-def clean_mail():
+
+def _relink_archived_parents(ids):
+    """Проставляет parent в архиве для писем порции ids: самим перенесенным письмам
+    и ответам на них, перенесенным раньше (ответы уходят в архив раньше родителей)"""
+
+    archive_table = connection.ops.quote_name(ArchivedMail._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(ids))
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"UPDATE {archive_table} AS a SET parent_id = p.id "
+                f"FROM {archive_table} AS p "
+                f"WHERE a.parent_id IS NULL AND p.original_id = a.original_parent_id "
+                f"AND (a.original_id IN ({placeholders}) OR a.original_parent_id IN ({placeholders}))",
+                [*ids, *ids],
+            )
+        else:
+            # SQLite (и старые версии без UPDATE ... FROM) - коррелированный подзапрос
+            cursor.execute(
+                f"UPDATE {archive_table} SET parent_id = ("
+                f"SELECT p.id FROM {archive_table} AS p "
+                f"WHERE p.original_id = {archive_table}.original_parent_id "
+                f"ORDER BY p.id DESC LIMIT 1) "
+                f"WHERE parent_id IS NULL "
+                f"AND (original_id IN ({placeholders}) OR original_parent_id IN ({placeholders}))",
+                [*ids, *ids],
+            )
+
+
+def _kept_mail_ids(rows):
+    """id писем порции, которые нельзя переносить: на них (или на их ответы из порции)
+    есть ответы, остающиеся в почте. rows - пары (id, parent_id) писем порции"""
+
+    parents = dict(rows)
+    kept = set(
+        Mail.objects.filter(parent_id__in=parents)
+        .exclude(id__in=parents)
+        .values_list("parent_id", flat=True)
+    )
+    # остающееся письмо держит в почте и всю цепочку своих родителей из порции
+    pending = list(kept)
+    while pending:
+        parent_id = parents.get(pending.pop())
+        if parent_id in parents and parent_id not in kept:
+            kept.add(parent_id)
+            pending.append(parent_id)
+    return kept
+
+
+def _archive_mails(task, mails, batch_size):
+    """Переносит письма из queryset в архив порциями, сообщая о прогрессе"""
+
+    # Фиксируем границу, чтобы письма, пришедшие во время архивации, не продлевали ее бесконечно
+    max_id = mails.aggregate(max_id=Max("id"))["max_id"]
+    if max_id is None:
+        return 0
+    mails = mails.filter(id__lte=max_id)
+
+    total = mails.count()
+    archived_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    moved = 0
+    last_id = max_id + 1
+
+    while True:
+        with transaction.atomic():
+            # от новых к старым: ответы переносятся раньше своих родительских писем.
+            # Следующая порция продолжается с последнего id, а не с начала таблицы
+            rows = list(
+                mails.filter(id__lt=last_id)
+                .order_by("-id")
+                .values_list("id", "parent_id")[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # письма, на которые есть ответы, остающиеся в почте, не переносим -
+            # иначе ответы потеряют связь с родителем; они уйдут в архив вместе с ответами
+            kept = _kept_mail_ids(rows)
+            ids = [mail_id for mail_id, _ in rows if mail_id not in kept]
+            if ids:
+                _move_mail_batch(ids, archived_at)
+
+        moved += len(ids)
+        logger.info(f"Архивация почты: перенесено {moved} из {total}")
+        if task.request.id:
+            task.update_state(state="PROGRESS", meta={"moved": moved, "total": total})
+
+    return moved
+
+
+@shared_task(bind=True)
+def archive_mail(self, batch_size=MAIL_ARCHIVE_BATCH_SIZE):
+    '''Архивация почты'''
+
+    return _archive_mails(self, Mail.objects.all(), batch_size)
+
+
+@shared_task(bind=True)
+def clean_mail(self, batch_size=MAIL_ARCHIVE_BATCH_SIZE):
     '''Очистка почты'''
 
     six_months_ago = timezone.now() - timedelta(days=180)
     mails_to_delete = Mail.objects.filter(timestamp__lt=six_months_ago)
-    for mail in mails_to_delete:
-        ArchivedMail.objects.create(
-            sender=mail.sender,
-            recipient=mail.recipient,
-            content=mail.content,
-            timestamp=mail.timestamp,
-            parent=mail.parent,
-            is_read=mail.is_read,
-            is_deleted_sender=mail.is_deleted_sender,
-        )
-    mails_to_delete.delete()
+    return _archive_mails(self, mails_to_delete, batch_size)
 
 
 @shared_task
@@ -59,7 +194,7 @@ def update_online_status():
     '''Обновление статуса пользователя'''
 
     # Определяем пороговое время для определения, что пользователь неактивен
-    time_threshold = timezone.now() - timedelta(minutes=5)
+    time_threshold = timezone.now() - timedelta(seconds=settings.PRESENCE_OFFLINE_AFTER)
 
     # Фильтруем профили, где last_updated старше порогового времени
     profiles_to_update = StatusProfile.objects.filter(
@@ -68,3 +203,75 @@ def update_online_status():
 
     # Обновляем статус is_online на False для этих профилей
     profiles_to_update.update(is_online=False)
+
+
+@shared_task
+def fanout_news(news_id):
+    '''Рассылка новой новости по лентам друзей автора'''
+
+    pushed = timeline.push_news(news_id)
+    logger.info(f"Новость {news_id} добавлена в {pushed} лент")
+    return pushed
+
+
+@shared_task
+def backfill_friendship_timelines(profile_one_id, profile_two_id):
+    '''Взаимное заполнение лент после принятия дружбы'''
+
+    return timeline.backfill(profile_one_id, profile_two_id) + timeline.backfill(
+        profile_two_id, profile_one_id
+    )
+
+
+@shared_task
+def prune_friendship_timelines(profile_one_id, profile_two_id):
+    '''Удаление новостей бывшего друга из лент обоих профилей'''
+
+    if friend_graph.are_friends(profile_one_id, profile_two_id):
+        # дружба все еще есть (например, осталась встречная запись) - ленты не трогаем
+        return 0
+    return timeline.prune(profile_one_id, profile_two_id) + timeline.prune(
+        profile_two_id, profile_one_id
+    )
+
+
+@shared_task
+def rebuild_friends_timeline(profile_id):
+    '''Заполнение ленты профиля, созданной до появления материализованных лент'''
+
+    return timeline.rebuild(profile_id)
+
+
+@shared_task
+def trim_timelines():
+    '''Обрезка лент до TIMELINE_MAX_ENTRIES записей'''
+
+    owners = (
+        TimelineEntry.objects.values("owner")
+        .annotate(total=Count("id"))
+        .filter(total__gt=settings.TIMELINE_MAX_ENTRIES)
+        .values_list("owner", flat=True)
+    )
+    trimmed = 0
+    for owner_id in owners:
+        trimmed += timeline.trim_timeline(owner_id)
+    logger.info(f"Из лент удалено {trimmed} устаревших записей")
+    return trimmed
+
+
+@shared_task
+def refresh_profile_similarity():
+    '''Пересчет похожих по интересам профилей'''
+
+    processed = similarity.refresh()
+    logger.info(f"Похожие профили пересчитаны для {processed} профилей")
+    return processed
+
+
+@shared_task
+def refresh_friend_recommendations(profile_ids=None):
+    '''Пересчет рекомендаций друзей (друзья друзей и общие интересы)'''
+
+    processed = recommendations.refresh(profile_ids)
+    logger.info(f"Рекомендации друзей пересчитаны для {processed} профилей")
+    return processed
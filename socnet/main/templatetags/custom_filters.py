@@ -1,4 +1,10 @@
 from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from main.caching import cache_get
+from main.comments import COMMENT_HTML_TIMEOUT, comment_html_key
 
 register = template.Library()
 
@@ -11,3 +17,15 @@ def get_item(dictionary, key):
 @register.filter
 def is_excludable(status, creator_status):
     return status != "admin" and creator_status
+
+
+@register.simple_tag
+def comment_fragment(comment):
+    """HTML комментария без ответов. Кэшируется по id комментария, поэтому каждый
+    комментарий рендерится один раз, а не при каждом выводе ветки"""
+    key = comment_html_key(comment.id)
+    html = cache_get("comment_html", key)
+    if html is None:
+        html = render_to_string("main/comment_body.html", {"comment": comment})
+        cache.set(key, str(html), COMMENT_HTML_TIMEOUT)
+    return mark_safe(html)
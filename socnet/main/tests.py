@@ -0,0 +1,526 @@
+import time
+from datetime import datetime, timedelta
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .caching import bump_namespace, cached_compute
+from .filters import NewsFilter
+from .lookups import (FRIENDSHIP_BLOCKED, FRIENDSHIP_FRIENDS, FRIENDSHIP_REQUESTED,
+                      PRIVACY_DEFAULT, friendship_status_id, friendship_statuses,
+                      group_statuses, privacy_levels)
+from .models import (ArchivedMail, Friendship, FriendshipStatus, Mail, News, PrivacyLevel, Profile,
+                     Tag, TimelineEntry)
+from .pagination import decode_cursor, encode_cursor
+from .profile_names import ProfileNameCache, get_profile_identity, profile_names
+from .relationships import FRIENDS, NO_RELATIONSHIP, state_from_pair
+from .tasks import clean_mail
+from .timeline import push_news, read_friends_feed
+
+
+# Тесты не должны зависеть от внешнего memcached из настроек
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LookupTestCase(TestCase):
+    '''Базовый тест со справочниками статусов дружбы и приватности'''
+
+    @classmethod
+    def setUpTestData(cls):
+        PrivacyLevel.objects.create(name=PRIVACY_DEFAULT, description="")
+        for name in (FRIENDSHIP_REQUESTED, FRIENDSHIP_FRIENDS, FRIENDSHIP_BLOCKED):
+            FriendshipStatus.objects.create(name=name, description="")
+
+    def setUp(self):
+        # справочники и имена профилей живут в памяти процесса, а id строк меняются от теста к тесту
+        cache.clear()
+        for registry in (friendship_statuses, group_statuses, privacy_levels):
+            registry.invalidate()
+        profile_names.clear()
+
+    def create_profile(self, username):
+        user = get_user_model().objects.create_user(username=username, password="password")
+        return Profile.objects.create(user=user, firstname=username, lastname=username)
+
+
+class CursorTests(TestCase):
+    '''Кодирование и разбор курсора пагинации'''
+
+    def test_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+    def test_naive_datetime(self):
+        created_at = datetime(2024, 1, 2, 3, 4, 5, 6)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 1)), (created_at, 1))
+
+    def test_invalid_cursor(self):
+        for cursor in ("", "not-base64!", "YWJj", encode_cursor(timezone.now(), 1)[:-4]):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+
+    def test_non_string_cursor(self):
+        # из websocket курсор может прийти любым значением JSON
+        for cursor in (None, 0, 12, 1.5, [], ["a"], {"id": 1}, True):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedComputeTests(TestCase):
+    '''Кэширование с защитой от одновременного пересчета'''
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value="value"):
+        self.calls += 1
+        return value
+
+    def test_value_is_cached(self):
+        self.assertEqual(cached_compute("test", "key", self.compute), "value")
+        self.assertEqual(cached_compute("test", "key", self.compute), "value")
+        self.assertEqual(self.calls, 1)
+
+    def test_none_is_cached(self):
+        self.assertIsNone(cached_compute("test", "key", lambda: self.compute(None)))
+        self.assertIsNone(cached_compute("test", "key", lambda: self.compute(None)))
+        self.assertEqual(self.calls, 1)
+
+    def test_cache_if_rejects_value(self):
+        cached_compute("test", "key", self.compute, cache_if=lambda value: False)
+        cached_compute("test", "key", self.compute, cache_if=lambda value: False)
+        self.assertEqual(self.calls, 2)
+
+    def test_stale_value_is_refreshed(self):
+        cached_compute("test", "key", self.compute)
+        value, delta, expires = cache.get("key")
+        cache.set("key", (value, delta, 0))
+        self.assertEqual(cached_compute("test", "key", lambda: self.compute("new")), "new")
+        self.assertEqual(self.calls, 2)
+
+    def test_stale_value_while_locked(self):
+        # значение пересчитывает другой запрос - отдается устаревшая копия
+        cached_compute("test", "key", self.compute)
+        value, delta, expires = cache.get("key")
+        cache.set("key", (value, delta, 0))
+        cache.add("key_lock", True)
+        self.assertEqual(cached_compute("test", "key", lambda: self.compute("new")), "value")
+        self.assertEqual(self.calls, 1)
+
+    def test_exception_releases_lock(self):
+        def fail():
+            raise RuntimeError("compute failed")
+
+        with self.assertRaises(RuntimeError):
+            cached_compute("test", "key", fail)
+        self.assertIsNone(cache.get("key_lock"))
+        self.assertEqual(cached_compute("test", "key", self.compute), "value")
+
+
+class FriendshipPairTests(LookupTestCase):
+    '''Одна строка Friendship на пару профилей'''
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.create_profile("first")
+        self.second = self.create_profile("second")
+        self.third = self.create_profile("third")
+
+    def create_friendship(self, profile_one, profile_two, status=FRIENDSHIP_REQUESTED):
+        return Friendship.objects.create(
+            profile_one=profile_one,
+            profile_two=profile_two,
+            status_id=friendship_status_id(status),
+        )
+
+    def test_pair_is_canonical(self):
+        # профили создаются по порядку, поэтому id first < second < third
+        forward = self.create_friendship(self.first, self.second)
+        self.assertEqual((forward.pair_low, forward.pair_high), (self.first.id, self.second.id))
+        self.assertEqual(forward.direction, Friendship.FORWARD)
+
+        backward = self.create_friendship(self.third, self.first)
+        self.assertEqual((backward.pair_low, backward.pair_high), (self.first.id, self.third.id))
+        self.assertEqual(backward.direction, Friendship.BACKWARD)
+
+    def test_between_finds_pair_in_both_orders(self):
+        friendship = self.create_friendship(self.first, self.second)
+        self.assertEqual(Friendship.objects.between(self.first, self.second).get(), friendship)
+        self.assertEqual(Friendship.objects.between(self.second.id, self.first.id).get(), friendship)
+        self.assertFalse(Friendship.objects.between(self.first, self.third).exists())
+
+    def test_one_row_per_pair(self):
+        self.create_friendship(self.first, self.second)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_friendship(self.second, self.first)
+
+    def test_bulk_create_fills_pair(self):
+        Friendship.objects.bulk_create(
+            [
+                Friendship(
+                    profile_one=self.second,
+                    profile_two=self.first,
+                    status_id=friendship_status_id(FRIENDSHIP_FRIENDS),
+                )
+            ]
+        )
+        self.assertTrue(Friendship.objects.between(self.first, self.second).exists())
+
+    def test_update_of_participants_is_rejected(self):
+        self.create_friendship(self.first, self.second)
+        with self.assertRaises(ValueError):
+            Friendship.objects.update(profile_two=self.third)
+        # остальные поля обновлять можно
+        Friendship.objects.update(status_id=friendship_status_id(FRIENDSHIP_FRIENDS))
+
+    def test_bulk_update_refills_pair(self):
+        friendship = self.create_friendship(self.first, self.second)
+        friendship.profile_two = self.third
+        Friendship.objects.bulk_update([friendship], ["profile_two"])
+        self.assertTrue(Friendship.objects.between(self.first, self.third).exists())
+        self.assertFalse(Friendship.objects.between(self.first, self.second).exists())
+
+    def test_block_replaces_friendship(self):
+        self.create_friendship(self.second, self.first, FRIENDSHIP_FRIENDS)
+        pair = Friendship.objects.block(self.first, self.second)
+        self.assertEqual(pair.status_id, friendship_status_id(FRIENDSHIP_BLOCKED))
+        self.assertTrue(pair.is_blocked_by(self.first))
+        self.assertFalse(pair.is_blocked_by(self.second))
+        self.assertEqual(Friendship.objects.between(self.first, self.second).count(), 1)
+
+    def test_counter_block_is_mutual(self):
+        Friendship.objects.block(self.first, self.second)
+        pair = Friendship.objects.block(self.second, self.first)
+        self.assertEqual(pair.direction, Friendship.MUTUAL)
+        self.assertTrue(pair.is_blocked_by(self.first))
+        self.assertTrue(pair.is_blocked_by(self.second))
+
+    def test_unblock_mutual_keeps_other_side(self):
+        Friendship.objects.block(self.first, self.second)
+        Friendship.objects.block(self.second, self.first)
+
+        self.assertTrue(Friendship.objects.unblock(self.first, self.second))
+        pair = Friendship.objects.between(self.first, self.second).get()
+        self.assertNotEqual(pair.direction, Friendship.MUTUAL)
+        self.assertTrue(pair.is_blocked_by(self.second))
+        self.assertFalse(pair.is_blocked_by(self.first))
+
+        self.assertTrue(Friendship.objects.unblock(self.second, self.first))
+        self.assertFalse(Friendship.objects.between(self.first, self.second).exists())
+
+    def test_unblock_by_blocked_side_is_ignored(self):
+        Friendship.objects.block(self.first, self.second)
+        self.assertFalse(Friendship.objects.unblock(self.second, self.first))
+        self.assertFalse(Friendship.objects.unblock(self.first, self.third))
+        self.assertTrue(Friendship.objects.between(self.first, self.second).exists())
+
+    def test_profile_delete_removes_friendship(self):
+        self.create_friendship(self.first, self.second, FRIENDSHIP_FRIENDS)
+        self.second.delete()
+        self.assertFalse(Friendship.objects.exists())
+
+
+class StateFromPairTests(LookupTestCase):
+    '''Состояние отношения по строке Friendship'''
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = self.create_profile("viewer")
+        self.target = self.create_profile("target")
+
+    def pair(self, status, profile_one, profile_two):
+        return Friendship.objects.create(
+            profile_one=profile_one,
+            profile_two=profile_two,
+            status_id=friendship_status_id(status),
+        )
+
+    def test_no_pair(self):
+        self.assertEqual(state_from_pair(None, self.viewer.id), NO_RELATIONSHIP)
+
+    def test_friends(self):
+        pair = self.pair(FRIENDSHIP_FRIENDS, self.target, self.viewer)
+        self.assertEqual(state_from_pair(pair, self.viewer.id), FRIENDS)
+
+    def test_requests(self):
+        pair = self.pair(FRIENDSHIP_REQUESTED, self.viewer, self.target)
+        self.assertEqual(
+            state_from_pair(pair, self.viewer.id), NO_RELATIONSHIP._replace(pending_out=True)
+        )
+        self.assertEqual(
+            state_from_pair(pair, self.target.id), NO_RELATIONSHIP._replace(pending_in=True)
+        )
+
+    def test_blocks(self):
+        pair = Friendship.objects.block(self.viewer, self.target)
+        self.assertEqual(
+            state_from_pair(pair, self.viewer.id), NO_RELATIONSHIP._replace(blocked_out=True)
+        )
+        self.assertEqual(
+            state_from_pair(pair, self.target.id), NO_RELATIONSHIP._replace(blocked_in=True)
+        )
+
+        pair = Friendship.objects.block(self.target, self.viewer)
+        mutual = NO_RELATIONSHIP._replace(blocked_in=True, blocked_out=True)
+        self.assertEqual(state_from_pair(pair, self.viewer.id), mutual)
+        self.assertEqual(state_from_pair(pair, self.target.id), mutual)
+
+
+class MailArchiveTests(LookupTestCase):
+    '''Перенос старой почты в архив с сохранением цепочек ответов'''
+
+    def setUp(self):
+        super().setUp()
+        self.sender = self.create_profile("sender")
+        self.recipient = self.create_profile("recipient")
+        self.old = timezone.now() - timedelta(days=400)
+
+    def mail(self, content, parent=None, old=True):
+        mail = Mail.objects.create(
+            sender=self.sender, recipient=self.recipient, content=content, parent=parent
+        )
+        if old:
+            Mail.objects.filter(id=mail.id).update(timestamp=self.old)
+        return mail
+
+    def make_old(self, *mails):
+        Mail.objects.filter(id__in=[mail.id for mail in mails]).update(timestamp=self.old)
+
+    def threads(self, model):
+        return set(model.objects.values_list("content", "parent__content"))
+
+    def test_old_thread_is_archived_with_parents(self):
+        for batch_size in (1, 500):
+            with self.subTest(batch_size=batch_size):
+                ArchivedMail.objects.all().delete()
+                first = self.mail("first")
+                reply = self.mail("reply", first)
+                self.mail("answer", reply)
+
+                self.assertEqual(clean_mail(batch_size=batch_size), 3)
+                self.assertFalse(Mail.objects.exists())
+                self.assertEqual(
+                    self.threads(ArchivedMail),
+                    {("first", None), ("reply", "first"), ("answer", "reply")},
+                )
+
+    def test_chain_with_recent_reply_stays(self):
+        # P <- R <- S: P и R старые, S свежий. R остается ради S, а P - ради R
+        parent = self.mail("parent")
+        reply = self.mail("reply", parent)
+        self.mail("recent", reply, old=False)
+
+        for batch_size in (1, 2, 500):
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(clean_mail(batch_size=batch_size), 0)
+                connection.check_constraints()
+                self.assertEqual(
+                    self.threads(Mail),
+                    {("parent", None), ("reply", "parent"), ("recent", "reply")},
+                )
+                self.assertFalse(ArchivedMail.objects.exists())
+
+    def test_reply_archived_before_parent_is_relinked(self):
+        # старый ответ уходит в архив, пока родитель держится свежим ответом
+        parent = self.mail("parent")
+        self.mail("old reply", parent)
+        recent = self.mail("recent reply", parent, old=False)
+
+        self.assertEqual(clean_mail(batch_size=1), 1)
+        self.assertEqual(self.threads(ArchivedMail), {("old reply", None)})
+
+        self.make_old(recent)
+        self.assertEqual(clean_mail(batch_size=1), 2)
+        connection.check_constraints()
+        self.assertFalse(Mail.objects.exists())
+        self.assertEqual(
+            self.threads(ArchivedMail),
+            {("parent", None), ("old reply", "parent"), ("recent reply", "parent")},
+        )
+
+
+class FriendsFeedTests(LookupTestCase):
+    '''Лента друзей из TimelineEntry с дочитыванием старых новостей из News'''
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_profile("owner")
+        self.friend = self.create_profile("friend")
+        self.stranger = self.create_profile("stranger")
+        Friendship.objects.create(
+            profile_one=self.owner,
+            profile_two=self.friend,
+            status_id=friendship_status_id(FRIENDSHIP_FRIENDS),
+        )
+        self.start = timezone.now() - timedelta(days=30)
+
+    def post(self, author, day):
+        news = News.objects.create(title=f"{author.firstname} {day}", content="", profile=author)
+        News.objects.filter(id=news.id).update(created_at=self.start + timedelta(days=day))
+        return news
+
+    def titles(self, rows):
+        return [row["title"] for row in rows]
+
+    def test_older_news_are_read_past_the_timeline(self):
+        # новости до появления ленты есть только в News, в ленту попала одна свежая
+        for day in range(4):
+            self.post(self.friend, day)
+        self.post(self.stranger, 5)
+        push_news(self.post(self.friend, 6).id)
+
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.owner).count(), 1)
+        self.assertEqual(
+            self.titles(read_friends_feed(self.owner.id, None, 10)),
+            ["friend 6", "friend 3", "friend 2", "friend 1", "friend 0"],
+        )
+
+    def test_pages_continue_after_trimmed_timeline(self):
+        for day in range(5):
+            push_news(self.post(self.friend, day).id)
+        # в ленте остались только две самые свежие записи
+        TimelineEntry.objects.filter(created_at__lt=self.start + timedelta(days=3)).delete()
+
+        first = read_friends_feed(self.owner.id, None, 3)
+        self.assertEqual(self.titles(first), ["friend 4", "friend 3", "friend 2", "friend 1"])
+
+        cursor = (first[2]["created_at"], first[2]["id"])
+        self.assertEqual(
+            self.titles(read_friends_feed(self.owner.id, cursor, 3)), ["friend 1", "friend 0"]
+        )
+        self.assertEqual(len(read_friends_feed(self.owner.id, None, None)), 5)
+
+    def test_existing_timelines_are_backfilled(self):
+        for day in range(3):
+            self.post(self.friend, day)
+        push_news(self.post(self.friend, 3).id)
+
+        migration = import_module("main.migrations.0030_backfill_timelines")
+        migration.backfill_timelines(apps, None)
+
+        self.assertEqual(
+            list(
+                TimelineEntry.objects.filter(owner=self.owner)
+                .order_by("-created_at")
+                .values_list("news__title", flat=True)
+            ),
+            ["friend 3", "friend 2", "friend 1", "friend 0"],
+        )
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.stranger).exists())
+
+
+class NewsSearchTests(LookupTestCase):
+    '''Полнотекстовый поиск новостей вместе с фильтрами NewsFilter'''
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_profile("author")
+        self.tag = Tag.objects.create(name="питомцы")
+        self.start = timezone.now() - timedelta(days=30)
+
+    def post(self, title, content="", day=0, tags=()):
+        news = News.objects.create(title=title, content=content, profile=self.author)
+        News.objects.filter(id=news.id).update(created_at=self.start + timedelta(days=day))
+        news.tags.set(tags)
+        return news
+
+    def search(self, **params):
+        return list(NewsFilter(params, queryset=News.objects.all()).qs)
+
+    def test_title_match_ranks_first(self):
+        in_content = self.post("Новости дня", "Соседский кот опять на крыше", day=2)
+        in_title = self.post("Кот на крыше", "Снимали всем двором", day=1)
+        self.post("Погода", "Солнечно")
+
+        self.assertEqual(self.search(q="кот"), [in_title, in_content])
+        # поиск по префиксу слова и по тэгам
+        self.assertEqual(self.search(q="крыш"), [in_title, in_content])
+        tagged = self.post("Без слов", tags=[self.tag])
+        self.assertEqual(self.search(q="питомцы"), [tagged])
+
+    def test_filters_apply_before_ranking_limit(self):
+        old = [self.post(f"Кот {day}", day=day, tags=[self.tag]) for day in range(2)]
+        recent = [self.post(f"Кот {day}", day=day) for day in range(10, 15)]
+
+        with mock.patch("main.search.SEARCH_MAX_RESULTS", 2):
+            # раньше лимит отрезал совпадения до фильтра по тэгу - старые новости терялись
+            self.assertEqual(
+                set(self.search(q="кот", tags=[self.tag.id])), set(old)
+            )
+            found = self.search(
+                q="кот", created_at=(self.start + timedelta(days=11)).date().isoformat()
+            )
+            self.assertEqual(set(found), set(recent[1:]))
+            # без фильтров выдача тоже полная: за ранжированными идут остальные совпадения
+            self.assertEqual(len(self.search(q="кот")), 7)
+
+    def test_column_filters(self):
+        in_title = self.post("Кот на крыше", "Снимали всем двором")
+        in_content = self.post("Новости дня", "Соседский кот")
+        tagged = self.post("Двор", "Тишина", tags=[self.tag])
+
+        self.assertEqual(self.search(title="кот"), [in_title])
+        self.assertEqual(self.search(content="кот"), [in_content])
+        self.assertEqual(self.search(title="питомцы"), [])
+        self.assertEqual(self.search(q="двор"), [tagged, in_title])
+
+    def test_tag_names_follow_tags(self):
+        news = self.post("Без слов", tags=[self.tag])
+        news.refresh_from_db()
+        self.assertEqual(news.tag_names, "питомцы")
+
+        self.tag.name = "котики"
+        self.tag.save()
+        self.assertEqual(self.search(q="котики"), [news])
+        self.assertEqual(self.search(q="питомцы"), [])
+
+        news.tags.clear()
+        news.refresh_from_db()
+        self.assertEqual(news.tag_names, "")
+        self.assertEqual(self.search(q="котики"), [])
+
+
+class ProfileNameCacheTests(LookupTestCase):
+    '''LRU-кэш имен профилей в нескольких процессах'''
+
+    def setUp(self):
+        super().setUp()
+        self.profile = self.create_profile("alice")
+
+    def other_worker(self, max_age):
+        # кэш другого воркера с уже закэшированным именем: сигнал в этом процессе до него не доходит
+        names = ProfileNameCache(max_age=max_age)
+        self.assertIsNone(names.get(self.profile.user_id))
+        names.set(self.profile.user_id, (self.profile.id, "alice", "alice"))
+        self.assertIsNotNone(names.get(self.profile.user_id))
+        return names
+
+    def test_rename_is_seen_locally(self):
+        self.assertEqual(get_profile_identity(self.profile.user_id)[1], "alice")
+        self.profile.firstname = "Alice"
+        self.profile.save()
+        self.assertEqual(get_profile_identity(self.profile.user_id)[1], "Alice")
+
+    def test_other_process_sees_change_after_max_age(self):
+        other_worker = self.other_worker(max_age=60)
+
+        bump_namespace(other_worker.namespace)
+        # версия сверяется не чаще раза в max_age секунд
+        self.assertIsNotNone(other_worker.get(self.profile.user_id))
+        with mock.patch("main.profile_names.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(other_worker.get(self.profile.user_id))
+
+    def test_invalidate_bumps_shared_version(self):
+        other_worker = self.other_worker(max_age=0)
+
+        profile_names.invalidate(self.profile.user_id)
+        self.assertIsNone(other_worker.get(self.profile.user_id))
@@ -0,0 +1,257 @@
+"""Материализованная лента новостей друзей (fan-out on write).
+
+При публикации новость раскладывается в ленты (TimelineEntry) всех друзей автора,
+и чтение ленты друзей - это один диапазонный проход по индексу (owner, created_at, news).
+Новости авторов, у которых друзей больше TIMELINE_FANOUT_MAX_FRIENDS, не рассылаются,
+а подмешиваются при чтении (гибридная схема).
+"""
+
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .caching import cached_compute
+from .friend_graph import friends_of
+from .lookups import FRIENDSHIP_FRIENDS, friendship_status_id
+from .models import Friendship, News, TimelineEntry
+from .pagination import keyset_before
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей ленты вставляется за один INSERT
+FANOUT_BATCH_SIZE = 1000
+
+# Ключ кэша со списком авторов, чьи новости подмешиваются при чтении
+SKIPPED_AUTHORS_KEY = "timeline_fanout_skipped"
+
+# Метка "пересборка ленты уже поставлена в очередь" и как долго она живет (сек)
+TIMELINE_REBUILD_KEY = "timeline_rebuild_{}"
+TIMELINE_REBUILD_INTERVAL = 3600
+
+
+def enqueue_on_commit(task, *args):
+    """Ставит задачу Celery в очередь после фиксации транзакции.
+    Недоступный брокер не должен ломать сохранение, поэтому ошибка только логируется"""
+
+    def send():
+        try:
+            task.delay(*args)
+        except Exception as e:
+            logger.error(f"Ошибка постановки задачи {task.name} в очередь: {str(e)}")
+
+    transaction.on_commit(send)
+
+
+def get_friend_ids(profile_id):
+    """Множество id друзей профиля (из индекса графа дружбы)"""
+    return set(friends_of(profile_id))
+
+
+def _count_skipped_authors():
+    counts = Counter()
+    for field in ("profile_one", "profile_two"):
+        for profile_id, total in (
+            Friendship.objects.filter(status_id=friendship_status_id(FRIENDSHIP_FRIENDS))
+            .values_list(field)
+            .annotate(total=Count("id"))
+            .order_by()
+        ):
+            counts[profile_id] += total
+    return sorted(
+        profile_id
+        for profile_id, total in counts.items()
+        if total > settings.TIMELINE_FANOUT_MAX_FRIENDS
+    )
+
+
+def get_fanout_skipped_authors():
+    """Авторы, чьи новости не рассылаются по лентам (пересчитывается раз в 10 минут)"""
+    return set(
+        cached_compute("timeline", SKIPPED_AUTHORS_KEY, _count_skipped_authors, timeout=600)
+    )
+
+
+def push_news(news_id):
+    """Раскладывает новость по лентам друзей автора. Возвращает число записей"""
+    news = News.objects.filter(pk=news_id).values_list("profile_id", "created_at").first()
+    if news is None:
+        return 0
+    author_id, created_at = news
+
+    friend_ids = get_friend_ids(author_id)
+    if len(friend_ids) > settings.TIMELINE_FANOUT_MAX_FRIENDS:
+        # автора читают через подмешивание: сбрасываем список, чтобы он туда попал сразу
+        cache.delete(SKIPPED_AUTHORS_KEY)
+        return 0
+
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                owner_id=friend_id, news_id=news_id, author_id=author_id, created_at=created_at
+            )
+            for friend_id in friend_ids
+        ],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(friend_ids)
+
+
+def backfill(owner_id, author_id, limit=None):
+    """Добавляет в ленту owner последние новости нового друга author"""
+    if author_id in get_fanout_skipped_authors():
+        return 0
+
+    limit = limit or settings.TIMELINE_BACKFILL
+    rows = (
+        News.objects.filter(profile_id=author_id)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at")[:limit]
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                owner_id=owner_id, news_id=news_id, author_id=author_id, created_at=created_at
+            )
+            for news_id, created_at in rows
+        ],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timeline(owner_id)
+    return len(rows)
+
+
+def prune(owner_id, author_id):
+    """Убирает из ленты owner новости бывшего друга author"""
+    return TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()[0]
+
+
+def trim_timeline(owner_id, max_entries=None):
+    """Оставляет в ленте не больше max_entries самых свежих записей"""
+    max_entries = max_entries or settings.TIMELINE_MAX_ENTRIES
+    cutoff = (
+        TimelineEntry.objects.filter(owner_id=owner_id)
+        .order_by("-created_at", "-news_id")
+        .values_list("created_at", "news_id")[max_entries : max_entries + 1]
+        .first()
+    )
+    if cutoff is None:
+        return 0
+
+    created_at, news_id = cutoff
+    return TimelineEntry.objects.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, news_id__lte=news_id),
+        owner_id=owner_id,
+    ).delete()[0]
+
+
+def rebuild(owner_id):
+    """Пересобирает ленту профиля с нуля по текущему списку друзей"""
+    author_ids = get_friend_ids(owner_id) - get_fanout_skipped_authors()
+    rows = (
+        News.objects.filter(profile_id__in=author_ids)
+        .order_by("-created_at", "-id")
+        .values_list("id", "profile_id", "created_at")[: settings.TIMELINE_MAX_ENTRIES]
+    )
+    with transaction.atomic():
+        TimelineEntry.objects.filter(owner_id=owner_id).delete()
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    owner_id=owner_id, news_id=news_id, author_id=author_id, created_at=created_at
+                )
+                for news_id, author_id, created_at in rows
+            ],
+            batch_size=FANOUT_BATCH_SIZE,
+        )
+    return len(rows)
+
+
+def _read_friends_news(profile_id, cursor, limit):
+    # Лента друзей прямым запросом к News: для незаполненной ленты и для новостей старше
+    # последней записи ленты (обрезанных по TIMELINE_MAX_ENTRIES или опубликованных до ленты)
+    stop = None if limit is None else limit + 1
+    news_items = News.objects.filter(profile_id__in=get_friend_ids(profile_id))
+    if cursor is not None:
+        news_items = keyset_before(news_items, cursor)
+    return list(
+        news_items.order_by("-created_at", "-id").values(
+            "id", "title", "image", "created_at"
+        )[:stop]
+    )
+
+
+def _schedule_rebuild(profile_id):
+    # импорт здесь, так как tasks сам импортирует timeline
+    from .tasks import rebuild_friends_timeline
+
+    # не чаще раза в TIMELINE_REBUILD_INTERVAL, пока задача не заполнила ленту
+    if cache.add(TIMELINE_REBUILD_KEY.format(profile_id), True, TIMELINE_REBUILD_INTERVAL):
+        enqueue_on_commit(rebuild_friends_timeline, profile_id)
+
+
+def read_friends_feed(profile_id, cursor, limit):
+    """Страница ленты друзей: limit + 1 строк (id, title, image, created_at) от новых к старым.
+    limit=None - вся лента без постраничного вывода"""
+    stop = None if limit is None else limit + 1
+    entries = TimelineEntry.objects.filter(owner_id=profile_id)
+    if not entries.exists():
+        # Ленты, созданные до появления TimelineEntry, еще не заполнены: читаем напрямую
+        # и ставим пересборку ленты в очередь
+        rows = _read_friends_news(profile_id, cursor, limit)
+        if rows:
+            _schedule_rebuild(profile_id)
+        return rows
+
+    if cursor is not None:
+        entries = keyset_before(entries, cursor, id_field="news_id")
+
+    timeline_rows = [
+        {
+            "id": row["news_id"],
+            "title": row["news__title"],
+            "image": row["news__image"],
+            "created_at": row["created_at"],
+        }
+        for row in entries.order_by("-created_at", "-news_id").values(
+            "news_id", "news__title", "news__image", "created_at"
+        )[:stop]
+    ]
+    rows = list(timeline_rows)
+
+    # Новости друзей с очень большим числом друзей не рассылались - подмешиваем их при чтении
+    skipped = get_fanout_skipped_authors()
+    merged_authors = get_friend_ids(profile_id) & skipped if skipped else set()
+    if merged_authors:
+        news_items = News.objects.filter(profile_id__in=merged_authors)
+        if cursor is not None:
+            news_items = keyset_before(news_items, cursor)
+        rows += list(
+            news_items.order_by("-created_at", "-id").values(
+                "id", "title", "image", "created_at"
+            )[:stop]
+        )
+
+    if stop is None or len(timeline_rows) < stop:
+        # Лента закончилась раньше страницы: более старые новости друзей (обрезанные
+        # из ленты или опубликованные до нее) дочитываем прямым запросом
+        tail = cursor
+        if timeline_rows:
+            tail = (timeline_rows[-1]["created_at"], timeline_rows[-1]["id"])
+        rows += _read_friends_news(
+            profile_id, tail, None if limit is None else limit - len(timeline_rows)
+        )
+
+    if len(rows) > len(timeline_rows):
+        # подмешанные новости могли уже быть в ленте (автор перешел порог после рассылки,
+        # лента заполнена не полностью) - убираем дубли и восстанавливаем порядок
+        rows = list({row["id"]: row for row in rows}.values())
+        rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+
+    return rows[:stop]
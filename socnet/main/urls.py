@@ -31,6 +31,8 @@ urlpatterns = [
     path("news/create/", views.news_create, name="news_create"),
     path("news/<int:pk>/delete/", views.news_delete, name="news_delete"),
     path("news/<int:news_id>/add_comment/", views.add_comment, name="add_comment"),
+    path("news/<int:news_id>/comments/", views.news_comments, name="news_comments"),
+    path("news/<int:news_id>/comments/since/", views.news_comments_since, name="news_comments_since"),
     path("groups_list/",views.GroupListView.as_view(),name="groups_list"),
     path("group/<int:pk>", views.GroupDetailView, name="group"),
     path("groups/invite/<str:username>/<int:pk>/", views.GroupInvite, name="group_invite"),
@@ -49,5 +51,6 @@ urlpatterns = [
     path("mailbox/send_mail_parent", views.send_mail_parent, name="send_mail_parent"),
     path("mailbox/message/<int:mail_id>/", views.message_detail, name="message_detail"),
     path("update_status/", views.update_status, name="update_status"),
+    path("cache_stats/", views.cache_stats_view, name="cache_stats"),
     path("", include(router.urls)),
 ]
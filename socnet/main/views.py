@@ -7,14 +7,17 @@ import re
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.views import LoginView, PasswordChangeView
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login as auth_login
 from django.contrib.auth import authenticate
 from django.contrib.auth import logout
 from django.contrib import messages
+from django.conf import settings
 from django.core.cache import cache
+from django.core.paginator import Paginator
 
-from django.db.models import Case, IntegerField, Prefetch, Sum, When, Q
+from django.db.models import F, Prefetch, Q
 from django.db import transaction
 
 from django.views.generic.edit import FormView, DeleteView, UpdateView, CreateView
@@ -36,19 +39,31 @@ from rest_framework import status, viewsets
 from urllib.parse import urlencode
 
 from .models import (Profile, ActivityLog_norest, Friendship, Mediafile,
-                     StatusProfile, GroupMembership, Status, User, \
-                     Notification_norest, News, FriendshipStatus, Comment,
+                     StatusProfile, GroupMembership, User, \
+                     Notification_norest, News, Comment,
                      Reaction, Mail, Group)
 from .forms import (AvatarUploadForm, GroupCreateForm, GroupSearchForm,
                     LoginUserForm, MailForm, MediaUploadForm, NewsForm,
                     RegistrationForm, UpdateProfileForm, UpdateUserForm,
                     UserPasswordChangeForm)
 from .filters import GroupFilter, NewsFilter, ProfileFilter
+from .pagination import decode_cursor, encode_cursor, keyset_before
+from .comments import (comment_cursor, comments_since, last_comment_cursor,
+                       load_comment_tree, paginate_roots)
+from .search import tag_facets
+from .timeline import read_friends_feed
+from .friend_graph import friends_of
+from .relationships import relationship_state
+from .lookups import (FRIENDSHIP_BLOCKED, FRIENDSHIP_FRIENDS, FRIENDSHIP_REQUESTED,
+                      GROUP_ADMIN, GROUP_USER, PRIVACY_FRIENDS_ONLY, PRIVACY_NOBODY,
+                      friendship_status_id, group_status_id, privacy_levels)
+from .profile_names import get_profile_identity
 
 
 from api.serializers import FriendshipSerializer
 
-from .signals import set_cache_with_key
+from .caching import (cache_get, cache_stats, cached_compute, fits_payload,
+                      namespaced_key, payload_key, unpack_rows)
 
 # создания логгера для хранения ошибок
 logger = logging.getLogger(__name__)
@@ -70,6 +85,14 @@ def index(request):
         return redirect("login")
 
 
+@require_GET
+@staff_member_required
+def cache_stats_view(request):
+    """Статистика попаданий в кэш текущего процесса (только для персонала)"""
+
+    return JsonResponse(cache_stats.snapshot())
+
+
 def chat(request, pk):
     """Функция для получения и передачи id группы на шаблон"""
 
@@ -94,127 +117,109 @@ def chat(request, pk):
 
 
 
-@login_required
-def profile_view(request, username):
-    """Просмотр профиля пользователя"""
-    cache_key = f"profile_{username}"
-    profile = cache.get(cache_key)
-
-    # Получение профиля пользователя
-    if not profile:
-        profile = get_object_or_404(Profile, user__username=username)
-        cache.set(cache_key, profile, 86400)  # Кэшируем профиль
+def get_profile_friends(profile):
+    """Функция получения списка друзей профиля вместе с аватарами"""
 
-    # Проверяем, является ли текущий пользователь владельцем профиля (нужно для кнопки)
-    is_owner = request.user.username == username
-
-    # Проверка уровня конфиденциальности профиля (нужно для отображения)
-    privacy_level = profile.privacy
-
-    avatar = profile.media_files.filter(file_type="avatar").last()
-
-    # Определяем, есть ли дружба между текущим пользователем и владельцем профиля
-    friendship_exists = (
-        Friendship.objects.filter(
-            profile_one__user=request.user, profile_two=profile, status__name="Друзья"
-        ).exists()
-        or Friendship.objects.filter(
-            profile_one=profile, profile_two__user=request.user, status__name="Друзья"
-        ).exists()
+    # id друзей берем из индекса графа дружбы, профили с пользователями и аватарами - одним проходом
+    return list(
+        Profile.objects.filter(id__in=friends_of(profile.id))
+        .select_related("user")
+        .prefetch_related(
+            Prefetch(
+                "media_files",
+                queryset=Mediafile.objects.filter(file_type="avatar"),
+                to_attr="avatars",
+            )
+        )
     )
 
-    # Определяем всех друзей профиля
-
-    if friendship_exists or is_owner:
-        cache_key = f"friends_{username}"
-        friends_profiles = cache.get(cache_key)
-
-        if not friends_profiles:
-
-            friends_profiles = []
 
-            if friendship_exists or is_owner is True:
-                # Предварительная загрузка аватаров
-                avatars_prefetch = Prefetch(
-                    "media_files",
-                    queryset=Mediafile.objects.filter(file_type="avatar"),
-                    to_attr="avatars",
-                )
+def get_profile_for_view(username):
+    """Функция получения профиля для страницы профиля вместе с аватарами, интересами и приватностью"""
 
-                # Получаем все дружеские связи и загружаем связанные профили, пользователей и аватары
-                friendships = (
-                    Friendship.objects.filter(
-                        Q(status__name="Друзья")
-                        & (Q(profile_one=profile) | Q(profile_two=profile))
-                    )
-                    .select_related("profile_one__user", "profile_two__user")
-                    .prefetch_related(
-                        Prefetch(
-                            "profile_one__media_files",
-                            queryset=Mediafile.objects.filter(file_type="avatar"),
-                            to_attr="avatars",
-                        ),
-                        Prefetch(
-                            "profile_two__media_files",
-                            queryset=Mediafile.objects.filter(file_type="avatar"),
-                            to_attr="avatars",
-                        ),
-                    )
-                )
+    return get_object_or_404(
+        Profile.objects.select_related("user", "privacy").prefetch_related(
+            "interests",
+            Prefetch(
+                "media_files",
+                queryset=Mediafile.objects.filter(file_type="avatar").order_by("id"),
+                to_attr="avatars",
+            ),
+        ),
+        user__username=username,
+    )
 
-                # Проходим по каждому объекту Friendship и добавляем профиль друга в список
-                for friendship in friendships:
-                    if friendship.profile_one == profile:
-                        # Если profile — profile_one, добавляем profile_two в список друзей
-                        friends_profiles.append(friendship.profile_two)
-                    else:
-                        # Иначе добавляем profile_one в список друзей
-                        friends_profiles.append(friendship.profile_one)
 
-            # Убираем дубликаты, если они есть
-            friends_profiles = list(set(friends_profiles))
+@login_required
+def profile_view(request, username):
+    """Просмотр профиля пользователя"""
+    # Получение профиля пользователя (кэшируется на сутки вместе с аватаром, интересами и приватностью)
+    profile = cached_compute(
+        "profile",
+        f"profile_{username}",
+        lambda: get_profile_for_view(username),
+    )
 
-        cache.set(cache_key, friends_profiles, 86400)  # Кэшируем список на 10 минут
+    # Проверяем, является ли текущий пользователь владельцем профиля (нужно для кнопки)
+    is_owner = request.user.username == username
 
+    # Проверка уровня конфиденциальности профиля (нужно для отображения)
+    privacy_level_id = profile.privacy_id
 
-    # Проверяемся на баны с обоих сторон (нужно для кнопок)
+    avatar = profile.avatars[-1] if profile.avatars else None
 
-    ban_exists_out = Friendship.objects.filter(
-        profile_one__user=request.user, profile_two=profile, status__name="Заблокирован"
-    ).exists()
-    ban_exists_in = Friendship.objects.filter(
-        profile_one=profile, profile_two__user=request.user, status__name="Заблокирован"
-    ).exists()
+    viewer = get_profile_identity(request.user.id)
+    viewer_id = viewer[0] if viewer is not None else None
 
-    # Определяем, есть ли входящий запрос на дружбу (нужно для кнопок)
-    incoming_friend_requests = Friendship.objects.filter(
-        profile_two=request.user.profile, status__name="Отправлен запрос"
-    )
+    # Связь с владельцем профиля (дружба, заявки, баны - нужно для кнопок):
+    # для друзей - индекс графа дружбы без запроса, иначе одна строка пары
+    relationship = relationship_state(viewer_id, profile.id)
+    friendship_exists = relationship.friends
+    ban_exists_out = relationship.blocked_out
+    ban_exists_in = relationship.blocked_in
 
-    # Определяем, кто отправил запрос, если таковой имеется
+    # Определяем, есть ли входящий запрос на дружбу и кто его отправил
+    incoming_friend_requests = []
+    if viewer_id is not None:
+        incoming_friend_requests = list(
+            Friendship.objects.filter(
+                profile_two_id=viewer_id, status_id=friendship_status_id(FRIENDSHIP_REQUESTED)
+            ).select_related("profile_one__user")
+        )
     friend_request_senders = [
         request.profile_one
         for request in incoming_friend_requests
         if request.profile_one
     ]
 
-    try:
-        is_status = StatusProfile.objects.get(profile=profile)
-    except StatusProfile.DoesNotExist:
-        is_status = None
-
-    status_instance = get_object_or_404(Status, id=2)
+    # Определяем всех друзей профиля (список видят только друзья и владелец)
+    friends_profiles = []
 
-    is_admin_groups = GroupMembership.objects.filter(
-        profile=request.user.profile, status=status_instance
-    ).select_related("group")
+    if friendship_exists or is_owner:
+        # Список друзей кэшируется на сутки
+        friends_profiles = cached_compute(
+            "friends", f"friends_{username}", lambda: get_profile_friends(profile)
+        )
 
-    # ищем группы в которых состоит пользователь
+    is_status = StatusProfile.objects.filter(profile_id=profile.id).first()
 
-    group_list = GroupMembership.objects.filter(profile=profile).select_related("group")
+    # Одним запросом: группы, где текущий пользователь администратор,
+    # и группы, в которых состоит владелец профиля
+    admin_status_id = group_status_id(GROUP_ADMIN)
+    memberships = list(
+        GroupMembership.objects.filter(
+            Q(profile_id=profile.id) | Q(profile_id=viewer_id, status_id=admin_status_id)
+        ).select_related("group")
+    )
+    is_admin_groups = [
+        membership
+        for membership in memberships
+        if membership.profile_id == viewer_id and membership.status_id == admin_status_id
+    ]
+    group_list = [membership for membership in memberships if membership.profile_id == profile.id]
 
     # Определяем видимость профиля в зависимости от уровня конфиденциальности и дружбы
-    if privacy_level.name == "Никто" and not is_owner:
+    if privacy_level_id == privacy_levels.get(PRIVACY_NOBODY) and not is_owner:
         context = {
             "profile": {
                 "firstname": profile.firstname,
@@ -233,7 +238,9 @@ def profile_view(request, username):
             "username": username,
         }
     elif (
-        privacy_level.name == "Только друзья" and not friendship_exists and not is_owner
+        privacy_level_id == privacy_levels.get(PRIVACY_FRIENDS_ONLY)
+        and not friendship_exists
+        and not is_owner
     ):
         context = {
             "profile": {
@@ -274,23 +281,39 @@ def profile_view(request, username):
     return render(request, "main/profile.html", context)
 
 
+# Поля компактной записи фотографии в кэше
+MEDIA_ROW_FIELDS = ("id", "url")
+
+
+def get_profile_media_rows(username):
+    """Функция получения фотографий профиля (кроме аватара) в виде кортежей"""
+
+    profile = get_object_or_404(Profile, user__username=username)
+    storage = Mediafile._meta.get_field("file").storage
+
+    return [
+        (media_id, storage.url(name))
+        for media_id, name in Mediafile.objects.filter(profile=profile)
+        .exclude(file_type="avatar")
+        .values_list("id", "file")
+    ]
+
+
 def profile_media(request, username):
     """Функция отображения фотографий пользователя"""
 
-    cache_key = f"media_{username}"
-    photos = cache.get(cache_key)
-
     is_owner = request.user.username == username
-    user = User.objects.get(username=username)
 
-    # Получаем профиль получай фотки по профилю
-    if not photos:
-        profile = Profile.objects.get(user__username=username)
-        photos = Mediafile.objects.filter(profile=profile).exclude(file_type="avatar")
-        cache.set(cache_key, photos, 86400)  # Кэшируем на сутки
+    # В кэше лежат только (id, url) фотографий, а не QuerySet
+    photos = cached_compute(
+        "media",
+        payload_key(f"media_{username}"),
+        lambda: get_profile_media_rows(username),
+        cache_if=fits_payload,
+    )
 
     context = {
-        "photos": photos,
+        "photos": unpack_rows(MEDIA_ROW_FIELDS, photos),
         "is_owner": is_owner,
         "username": username,
     }
@@ -688,41 +711,89 @@ class LogoutUser(View):
         return redirect("home")
 
 
-def profile_list(request):
-    """Функция получения списка пользователей с учетом фильтров"""
+# Поля компактной записи профиля в кэше списка профилей
+PROFILE_ROW_FIELDS = (
+    "id", "username", "firstname", "lastname", "age", "gender",
+    "location", "link", "interests", "avatar_url",
+)
 
-    # Получаем параметры фильтра из запроса
-    query_params = request.GET.dict()
 
-    # Создаем уникальный ключ кэша на основе параметров фильтра
-    cache_key = f"profile_list_{generate_cache_key(request)}"
-    profile_items = cache.get(cache_key)
+def get_profile_list_rows(queryset):
+    """Функция получения списка профилей в виде кортежей (три запроса на весь список)"""
 
-    # Создаем экземпляр фильтра
-    profile_filter = ProfileFilter(
-        request.GET,
-        queryset=Profile.objects.select_related("user").prefetch_related("media_files"),
+    profiles = list(
+        queryset.values_list(
+            "id", "user__username", "firstname", "lastname",
+            "age", "gender", "location", "link",
+        )
     )
+    profile_ids = [profile[0] for profile in profiles]
+
+    # Интересы всех профилей одним запросом
+    interests = {}
+    for profile_id, name in Profile.interests.through.objects.filter(
+        profile_id__in=profile_ids
+    ).values_list("profile_id", "interest__name"):
+        interests.setdefault(profile_id, []).append(name)
+
+    # Аватары всех профилей одним запросом (при нескольких берем последний загруженный)
+    storage = Mediafile._meta.get_field("file").storage
+    avatars = {
+        profile_id: storage.url(name)
+        for profile_id, name in Mediafile.objects.filter(
+            file_type="avatar", profile_id__in=profile_ids
+        )
+        .order_by("id")
+        .values_list("profile_id", "file")
+    }
+
+    return [
+        (*profile, tuple(interests.get(profile[0], ())), avatars.get(profile[0]))
+        for profile in profiles
+    ]
+
+
+def get_profile_list_page(queryset, page_number):
+    """Функция получения страницы списка профилей: (кортежи профилей, номер страницы, число страниц).
+    Порядок queryset сохраняется (при поиске по имени - по релевантности)"""
 
-    if profile_items is None:
-        # Получаем отфильтрованный список профилей
-        profile_items = profile_filter.qs
+    page = Paginator(queryset, settings.PROFILE_LIST_PAGE_SIZE).get_page(page_number)
+    page_ids = list(page.object_list.values_list("id", flat=True))
 
-        # Кэшируем результат на сутки
-        set_cache_with_key(cache_key, profile_items, 86400)
+    rows = {
+        row[0]: row
+        for row in get_profile_list_rows(Profile.objects.filter(id__in=page_ids))
+    }
+    return [rows[profile_id] for profile_id in page_ids], page.number, page.paginator.num_pages
+
+
+def profile_list(request):
+    """Функция получения списка пользователей с учетом фильтров и поиска по имени"""
 
-    # Получаем аватары для отфильтрованных профилей
-    avatar_items = Mediafile.objects.filter(
-        file_type="avatar", profile__in=profile_items
+    # Создаем экземпляр фильтра
+    profile_filter = ProfileFilter(request.GET, queryset=Profile.objects.order_by("id"))
+
+    # Создаем уникальный ключ кэша на основе параметров фильтра и номера страницы.
+    # В кэше лежат кортежи с полями, которые выводит шаблон, поэтому попадание не делает запросов
+    profile_rows, page_number, num_pages = cached_compute(
+        "profile_list",
+        namespaced_key("profile_list", payload_key(generate_cache_key(request))),
+        lambda: get_profile_list_page(profile_filter.qs, request.GET.get("page")),
+        cache_if=lambda page: fits_payload(page[0]),
     )
 
-    # Создаем словарь для хранения аватаров по профилям
-    avatars = {avatar.profile.id: avatar for avatar in avatar_items}
+    # Параметры фильтра без номера страницы - для ссылок пагинации
+    query_params = request.GET.copy()
+    query_params.pop("page", None)
 
     context = {
-        "profile_items": profile_items,
-        "avatars": avatars,
+        "profile_items": unpack_rows(PROFILE_ROW_FIELDS, profile_rows),
         "profile_filter": profile_filter,
+        "page_number": page_number,
+        "num_pages": num_pages,
+        "previous_page": page_number - 1 if page_number > 1 else None,
+        "next_page": page_number + 1 if page_number < num_pages else None,
+        "query_params": query_params.urlencode(),
     }
 
     return render(request, "main/profile_list.html", context)
@@ -735,32 +806,37 @@ class NewsListView(LoginRequiredMixin, ListView):
     template_name = "main/news_list.html"
     context_object_name = "news"
 
+    def get_queryset(self):
+        # автор и тэги выводятся в списке - загружаем их вместе с новостями
+        return News.objects.select_related("profile").prefetch_related("tags")
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         # Создаем ключ для кэша, который будет уникальным для текущего запроса (учитывая GET параметры)
-        cache_key = f"news_filter_{generate_cache_key(self.request)}"
+        cache_key = namespaced_key("news_filter", generate_cache_key(self.request))
 
         # Пробуем получить данные из кэша
-        cached_data = cache.get(cache_key)
+        cached_data = cache_get("news_filter", cache_key)
+
+        # Фильтр нужен в любом случае - для формы; запросы он выполняет только при обращении к qs
+        filterset = NewsFilter(self.request.GET, queryset=self.get_queryset())
+        context["filterset"] = filterset
 
         if cached_data:
             # Если данные есть в кэше, используем их
             context["news"] = cached_data["news"]  # Восстанавливаем объекты новостей
-            filterset_params = cached_data["filterset_params"]
-            filterset = NewsFilter(filterset_params, queryset=self.get_queryset())
-            context["filterset"] = filterset
-            context["news"] = filterset.qs
+            context["tag_facets"] = cached_data["tag_facets"]
         else:
-            # Если нет, применяем фильтр
-            filterset = NewsFilter(self.request.GET, queryset=self.get_queryset())
-            context["filterset"] = filterset
-            context["news"] = filterset.qs
+            # Если нет, применяем фильтр (поиск отдает новости в порядке релевантности)
+            context["news"] = list(filterset.qs)
+            context["tag_facets"] = tag_facets(filterset.qs)
 
-            set_cache_with_key(cache_key, {
-                "news": list(context["news"]),  # Кэшируем сами объекты новостей
+            cache.set(cache_key, {
+                "news": context["news"],  # Кэшируем сами объекты новостей
+                "tag_facets": context["tag_facets"],
                 "filterset_params": self.request.GET.dict()
-            })
+            }, 86400)
 
         return context
 
@@ -775,106 +851,121 @@ def news_list_api(request):
     )  # Получаем профиль текущего авторизованного пользователя
     filter_type = request.GET.get("filter", "all")
 
-    if filter_type == "mine":
-        news_items = News.objects.filter(profile=user).order_by("-created_at")
-    elif filter_type == "friends":
-        # Фильтруем друзей текущего пользователя через модель Friendship
-        # Предположим, статус дружбы 'Друзья' имеет name='Друзья'
-        friends_status = FriendshipStatus.objects.get(name="Друзья")
-
-        # Находим все дружеские связи, где текущий пользователь участвует
-        friendships_as_one = Friendship.objects.filter(
-            profile_one=user, status=friends_status
-        )
-        friendships_as_two = Friendship.objects.filter(
-            profile_two=user, status=friends_status
-        )
-
-        # Собираем идентификаторы профилей друзей
-        friend_ids = set()
-        for friendship in friendships_as_one:
-            if friendship.profile_two:  # Убеждаемся, что профили не NULL
-                friend_ids.add(friendship.profile_two.id)
-        for friendship in friendships_as_two:
-            if friendship.profile_one:
-                friend_ids.add(friendship.profile_one.id)
-
-        # Фильтруем новости друзей
-        news_items = News.objects.filter(profile_id__in=friend_ids).order_by(
-            "-created_at"
+    # Размер страницы и курсор (позиция последней новости предыдущей страницы).
+    # Без limit и cursor отдается весь список: так его запрашивает собранный фронтенд
+    paginated = "limit" in request.GET or "cursor" in request.GET
+    limit = None
+    if paginated:
+        try:
+            limit = int(request.GET.get("limit", settings.NEWS_FEED_PAGE_SIZE))
+        except ValueError:
+            limit = settings.NEWS_FEED_PAGE_SIZE
+        limit = max(1, min(limit, settings.NEWS_FEED_MAX_PAGE_SIZE))
+
+    cursor_param = request.GET.get("cursor")
+    cursor = decode_cursor(cursor_param)
+    if cursor_param and cursor is None:
+        return JsonResponse({"error": "Неверный курсор"}, status=400)
+
+    if filter_type == "friends":
+        # Лента друзей читается из материализованной ленты (TimelineEntry)
+        rows = read_friends_feed(user.id, cursor, limit)
+    else:
+        if filter_type == "mine":
+            news_items = News.objects.filter(profile=user)
+        else:  # filter_type == 'all'
+            news_items = News.objects.all()
+
+        if cursor is not None:
+            news_items = keyset_before(news_items, cursor)
+
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+        rows = list(
+            news_items.order_by("-created_at", "-id").values(
+                "id", "title", "image", "created_at"
+            )[: None if limit is None else limit + 1]
         )
 
-    else:  # filter_type == 'all'
-        news_items = News.objects.all().order_by("-created_at")
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
 
     # Преобразуем данные в формат JSON, добавляя полный путь к изображению
+    # (адрес сайта вычисляется один раз на страницу)
+    storage = News._meta.get_field("image").storage
+    site_url = request.build_absolute_uri("/")[:-1]
     data = [
         {
-            "id": item.id,
-            "title": item.title,
-            "image": request.build_absolute_uri(item.image.url) if item.image else "",
+            "id": item["id"],
+            "title": item["title"],
+            "image": site_url + storage.url(item["image"]) if item["image"] else "",
         }
-        for item in news_items
+        for item in rows
     ]
-    return JsonResponse(data, safe=False)
+    response = JsonResponse(data, safe=False)
 
+    # Тело ответа остается массивом (его ждет фронтенд), курсор следующей страницы - в заголовках
+    if next_cursor is not None:
+        next_url = request.build_absolute_uri(
+            f"{request.path}?{urlencode({'filter': filter_type, 'limit': limit, 'cursor': next_cursor})}"
+        )
+        response["X-Next-Cursor"] = next_cursor
+        response["Link"] = f'<{next_url}>; rel="next"'
+    return response
 
-@login_required
-def news_detail(request, pk):
-    """Функция получения и вывода новости по id"""
 
-    # Ключ для кэша конкретной новости
-    cache_key = f"news_detail_{pk}"
+def get_news_detail_data(pk):
+    """Функция получения общих для всех пользователей данных новости: сама новость, комментарии и рейтинг"""
 
-    # Пытаемся получить новость из кэша
-    context = cache.get(cache_key)
+    news_item = get_object_or_404(News.objects.select_related("profile__user"), pk=pk)
 
-    if not context:
-        # Если в кэше нет, загружаем данные из базы
-        news_item = get_object_or_404(News, pk=pk)
+    # Дерево комментариев загружается одним запросом и кэшируется вместе с новостью
+    comment_tree = load_comment_tree(news_item.id)
 
-        # Получаем состояние реакции пользователя
-        content_type = ContentType.objects.get_for_model(news_item)
-        root_comments = Comment.objects.filter(
-            news=news_item, parent__isnull=True
-        ).select_related("author")
+    return {
+        "news_item": news_item,
+        "comment_tree": comment_tree,
+        "last_comment_cursor": last_comment_cursor(comment_tree),
+        # рейтинг берется из денормализованных счетчиков новости
+        "total_score": news_item.score,
+    }
 
-        # Получение реакции пользователя
-        try:
-            reaction = Reaction.objects.get(
-                profile=request.user.profile,
-                content_type=content_type,
-                object_id=news_item.id,
-            )
-            user_reaction = reaction.reaction_type
-        except Reaction.DoesNotExist:
-            user_reaction = None
 
-        # Рассчитываем рейтинг новостей
-        reactions = Reaction.objects.filter(
-            content_type=content_type, object_id=news_item.id
-        )
-        total_reactions = reactions.aggregate(
-            total_score=Sum(
-                Case(
-                    When(reaction_type="like", then=1),
-                    When(reaction_type="dislike", then=-1),
-                    output_field=IntegerField(),
-                )
-            )
+@login_required
+def news_detail(request, pk):
+    """Функция получения и вывода новости по id"""
+
+    # Данные новости общие для всех пользователей и кэшируются на сутки
+    news_data = cached_compute(
+        "news_detail", f"news_detail_{pk}", lambda: get_news_detail_data(pk)
+    )
+    news_item = news_data["news_item"]
+
+    # Реакция и владение зависят от пользователя и в общий кэш не попадают.
+    # Реакция - один запрос по индексу (profile, content_type, object_id), владение - без запросов
+    user_reaction = (
+        Reaction.objects.filter(
+            profile__user_id=request.user.id,
+            content_type=ContentType.objects.get_for_model(News),
+            object_id=news_item.id,
         )
-        total_score = total_reactions["total_score"] or 0
+        .values_list("reaction_type", flat=True)
+        .first()
+    )
 
-        context = {
-            "news_item": news_item,
-            "root_comments": root_comments,
-            "is_owner": request.user == news_item.profile.user,
-            "user_reaction": user_reaction,
-            "total_score": total_score,
-        }
+    # Первая страница корневых веток, остальные догружаются через news_comments
+    root_comments, comments_next_cursor = paginate_roots(news_data["comment_tree"])
 
-        # Кэшируем результат на сутки
-        cache.set(cache_key, context, 86400)
+    context = {
+        "news_item": news_item,
+        "total_score": news_data["total_score"],
+        "root_comments": root_comments,
+        "comments_next_cursor": comments_next_cursor,
+        "comments_since_cursor": news_data["last_comment_cursor"],
+        "is_owner": news_item.profile.user_id == request.user.id,
+        "user_reaction": user_reaction,
+    }
 
     return render(request, "main/news_detail.html", context)
 
@@ -1001,83 +1092,70 @@ def reaction_toggle(request):
         reaction_type = request.POST.get("reaction_type")
         user = request.user
 
+        if reaction_type not in Reaction.COUNTER_FIELDS:
+            return JsonResponse({"error": "Неверный тип реакции."}, status=400)
+
         try:
-            news_item = News.objects.get(pk=object_id)
-            content_type = ContentType.objects.get_for_model(news_item)
-
-            # Получаем существующую реакцию пользователя, если она есть
-            reaction, created = Reaction.objects.get_or_create(
-                profile=user.profile,
-                content_type=content_type,
-                object_id=news_item.id,
-                defaults={"reaction_type": reaction_type},
-            )
+            content_type = ContentType.objects.get_for_model(News)
+
+            # Реакция и счетчики новости меняются в одной транзакции,
+            # строка новости блокируется, чтобы параллельные нажатия не сбили счетчики
+            with transaction.atomic():
+                news_item = News.objects.select_for_update().only("id").get(pk=object_id)
+
+                # Получаем существующую реакцию пользователя, если она есть
+                reaction, created = Reaction.objects.get_or_create(
+                    profile=user.profile,
+                    content_type=content_type,
+                    object_id=news_item.id,
+                    defaults={"reaction_type": reaction_type},
+                )
 
-            if not created:
-                # Если реакция уже есть, проверяем ее тип
-                if reaction.reaction_type == reaction_type:
+                counters = {}
+                if created:
+                    # Реакция была создана
+                    action = "created"
+                    counters[Reaction.COUNTER_FIELDS[reaction_type]] = 1
+                elif reaction.reaction_type == reaction_type:
                     # Удаляем реакцию, если пользователь нажал на ту же кнопку
+                    # (счетчик уменьшает сигнал post_delete - он же срабатывает при каскадном удалении)
                     reaction.delete()
                     action = "removed"
                     reaction_type = None
-
-                    try:
-                        profile = Profile.objects.get(user=user)
-                        log_user_activity(
-                            profile,
-                            ActivityLog_norest.NEWS,
-                            "Пользователь изменил реакцию",
-                        )
-                    except Exception as e:
-                        # Логируем ошибку
-                        logger.error(f"Ошибка логирования активности: {str(e)}")
-
                 else:
                     # Обновляем тип реакции
+                    counters[Reaction.COUNTER_FIELDS[reaction.reaction_type]] = -1
+                    counters[Reaction.COUNTER_FIELDS[reaction_type]] = 1
                     reaction.reaction_type = reaction_type
                     reaction.save()
                     action = "updated"
-                # Пересчитываем рейтинг
-                total_reactions = Reaction.objects.filter(
-                    content_type=content_type, object_id=news_item.id
-                ).aggregate(
-                    total_score=Sum(
-                        Case(
-                            When(reaction_type="like", then=1),
-                            When(reaction_type="dislike", then=-1),
-                            output_field=IntegerField(),
-                        )
+
+                if counters:
+                    News.objects.filter(pk=news_item.id).update(
+                        **{field: F(field) + delta for field, delta in counters.items()}
                     )
-                )
-                total_score = total_reactions["total_score"] or 0
-                return JsonResponse(
-                    {
-                        "action": action,
-                        "reaction_type": reaction_type,
-                        "total_score": total_score,
-                    }
-                )
-            else:
-                # Реакция была создана
-                total_reactions = Reaction.objects.filter(
-                    content_type=content_type, object_id=news_item.id
-                ).aggregate(
-                    total_score=Sum(
-                        Case(
-                            When(reaction_type="like", then=1),
-                            When(reaction_type="dislike", then=-1),
-                            output_field=IntegerField(),
-                        )
+                like_count, dislike_count = News.objects.filter(
+                    pk=news_item.id
+                ).values_list("like_count", "dislike_count").get()
+
+            if action == "removed":
+                try:
+                    log_user_activity(
+                        user.profile,
+                        ActivityLog_norest.NEWS,
+                        "Пользователь изменил реакцию",
                     )
-                )
-                total_score = total_reactions["total_score"] or 0
-                return JsonResponse(
-                    {
-                        "action": "created",
-                        "reaction_type": reaction_type,
-                        "total_score": total_score,
-                    }
-                )
+                except Exception as e:
+                    # Логируем ошибку
+                    logger.error(f"Ошибка логирования активности: {str(e)}")
+
+            return JsonResponse(
+                {
+                    "action": action,
+                    "reaction_type": reaction_type,
+                    "total_score": like_count - dislike_count,
+                }
+            )
 
         except News.DoesNotExist:
             return JsonResponse({"error": "Новость не найдена."}, status=404)
@@ -1085,26 +1163,75 @@ def reaction_toggle(request):
     return JsonResponse({"error": "Неверный запрос."}, status=400)
 
 
+@require_GET
+@login_required
+def news_comments(request, news_id):
+    """Функция получения следующей страницы корневых веток комментариев (?cursor=)"""
+
+    cursor_param = request.GET.get("cursor")
+    cursor = decode_cursor(cursor_param)
+    if cursor_param and cursor is None:
+        return JsonResponse({"error": "Неверный курсор"}, status=400)
+
+    # Дерево берется из общего кэша новости
+    news_data = cached_compute(
+        "news_detail", f"news_detail_{news_id}", lambda: get_news_detail_data(news_id)
+    )
+    root_comments, next_cursor = paginate_roots(news_data["comment_tree"], cursor)
+
+    comments_html = render_to_string(
+        "main/partial_comments.html", {"root_comments": root_comments}, request=request
+    )
+    return JsonResponse({"comments_html": comments_html, "next_cursor": next_cursor})
+
+
+@require_GET
+@login_required
+def news_comments_since(request, news_id):
+    """Функция получения комментариев, добавленных после курсора ?since= (любой глубины)"""
+
+    cursor_param = request.GET.get("since")
+    cursor = decode_cursor(cursor_param)
+    if cursor_param and cursor is None:
+        return JsonResponse({"error": "Неверный курсор"}, status=400)
+
+    comments = comments_since(news_id, cursor)
+
+    data = [
+        {
+            "id": comment.id,
+            "parent_id": comment.parent_id,
+            "html": render_to_string(
+                "main/partial_comment.html", {"comment": comment}, request=request
+            ),
+        }
+        for comment in comments
+    ]
+    since = comment_cursor(comments[-1]) if comments else cursor_param
+    return JsonResponse({"comments": data, "since": since})
+
+
 def add_comment(request, news_id):
-    """Функция добавления комменатия"""
+    """Функция добавления комменатия.
+    Возвращает только HTML нового комментария и id контейнера, в конец которого его нужно вставить"""
 
     if request.method == "POST":
         text = request.POST.get("text")
-        parent_id = request.POST.get("parent_id")
-        news_item = News.objects.get(pk=news_id)
+        parent_id = request.POST.get("parent_id") or None
+        news_item = get_object_or_404(News.objects.only("id"), pk=news_id)
+        profile = request.user.profile
 
         # Логика добавления комментария
-        Comment.objects.create(
-            news=news_item, text=text, parent_id=parent_id, author=request.user.profile
+        comment = Comment.objects.create(
+            news=news_item, text=text, parent_id=parent_id, author=profile
         )
+        comment.children = []
 
-        # Рендеринг обновленного списка комментариев
-        comments_html = render_to_string(
-            "main/partial_comments.html",
-            {"root_comments": news_item.comments.filter(parent=None)},
+        # Рендеринг только нового комментария (у него еще нет ответов)
+        comment_html = render_to_string(
+            "main/partial_comment.html", {"comment": comment}, request=request
         )
-
-        profile = Profile.objects.get(user=request.user)
+        container = f"comment-children-{parent_id}" if parent_id else "comment-roots"
 
         try:
             log_user_activity(
@@ -1115,7 +1242,14 @@ def add_comment(request, news_id):
             logger.error(f"Ошибка логирования активности: {str(e)}")
 
         messages.success(request, "Комментарий успешно добавлен!")
-        return JsonResponse({"comments_html": comments_html})
+        return JsonResponse(
+            {
+                "comment_id": comment.id,
+                "parent_id": comment.parent_id,
+                "container": container,
+                "comment_html": comment_html,
+            }
+        )
 
 
 class FriendshipViewSet(viewsets.ModelViewSet):
@@ -1146,24 +1280,22 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        if Friendship.objects.filter(
-            (
-                Q(profile_one=profile_one, profile_two=profile_two)
-                | Q(profile_one=profile_two, profile_two=profile_one)
-            )
-            & ~Q(
-                status__name="Заблокирован"
-            )  # Добавим условие, чтобы не учитывать заблокированные
-        ).exists():
+        # Между двумя профилями может быть только одна связь (дружба, заявка или блокировка)
+        existing = Friendship.objects.between(profile_one, profile_two).first()
+        if existing is not None:
+            if existing.status_id == friendship_status_id(FRIENDSHIP_BLOCKED):
+                detail = "Нельзя отправить запрос: пользователь заблокирован"
+            else:
+                detail = "Вы уже друзья или запрос уже отправлен"
             return JsonResponse(
-                {"detail": "Вы уже друзья или запрос уже отправлен"},
+                {"detail": detail},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # ищем запросы по статусу
-        friendship_status = FriendshipStatus.objects.get(name="Отправлен запрос")
         friendship = Friendship.objects.create(
-            profile_one=profile_one, profile_two=profile_two, status=friendship_status
+            profile_one=profile_one,
+            profile_two=profile_two,
+            status_id=friendship_status_id(FRIENDSHIP_REQUESTED),
         )
 
         try:
@@ -1197,7 +1329,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
-            if friendship.status.name != "Отправлен запрос":
+            if friendship.status_id != friendship_status_id(FRIENDSHIP_REQUESTED):
                 return JsonResponse(
                     {
                         "detail": "Невозможно принять запрос. Запрос не найден или уже принят"
@@ -1205,7 +1337,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            friendship.status = FriendshipStatus.objects.get(name="Друзья")
+            friendship.status_id = friendship_status_id(FRIENDSHIP_FRIENDS)
             friendship.save()
 
             try:
@@ -1241,24 +1373,8 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         profile_one = request.user.profile
         profile_two = Profile.objects.get(id=pk)
 
-        # Проверяем наличие дружбы или запроса на дружбу
-        existing_friendship = Friendship.objects.filter(
-            (
-                Q(profile_one=profile_one, profile_two=profile_two)
-                | Q(profile_one=profile_two, profile_two=profile_one)
-            )
-            & Q(status__name__in=["Друзья", "Отправлен запрос"])
-        ).first()  # Используем first() для получения первого найденного объекта или None
-
-        if existing_friendship:
-            # Удаляем существующую дружбу или запрос на дружбу
-            existing_friendship.delete()
-
-        # Создаем запись о блокировке
-        friendship_status = FriendshipStatus.objects.get(name="Заблокирован")
-        Friendship.objects.create(
-            profile_one=profile_one, profile_two=profile_two, status=friendship_status
-        )
+        # Дружба или запрос на дружбу заменяются блокировкой (одна строка на пару профилей)
+        Friendship.objects.block(profile_one, profile_two)
 
         try:
             log_user_activity(
@@ -1292,16 +1408,8 @@ class FriendshipViewSet(viewsets.ModelViewSet):
                 {"detail": "Профиль не найден"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # Проверяем наличие блокировки
-        existing_friendship = Friendship.objects.filter(
-            profile_one=profile_one,
-            profile_two=profile_two,
-            status__name="Заблокирован",
-        ).first()  # Используем first() для получения первого найденного объекта или None
-
-        if existing_friendship:
-            # Удаляем существующую блокировку
-            existing_friendship.delete()
+        # Снимаем блокировку, если она была (при взаимной блокировке остается встречная)
+        if Friendship.objects.unblock(profile_one, profile_two):
 
             try:
                 log_user_activity(
@@ -1374,53 +1482,31 @@ class FriendshipViewSet(viewsets.ModelViewSet):
 
         profile_2 = get_object_or_404(Profile, id=pk)
 
-        # Определяем, есть ли дружба между текущим пользователем и владельцем профиля
-        friendship_exists = (
-            Friendship.objects.filter(
-                profile_one__user=request.user,
-                profile_two=profile_2,
-                status__name="Друзья",
-            ).exists()
-            or Friendship.objects.filter(
-                profile_one=profile_2,
-                profile_two__user=request.user,
-                status__name="Друзья",
-            ).exists()
+        # Ищем дружбу между текущим пользователем и владельцем профиля (одна строка на пару)
+        friendship = (
+            Friendship.objects.between(request.user.profile, profile_2)
+            .filter(status_id=friendship_status_id(FRIENDSHIP_FRIENDS))
+            .first()
         )
 
-        if friendship_exists:
-            # Попробуем найти и удалить дружбу
-            try:
-                friendship = Friendship.objects.get(
-                    (
-                        Q(profile_one__user=request.user, profile_two=profile_2)
-                        | Q(profile_one=profile_2, profile_two__user=request.user)
-                    ),
-                    status__name="Друзья",
-                )
-
-                # Удаляем объект дружбы
-                friendship.delete()
-
-                try:
-                    profile = Profile.objects.get(user=request.user)
-                    log_user_activity(
-                        profile,
-                        ActivityLog_norest.FRIEND,
-                        f"Пользователь удалил дружбу",
-                    )
-                except Exception as e:
-                    # Логируем ошибку
-                    logger.error(f"Ошибка логирования активности: {str(e)}")
+        if friendship is not None:
+            # Удаляем объект дружбы
+            friendship.delete()
 
-                return JsonResponse(
-                    {"detail": "Дружба успешно удалена."}, status=status.HTTP_200_OK
+            try:
+                profile = Profile.objects.get(user=request.user)
+                log_user_activity(
+                    profile,
+                    ActivityLog_norest.FRIEND,
+                    f"Пользователь удалил дружбу",
                 )
+            except Exception as e:
+                # Логируем ошибку
+                logger.error(f"Ошибка логирования активности: {str(e)}")
 
-            except Friendship.DoesNotExist:
-                return JsonResponse(
-                    {"detail": "Дружба не найдена."}, status=status.HTTP_404_NOT_FOUND
-                )
+            return JsonResponse(
+                {"detail": "Дружба успешно удалена."}, status=status.HTTP_200_OK
+            )
 
         else:
             return JsonResponse(
@@ -1439,7 +1525,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
 
         profile = request.user.profile
         incoming_friend_requests = Friendship.objects.filter(
-            profile_two=profile, status__name="Отправлен запрос"
+            profile_two=profile, status_id=friendship_status_id(FRIENDSHIP_REQUESTED)
         )
         return render(
             request,
@@ -1518,43 +1604,72 @@ def UserMailView(request):
     return render(request, "main/mailbox.html", context)
 
 
+def get_sender_mail_data(profile):
+    """Функция получения списка отправленных писем профиля"""
+
+    mails = Mail.objects.filter(sender=profile).select_related("sender", "recipient")
+
+    mail_data = []
+    for mail in mails:
+        mail_data.append(
+            {
+                "id": mail.id,
+                "content": mail.content,
+                "timestamp": mail.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "recipient": {
+                    "firstname": mail.recipient.firstname,
+                    "lastname": mail.recipient.lastname,
+                },
+                "sender": {
+                    "firstname": mail.sender.firstname,
+                    "lastname": mail.sender.lastname,
+                },
+            }
+        )
+    return mail_data
+
+
 @login_required
 def sender_mail(request):
     """Функция получения отправленных писем через JS"""
 
     user = request.user
     profile = Profile.objects.get(user=user)
-    cache_key = f"sender_mail_{profile.id}"
+    # Список отправленных писем кэшируется на сутки
+    mail_data = cached_compute(
+        "sender_mail",
+        f"sender_mail_{profile.id}",
+        lambda: get_sender_mail_data(profile),
+    )
 
-    # Пытаемся получить данные из кэша
-    mail_data = cache.get(cache_key)
+    return JsonResponse({"detail": mail_data}, status=200)
 
-    if mail_data is None:
-        # Если данных нет в кэше, выполняем запрос к БД
-        mails = Mail.objects.filter(sender=profile).select_related("sender", "recipient")
 
-        mail_data = []
-        for mail in mails:
-            mail_data.append(
-                {
-                    "id": mail.id,
-                    "content": mail.content,
-                    "timestamp": mail.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "recipient": {
-                        "firstname": mail.recipient.firstname,
-                        "lastname": mail.recipient.lastname,
-                    },
-                    "sender": {
-                        "firstname": mail.sender.firstname,
-                        "lastname": mail.sender.lastname,
-                    },
-                }
-            )
+def get_recipient_mail_data(profile):
+    """Функция получения списка полученных писем профиля"""
 
-        # Кэшируем результат на сутки
-        cache.set(cache_key, mail_data, 86400)
+    mails = Mail.objects.filter(recipient=profile).select_related("sender", "recipient")
 
-    return JsonResponse({"detail": mail_data}, status=200)
+    mail_data = []
+    for mail in mails:
+        mail_data.append(
+            {
+                "id": mail.id,
+                "content": mail.content,
+                "timestamp": mail.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "is_read": mail.is_read,
+                "has_parent": mail.parent_id is not None,
+                "recipient": {
+                    "firstname": mail.recipient.firstname,
+                    "lastname": mail.recipient.lastname,
+                },
+                "sender": {
+                    "firstname": mail.sender.firstname,
+                    "lastname": mail.sender.lastname,
+                },
+            }
+        )
+    return mail_data
 
 
 @login_required
@@ -1563,37 +1678,12 @@ def recipient_mail(request):
 
     user = request.user
     profile = Profile.objects.get(user=user)
-    cache_key = f"recipient_mail_{profile.id}"
-
-    # Пытаемся получить данные из кэша
-    mail_data = cache.get(cache_key)
-
-    if mail_data is None:
-        # Если данных нет в кэше, выполняем запрос к БД
-        mails = Mail.objects.filter(recipient=profile).select_related("sender", "recipient")
-
-        mail_data = []
-        for mail in mails:
-            mail_data.append(
-                {
-                    "id": mail.id,
-                    "content": mail.content,
-                    "timestamp": mail.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "is_read": mail.is_read,
-                    "has_parent": mail.parent is not None,
-                    "recipient": {
-                        "firstname": mail.recipient.firstname,
-                        "lastname": mail.recipient.lastname,
-                    },
-                    "sender": {
-                        "firstname": mail.sender.firstname,
-                        "lastname": mail.sender.lastname,
-                    },
-                }
-            )
-
-        # Кэшируем результат на сутки
-        cache.set(cache_key, mail_data, 86400)
+    # Список полученных писем кэшируется на сутки
+    mail_data = cached_compute(
+        "recipient_mail",
+        f"recipient_mail_{profile.id}",
+        lambda: get_recipient_mail_data(profile),
+    )
 
     return JsonResponse({"detail": mail_data}, status=200)
 
@@ -1723,51 +1813,51 @@ def send_mail_parent(request):
     return JsonResponse({"error": "Неверный запрос"}, status=400)
 
 
+def get_mail_detail_data(mail_id):
+    """Функция получения данных письма по id (Mail.DoesNotExist, если письма нет)"""
+
+    mail = Mail.objects.select_related(
+        "sender__user", "recipient__user", "parent"
+    ).get(id=mail_id)
+
+    return {
+        "id": mail.id,
+        "content": mail.content,
+        "sender": {
+            "firstname": mail.sender.firstname,
+            "lastname": mail.sender.lastname,
+            "username": mail.sender.user.username,
+        },
+        "recipient": {
+            "firstname": mail.recipient.firstname,
+            "lastname": mail.recipient.lastname,
+        },
+        "parent": {"content": mail.parent.content} if mail.parent else None,
+    }
+
+
 @login_required
 def message_detail(request, mail_id):
     """Функция получения данных письма по id"""
 
-    # Уникальный ключ кэша для конкретного письма
-    cache_key = f"mail_detail_{mail_id}"
-
-    # Проверяем наличие данных в кэше
-    data = cache.get(cache_key)
-
-    if data is None:
-
-        try:
-            mail = Mail.objects.get(id=mail_id)
-            # Обновляем статус сообщения
-            mail.is_read = True
-            mail.save()
-
-            data = {
-                "id": mail.id,
-                "content": mail.content,
-                "sender": {
-                    "firstname": mail.sender.user.profile.firstname,
-                    "lastname": mail.sender.user.profile.lastname,
-                    "username": mail.sender.user.username,
-                },
-                "recipient": {
-                    "firstname": mail.recipient.user.profile.firstname,
-                    "lastname": mail.recipient.user.profile.lastname,
-                },
-                "parent": (
-                    {"content": mail.parent.content if mail.parent else None}
-                    if mail.parent
-                    else None
-                ),
-            }
-            is_sender = request.user.profile == mail.sender
+    try:
+        # Данные письма кэшируются на сутки
+        data = cached_compute(
+            "mail_detail", f"mail_detail_{mail_id}", lambda: get_mail_detail_data(mail_id)
+        )
+    except Mail.DoesNotExist:
+        return JsonResponse({"error": "Сообщение не найдено"}, status=404)
 
-            # Кэшируем контекст на сутки
-            cache.set(cache_key, data, 86400)
+    # Обновляем статус сообщения, если его открыл получатель
+    if Mail.objects.filter(
+        id=mail_id, recipient__user=request.user, is_read=False
+    ).update(is_read=True):
+        # update не вызывает сигналы - сбрасываем кэш входящих вручную
+        cache.delete(f"recipient_mail_{request.user.profile.id}")
 
-            return JsonResponse({"detail": data, "isSender": is_sender}, status=200)
-        except Mail.DoesNotExist:
-            return JsonResponse({"error": "Сообщение не найдено"}, status=404)
+    is_sender = data["sender"]["username"] == request.user.username
 
+    return JsonResponse({"detail": data, "isSender": is_sender}, status=200)
 
 
 @login_required
@@ -1776,30 +1866,18 @@ def friends_list_api(request):
 
     user_profile = request.user.profile
 
-    friendships = Friendship.objects.filter(
-        Q(profile_one=user_profile)
-        | Q(profile_two=user_profile) & Q(status__name="Друзья")
-    ).select_related("profile_one", "profile_two", "status")
-
-    friends = []
-    seen_profiles = set()
-
-    for friendship in friendships:
-        if friendship.profile_one == user_profile:
-            friend = friendship.profile_two
-        else:
-            friend = friendship.profile_one
-
-        if friend.id not in seen_profiles:
-            seen_profiles.add(friend.id)  # Добавляем ID друга в множество
-
-            friends.append(
-                {
-                    "friend_name": f"{friend.firstname} {friend.lastname}",
-                    "friend_profile_username": friend.user.username,
-                    "status": friendship.status.name,
-                }
-            )
+    # Только подтвержденные друзья (раньше из-за приоритета & и | в выборку попадали
+    # и заявки, и блокировки, где пользователь - profile_one)
+    friends = [
+        {
+            "friend_name": f"{firstname} {lastname}",
+            "friend_profile_username": username,
+            "status": "Друзья",
+        }
+        for firstname, lastname, username in Profile.objects.filter(
+            id__in=friends_of(user_profile.id)
+        ).values_list("firstname", "lastname", "user__username")
+    ]
 
     return JsonResponse({"friends": friends}, safe=False)
 
@@ -1815,18 +1893,15 @@ def send_friend_request(request, username):
         messages.error(request, "Вы не можете отправить запрос на дружбу самому себе!")
         return redirect("profile", username=username)
 
-    if Friendship.objects.filter(
-        (Q(profile_one=user_profile) & Q(profile_two=friend_profile))
-        | (Q(profile_one=friend_profile) & Q(profile_two=user_profile))
-    ).exists():
+    if Friendship.objects.between(user_profile, friend_profile).exists():
         messages.error(request, "Запрос на дружбу уже отправлен или вы уже друзья.")
         return redirect("profile", username=username)
 
-    sent_status = get_object_or_404(FriendshipStatus, name="Отправлен запрос")
-
     # Создаем новый объект Friendship с указанным статусом
     Friendship.objects.create(
-        profile_one=user_profile, profile_two=friend_profile, status=sent_status
+        profile_one=user_profile,
+        profile_two=friend_profile,
+        status_id=friendship_status_id(FRIENDSHIP_REQUESTED),
     )
 
     messages.success(request, "Запрос на дружбу отправлен.")
@@ -1979,10 +2054,10 @@ class GroupListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
 
         # Создаем ключ для кэша, который будет уникальным для текущего запроса (учитывая GET параметры)
-        cache_key = f"group_filter_{generate_cache_key(self.request)}"
+        cache_key = namespaced_key("group_filter", generate_cache_key(self.request))
 
         # Пробуем получить данные из кэша
-        cached_data = cache.get(cache_key)
+        cached_data = cache_get("group_filter", cache_key)
 
         if cached_data:
             # Если данные есть в кэше, используем их
@@ -1998,61 +2073,62 @@ class GroupListView(LoginRequiredMixin, ListView):
             context["groups"] = filterset.qs
 
             # Кэшируем результат и параметры
-            set_cache_with_key(cache_key, {
+            cache.set(cache_key, {
                 "groups": list(context["groups"]),  # Кэшируем сами объекты групп
                 "filterset_params": self.request.GET.dict()
-            })
+            }, 86400)
 
         return context
 
 
-def GroupDetailView(request, pk):
-    """Просмотр профиля группы"""
+def get_group_detail_data(pk):
+    """Функция получения общих для всех пользователей данных группы"""
 
-    # Уникальный ключ кэша для конкретной группы и пользователя
-    cache_key = f"group_detail_{pk}"
+    # Получение профиля группы
+    group = get_object_or_404(Group, id=pk)
 
-    # Проверяем наличие данных в кэше
-    context = cache.get(cache_key)
+    group_members = list(
+        GroupMembership.objects.filter(group=group)
+        .select_related("profile__user", "status")
+        .prefetch_related(
+            Prefetch(
+                "profile__media_files",
+                queryset=Mediafile.objects.filter(file_type="avatar"),
+                to_attr="avatars",
+            )
+        )
+    )
 
-    if context is None:
-        # Получение профиля группы
-        group = get_object_or_404(Group, id=pk)
-        profile = get_object_or_404(Profile, user=request.user)
+    return {
+        "group": group,
+        "group_members": group_members,
+        "public_group": group.group_type == Group.PUBLIC,
+        "secret_group": group.group_type == Group.SECRET,
+    }
 
-        is_creator = group.creator == profile
 
-        group_members = (
-            GroupMembership.objects.filter(group=group)
-            .select_related("profile__user")
-            .prefetch_related(
-                Prefetch(
-                    "profile__media_files",
-                    queryset=Mediafile.objects.filter(file_type="avatar"),
-                    to_attr="avatars",
-                )
-            )
-        )
+def GroupDetailView(request, pk):
+    """Просмотр профиля группы"""
 
-        is_member = GroupMembership.objects.filter(
-            profile=request.user.profile, group=group
-        ).exists()
+    # Общие данные группы кэшируются на сутки
+    group_data = cached_compute(
+        "group_detail", f"group_detail_{pk}", lambda: get_group_detail_data(pk)
+    )
+    group = group_data["group"]
 
-        public_group = group.group_type == Group.PUBLIC
-        secret_group = group.group_type == Group.SECRET
+    # Роль текущего пользователя в группе у каждого своя, поэтому в кэш не попадает
+    profile = get_object_or_404(Profile, user=request.user)
 
-        # Формируем контекст данных
-        context = {
-            "group": group,
-            "is_member": is_member,
-            "is_creator": is_creator,
-            "group_members": group_members,
-            "public_group": public_group,
-            "secret_group": secret_group,
-        }
+    is_creator = group.creator_id == profile.id
 
-        # Кэшируем контекст на сутки
-        cache.set(cache_key, context, 86400)
+    is_member = GroupMembership.objects.filter(profile=profile, group=group).exists()
+
+    # Формируем контекст данных
+    context = {
+        **group_data,
+        "is_member": is_member,
+        "is_creator": is_creator,
+    }
 
     return render(request, "main/group_detail.html", context)
 
@@ -2085,9 +2161,6 @@ def GroupInvite(request, username, pk):
             )
 
 
-    # Получение объекта Status (по id 1 User)
-    status_instance = get_object_or_404(Status, id=1)
-
     if if_member:
         return JsonResponse(
             {"detail": "Данный пользователь уже в Вашей группе."},
@@ -2097,7 +2170,7 @@ def GroupInvite(request, username, pk):
         GroupMembership.objects.create(
             profile=profile,
             group=group,
-            status=status_instance,  # Передаем объект Status
+            status_id=group_status_id(GROUP_USER),
         )
 
         try:
@@ -2125,11 +2198,10 @@ def join_group(request, pk):
     """Функция присоединения в группу"""
 
     group = get_object_or_404(Group, pk=pk)
-    status_instance = get_object_or_404(Status, id=1)  # 1-User
 
     if not group.members.filter(profile=request.user.profile, group=group).exists():
         GroupMembership.objects.create(
-            profile=request.user.profile, group=group, status=status_instance
+            profile=request.user.profile, group=group, status_id=group_status_id(GROUP_USER)
         )
 
         try:
@@ -2248,9 +2320,10 @@ class GroupCreateView(LoginRequiredMixin, CreateView):
         group = form.save()
 
         # Создаем запись в GroupMembership
-        status_instance = get_object_or_404(Status, id=2)  # 2 - admin
         GroupMembership.objects.create(
-            profile=self.request.user.profile, group=group, status=status_instance
+            profile=self.request.user.profile,
+            group=group,
+            status_id=group_status_id(GROUP_ADMIN),
         )
 
 
@@ -2411,21 +2484,20 @@ def accept_friend_request(request, username):
         Friendship, profile_one=friend_profile, profile_two=user_profile
     )
 
-    if friendship.status.name == "Друзья":
+    if friendship.status_id == friendship_status_id(FRIENDSHIP_FRIENDS):
         messages.error(request, "Вы уже друзья.")
         return redirect("profile_detail", username=username)
-    elif friendship.status.name == "Заблокирован":
+    elif friendship.status_id == friendship_status_id(FRIENDSHIP_BLOCKED):
         messages.error(request, "Вы не можете принять этот запрос.")
         return redirect("profile_detail", username=username)
-    elif friendship.status.name != "Отправлен запрос":
+    elif friendship.status_id != friendship_status_id(FRIENDSHIP_REQUESTED):
         messages.error(
             request, "Невозможно принять запрос. Некорректный статус запроса."
         )
         return redirect("profile_detail", username=username)
 
     # Обновляем статус дружбы на "Друзья"
-    friends_status = get_object_or_404(FriendshipStatus, name="Друзья")
-    friendship.status = friends_status
+    friendship.status_id = friendship_status_id(FRIENDSHIP_FRIENDS)
     friendship.save()
 
     messages.success(request, "Запрос на дружбу принят.")
@@ -0,0 +1,182 @@
+import asyncio
+import atexit
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriteBuffer:
+    '''
+    Буфер отложенной записи сообщений чата (write-behind).
+    Сообщения сразу рассылаются в комнату, а в таблицу Chat попадают пачками
+    через bulk_create - каждые max_messages сообщений или flush_interval_ms миллисекунд.
+    Время сообщения фиксируется при получении. Пачка, которую не удалось записать,
+    возвращается в буфер и повторяется при следующем сбросе; после max_attempts неудачных
+    попыток сообщения пишутся по одному, и отбрасываются только те, что не записались.
+    Счетчики буфера (stats) пишутся в лог не чаще раза в stats_interval_s секунд и при
+    остановке процесса: буфер у каждого воркера свой, снаружи их не прочитать.
+    '''
+
+    def __init__(
+        self, max_messages=50, flush_interval_ms=500, max_pending=5000, max_attempts=3,
+        stats_interval_s=60,
+    ):
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.stats_interval = stats_interval_s
+
+        self._pending = []
+        self._lock = None
+        self._timer = None
+
+        # счетчики для мониторинга
+        self.buffered = 0
+        self.flushed = 0
+        self.dropped = 0
+        self._stats_logged_at = time.monotonic()
+
+    def _get_lock(self):
+        # лок создаем лениво, чтобы он был привязан к работающему event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def add(self, message, profile_id, group_id):
+        # Добавление сообщения в буфер
+        if len(self._pending) >= self.max_pending:
+            # БД не успевает - отбрасываем сообщение, чтобы не съесть всю память
+            self.dropped += 1
+            logger.warning("Буфер чата переполнен, сообщение отброшено")
+            return
+
+        # строка для Chat и число неудачных попыток записи
+        row = {
+            "messages": message,
+            "profile_id": profile_id,
+            "group_id": group_id,
+            "created_at": timezone.now(),
+        }
+        self._pending.append((row, 0))
+        self.buffered += 1
+
+        if len(self._pending) >= self.max_messages:
+            await self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        # сброс буфера по таймеру, пока в нем есть сообщения (в том числе возвращенные после ошибки)
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self._pending:
+                break
+
+    async def flush(self):
+        # Асинхронный сброс буфера в БД
+        async with self._get_lock():
+            batch, self._pending = self._pending, []
+            if batch:
+                retry = await sync_to_async(self._write)(batch)
+                if retry:
+                    # неудачная пачка идет в начало буфера, чтобы сохранить порядок сообщений
+                    self._pending = retry + self._pending
+                    self._schedule_flush()
+        if time.monotonic() - self._stats_logged_at >= self.stats_interval:
+            self.log_stats()
+
+    def flush_sync(self):
+        # Синхронный сброс (при завершении процесса, когда event loop уже остановлен).
+        # Повторить запись позже уже нельзя, поэтому сразу пишем по одному то, что не записалось
+        batch, self._pending = self._pending, []
+        if batch:
+            retry = self._write(batch)
+            if retry:
+                self._write_one_by_one([row for row, _ in retry])
+        self.log_stats()
+
+    def _write(self, batch):
+        # Запись пачки. Возвращает сообщения, которые нужно повторить при следующем сбросе
+        from main.models import Chat  # Импортируем модель внутри функции (чтобы избежать циклического импорта)
+
+        try:
+            Chat.objects.bulk_create([Chat(**row) for row, _ in batch])
+            self.flushed += len(batch)
+            return []
+        except Exception as e:
+            logger.error(f"Ошибка сохранения сообщений чата: {str(e)}")
+
+        retry = [(row, attempts + 1) for row, attempts in batch if attempts + 1 < self.max_attempts]
+        exhausted = [row for row, attempts in batch if attempts + 1 >= self.max_attempts]
+        if exhausted:
+            # пачку не удается записать несколько раз подряд - возможно, мешает одно сообщение
+            # (например, группу удалили): пишем по одному, остальные не теряются
+            self._write_one_by_one(exhausted)
+        return retry
+
+    def _write_one_by_one(self, rows):
+        from main.models import Chat
+
+        for row in rows:
+            try:
+                Chat.objects.create(**row)
+                self.flushed += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"Сообщение чата отброшено: {str(e)}")
+
+    def stats(self):
+        # Счетчики буфера
+        return {
+            "buffered": self.buffered,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+        }
+
+    def log_stats(self):
+        # Счетчики в лог (мониторинг буфера по логам воркеров)
+        self._stats_logged_at = time.monotonic()
+        stats = self.stats()
+        message = ", ".join(f"{name}={value}" for name, value in stats.items())
+        if stats["dropped"]:
+            logger.warning(f"Буфер чата: {message}")
+        else:
+            logger.info(f"Буфер чата: {message}")
+
+
+_buffer = None
+_buffer_initialized = False
+
+
+def get_chat_write_buffer():
+    # Буфер создается лениво и только если он включен в настройках
+    global _buffer, _buffer_initialized
+
+    if not _buffer_initialized:
+        _buffer_initialized = True
+        config = getattr(settings, "CHAT_WRITE_BEHIND", {})
+        if config.get("ENABLED", False):
+            _buffer = ChatWriteBuffer(
+                max_messages=config.get("MAX_MESSAGES", 50),
+                flush_interval_ms=config.get("FLUSH_INTERVAL_MS", 500),
+                max_pending=config.get("MAX_PENDING", 5000),
+                max_attempts=config.get("MAX_ATTEMPTS", 3),
+                stats_interval_s=config.get("STATS_INTERVAL_S", 60),
+            )
+            # при остановке воркера дописываем все, что осталось в буфере
+            atexit.register(_buffer.flush_sync)
+
+    return _buffer
@@ -1,8 +1,11 @@
 import json
-from datetime import datetime
+from urllib.parse import parse_qs
 
 from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .chat_buffer import get_chat_write_buffer
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -16,11 +19,24 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         print(f"Connecting to room: {self.room_group_name}")
 
+        # Клиент, подключившийся с ?history=batch, получает историю одним кадром
+        # и может дозапрашивать более старые страницы по курсору
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.batch_history = query.get("history") == ["batch"]
+
+        # Имя отправителя не меняется за время сессии - получаем его один раз
+        self.identity = await self.get_user_identity(self.scope["user"])
+
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         await self.accept()
 
-        # Загружаем все сообщения группы за текущий день
+        # Дописываем буфер, чтобы свежие сообщения попали в историю
+        chat_buffer = get_chat_write_buffer()
+        if chat_buffer is not None:
+            await chat_buffer.flush()
+
+        # Загружаем последнюю страницу сообщений группы
         await self.load_messages()
 
     async def disconnect(self, close_code):
@@ -28,18 +44,34 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
+        # Дописываем в БД сообщения, накопленные в буфере
+        chat_buffer = get_chat_write_buffer()
+        if chat_buffer is not None:
+            await chat_buffer.flush()
+
     async def receive(self, text_data):
         # Получение сообщений
 
         text_data_json = json.loads(text_data)
+
+        if text_data_json.get("type") == "history":
+            # Запрос более старой страницы истории по курсору
+            await self.load_messages(before=text_data_json.get("before"))
+            return
+
         message = text_data_json["message"]
-        user = self.scope["user"]
 
-        # Получаем имя пользователя асинхронно
-        firstname, lastname = await self.get_user_profile(user)
+        if self.identity is None:
+            # у анонимного пользователя нет профиля - писать в чат он не может
+            return
+
+        profile_id, firstname, lastname = self.identity
 
-        # Сохраняем сообщение в базе данных
-        await self.save_message(message, user)
+        chat_buffer = get_chat_write_buffer()
+
+        if chat_buffer is None:
+            # Сохраняем сообщение в базе данных
+            await self.save_message(message, profile_id)
 
         await self.channel_layer.group_send(
             self.room_group_name,
@@ -51,6 +83,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             },
         )
 
+        if chat_buffer is not None:
+            # В режиме отложенной записи сообщение уже разослано, в БД оно попадет пачкой
+            await chat_buffer.add(message, profile_id, self.room_name)
+
     async def chat_message(self, event):
         # Функция формирующая сообщение для отправки
         message = event["message"]
@@ -63,46 +99,80 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
         )
 
-    async def load_messages(self):
-        # Функция формирующая сообщение для получения
-        now = datetime.now()
-        today = now.date()
-
-        # Используем sync_to_async для вызова синхронной операции
-        messages = await sync_to_async(self.get_messages)(self.room_name, today)
+    async def load_messages(self, before=None):
+        # Функция формирующая страницу истории сообщений
+        from main.pagination import decode_cursor
+
+        cursor = decode_cursor(before)
+        if before and cursor is None:
+            # некорректный курсор - отдаем пустую страницу
+            messages, next_cursor = [], None
+        else:
+            # Используем sync_to_async для вызова синхронной операции
+            messages, next_cursor = await sync_to_async(self.get_messages)(
+                self.room_name, cursor
+            )
 
-        for message in messages:
+        history = [
+            {
+                "message": message["messages"],
+                "username": message["profile__firstname"],
+                "lastname": message["profile__lastname"],
+            }
+            for message in messages
+        ]
+
+        if self.batch_history:
             await self.send(
                 text_data=json.dumps(
-                    {
-                        "message": message["messages"],
-                        "username": message["profile__firstname"],
-                        "lastname": message["profile__lastname"],
-                    }
+                    {"type": "history", "messages": history, "next_cursor": next_cursor}
                 )
             )
+        elif before is None:
+            # старый клиент получает первую страницу по одному кадру на сообщение
+            for message in history:
+                await self.send(text_data=json.dumps(message))
 
-    def get_messages(self, room_name, today):
-        # функция получения сообщений за сегодня (грузятся в чате при входе)
+    def get_messages(self, room_name, cursor=None):
+        # функция получения страницы сообщений (от новых к старым по индексу group, created_at, id)
         from main.models import Chat  # Импортируем модель внутри функции (чтобы избежать циклического импорта)
+        from main.pagination import encode_cursor, keyset_before
 
-        return list(
-            Chat.objects.filter(group_id=room_name, created_at__date=today).values(
-                "messages", "profile__firstname", "profile__lastname"
-            )
+        page_size = settings.CHAT_HISTORY_PAGE_SIZE
+
+        messages = Chat.objects.filter(group_id=room_name)
+        if cursor is not None:
+            messages = keyset_before(messages, cursor)
+
+        rows = list(
+            messages.order_by("-created_at", "-id").values(
+                "id", "created_at", "messages", "profile__firstname", "profile__lastname"
+            )[: page_size + 1]
         )
 
-    async def save_message(self, message, user):
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+        # в чат сообщения выводятся в хронологическом порядке
+        rows.reverse()
+        return rows, next_cursor
+
+    async def save_message(self, message, profile_id):
         # функция сохранения сообщения в таблицу
         from main.models import Chat  # Импортируем модель внутри функции
 
         await sync_to_async(Chat.objects.create)(
-            messages=message, profile=user.profile, group_id=self.room_name
+            messages=message, profile_id=profile_id, group_id=self.room_name
         )
 
-    async def get_user_profile(self, user):
-        # Асинхронно получаем имя и фамилию пользователя. Но т.к Джанго не может работать с
-        # таблицами аминхронно используем sync_to_async
+    async def get_user_identity(self, user):
+        # Асинхронно получаем id профиля, имя и фамилию пользователя. Но т.к Джанго не может работать с
+        # таблицами асинхронно используем sync_to_async. Имена берутся из общего LRU-кэша процесса
+        from main.profile_names import get_profile_identity
+
+        if not user.is_authenticated:
+            return None
 
-        profile = await sync_to_async(lambda: user.profile)()
-        return profile.firstname, profile.lastname
+        return await sync_to_async(get_profile_identity)(user.id)
@@ -125,11 +125,41 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
 CORS_ALLOW_ALL_ORIGINS = True
+# курсор следующей страницы ленты новостей отдается в заголовках
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "Link"]
 
-CHANNEL_LAYERS = {
-    "default": {
+# Слой каналов для чата. memory работает только внутри одного процесса,
+# redis/redis_pubsub объединяют комнаты всех воркеров gunicorn и всех нод.
+# Выбирается переменной окружения CHANNEL_LAYER_BACKEND (имя из словаря ниже
+# или полный путь к классу слоя)
+CHANNEL_REDIS_URL = os.environ.get("CHANNEL_REDIS_URL", "redis://localhost:6379/1")
+
+CHANNEL_LAYER_BACKENDS = {
+    "memory": {
         "BACKEND": "channels.layers.InMemoryChannelLayer",
     },
+    "redis": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [CHANNEL_REDIS_URL],
+            "capacity": 1500,  # очередь на канал, чтобы всплеск в комнате не терял сообщения
+            "expiry": 10,
+        },
+    },
+    "redis_pubsub": {
+        "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+        "CONFIG": {
+            "hosts": [CHANNEL_REDIS_URL],
+        },
+    },
+}
+
+CHANNEL_LAYER_BACKEND = os.environ.get("CHANNEL_LAYER_BACKEND", "memory")
+
+CHANNEL_LAYERS = {
+    "default": CHANNEL_LAYER_BACKENDS.get(
+        CHANNEL_LAYER_BACKEND, {"BACKEND": CHANNEL_LAYER_BACKEND}
+    ),
 }
 
 AUTH_USER_MODEL = "main.User"
@@ -164,24 +194,36 @@ CELERY_TIMEZONE = "UTC"
 
 CELERY_BEAT_SCHEDULE = {
     "archive-chat-daily": {
-        "task": "socnet.tasks.archive_chat",
+        "task": "main.tasks.archive_chat",
         "schedule": crontab(hour=0, minute=0),  # каждый день в полночь
     },
     "archive-mail-weekly": {
-        "task": "socnet.tasks.archive_mail",
+        "task": "main.tasks.archive_mail",
         "schedule": crontab(0, 0, day_of_week="sunday"),  # каждое воскресенье в полночь
         # 'schedule': crontab(minute='*/1'),  # Каждую минуту
     },
     "clean-mail-every-six-months": {
-        "task": "socnet.tasks.clean_mail",
+        "task": "main.tasks.clean_mail",
         "schedule": crontab(
             0, 0, day_of_month="1", month_of_year="*/6"
         ),  # 1-го числа каждые 6 месяцев
     },
     "update-online-status-every-5-minutes": {
-        "task": "your_app_name.tasks.update_online_status",
+        "task": "main.tasks.update_online_status",
         "schedule": crontab(minute="*/5"),  # Выполнять каждые 5 минут
     },
+    "trim-timelines-hourly": {
+        "task": "main.tasks.trim_timelines",
+        "schedule": crontab(minute=30),  # каждый час
+    },
+    "refresh-profile-similarity-daily": {
+        "task": "main.tasks.refresh_profile_similarity",
+        "schedule": crontab(hour=2, minute=30),  # каждый день, до пересчета рекомендаций
+    },
+    "refresh-friend-recommendations-daily": {
+        "task": "main.tasks.refresh_friend_recommendations",
+        "schedule": crontab(hour=3, minute=0),  # каждый день в 3 часа ночи
+    },
 }
 
 LOGGING = {
@@ -203,6 +245,11 @@ LOGGING = {
             "level": "WARNING",  # Скрыть SQL-запросы (используется WARNING вместо DEBUG)
             "propagate": False,
         },
+        "socnet.chat_buffer": {
+            "handlers": ["console"],
+            "level": "INFO",  # Счетчики буфера записи чата (CHAT_WRITE_BEHIND)
+            "propagate": False,
+        },
     },
 }
 
@@ -239,4 +286,52 @@ SPECTACULAR_SETTINGS = {
     "SWAGGER_UI_DIST": "https://cdn.jsdelivr.net/npm/swagger-ui-dist@latest", # default
     "SWAGGER_UI_FAVICON_HREF": STATIC_URL + "your_company_favicon.png", # default is swagger favicon
 
-}
\ No newline at end of file
+}
+# Отложенная запись сообщений чата (write-behind): сообщения пишутся в БД пачками
+CHAT_WRITE_BEHIND = {
+    "ENABLED": False,
+    "MAX_MESSAGES": 50,  # сброс в БД каждые N сообщений
+    "FLUSH_INTERVAL_MS": 500,  # или каждые M миллисекунд
+    "MAX_PENDING": 5000,  # больше этого в буфере не держим, лишнее отбрасываем
+    "MAX_ATTEMPTS": 3,  # после N неудачных записей пачки сообщения пишутся по одному
+    "STATS_INTERVAL_S": 60,  # как часто писать счетчики буфера в лог
+}
+
+# Размер страницы истории чата (первая страница при входе и каждая догружаемая)
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# Лента новостей /api/news/: размер страницы по умолчанию и максимальный ?limit=
+NEWS_FEED_PAGE_SIZE = 20
+NEWS_FEED_MAX_PAGE_SIZE = 100
+
+# Комментарии новости: сколько корневых веток выводится за раз и
+# сколько новых комментариев максимум отдается за один запрос "новые с момента"
+COMMENT_ROOTS_PAGE_SIZE = 20
+COMMENTS_SINCE_LIMIT = 100
+
+# Список профилей: сколько профилей на одной странице
+PROFILE_LIST_PAGE_SIZE = 50
+
+# Лента друзей материализуется при публикации (fan-out on write):
+# TIMELINE_MAX_ENTRIES - сколько записей хранится в ленте одного профиля,
+# TIMELINE_FANOUT_MAX_FRIENDS - у авторов с большим числом друзей новости не
+# рассылаются, а подмешиваются при чтении, TIMELINE_BACKFILL - сколько последних
+# новостей нового друга добавляется в ленту при принятии дружбы
+TIMELINE_MAX_ENTRIES = 1000
+TIMELINE_FANOUT_MAX_FRIENDS = 1000
+TIMELINE_BACKFILL = 100
+
+# Рекомендации друзей: сколько лучших кандидатов хранится для каждого профиля
+# и сколько профилей обрабатывается задачей за один проход
+FRIEND_RECOMMENDATIONS_TOP_K = 20
+FRIEND_RECOMMENDATIONS_BATCH = 500
+
+# Похожие по интересам профили: сколько соседей хранится для каждого профиля
+# и сколько профилей обрабатывается за один блок
+PROFILE_SIMILARITY_TOP_N = 20
+PROFILE_SIMILARITY_BLOCK = 500
+
+# Присутствие пользователей: активность пишется в StatusProfile не чаще раза в
+# PRESENCE_PERSIST_INTERVAL сек, офлайн ставится после PRESENCE_OFFLINE_AFTER сек тишины
+PRESENCE_PERSIST_INTERVAL = 60
+PRESENCE_OFFLINE_AFTER = 300
@@ -0,0 +1,204 @@
+"""Тесты чата на слое каналов из настроек.
+
+По умолчанию слой - InMemoryChannelLayer (один процесс). Чтобы проверить рассылку через
+Redis, тесты запускаются с локальным Redis (сервис redis из docker-compose или любой
+совместимый сервер):
+
+    docker compose run --rm chat-tests
+
+или без Docker, с Redis на localhost (адрес меняется в CHANNEL_REDIS_URL):
+
+    CHANNEL_LAYER_BACKEND=redis python manage.py test socnet.tests
+
+Тесты, которым нужен слой, общий для нескольких процессов, на memory пропускаются.
+"""
+
+import json
+import uuid
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, override_settings
+
+from main.models import Chat, Group
+from main.tests import LookupTestCase
+
+from . import chat_buffer
+from .chat_buffer import ChatWriteBuffer
+from .routing import websocket_urlpatterns
+
+
+# Сколько ждать сообщения из слоя каналов, сек (для Redis с запасом)
+RECEIVE_TIMEOUT = 2
+
+
+def use_new_channel_layer(test):
+    """Подменяет слой каналов новым экземпляром на время теста.
+    Redis-слой привязывает соединения к event loop, а каждый async-тест идет в своем"""
+    layer = channel_layers.make_backend("default")
+    previous = channel_layers.set("default", layer)
+    if previous is None:
+        test.addCleanup(channel_layers.backends.pop, "default", None)
+    else:
+        test.addCleanup(channel_layers.set, "default", previous)
+    return layer
+
+
+class ChannelLayerTests(SimpleTestCase):
+    '''Рассылка в группы через слой каналов'''
+
+    def setUp(self):
+        self.layer = use_new_channel_layer(self)
+        self.group = f"chat_test_{uuid.uuid4().hex}"
+
+    async def test_group_send_reaches_every_member(self):
+        await self.layer.flush()
+        try:
+            members = [await self.layer.new_channel() for _ in range(3)]
+            outsider = await self.layer.new_channel()
+            for channel in members:
+                await self.layer.group_add(self.group, channel)
+
+            await self.layer.group_send(self.group, {"type": "chat_message", "message": "hi"})
+
+            for channel in members:
+                self.assertEqual((await self.layer.receive(channel))["message"], "hi")
+            # в канал вне группы рассылка не попала: первым приходит отправленное напрямую
+            await self.layer.send(outsider, {"type": "ping"})
+            self.assertEqual((await self.layer.receive(outsider))["type"], "ping")
+        finally:
+            await self.layer.flush()
+
+    async def test_group_discard_stops_delivery(self):
+        await self.layer.flush()
+        try:
+            channel = await self.layer.new_channel()
+            await self.layer.group_add(self.group, channel)
+            await self.layer.group_discard(self.group, channel)
+
+            await self.layer.group_send(self.group, {"type": "chat_message", "message": "lost"})
+            await self.layer.send(channel, {"type": "ping"})
+            self.assertEqual((await self.layer.receive(channel))["type"], "ping")
+        finally:
+            await self.layer.flush()
+
+    async def test_group_spans_layer_instances(self):
+        # Отдельный экземпляр слоя с теми же настройками - как слой другого воркера gunicorn
+        if isinstance(self.layer, InMemoryChannelLayer):
+            self.skipTest("memory-слой работает в одном процессе, нужен CHANNEL_LAYER_BACKEND=redis")
+
+        other_worker = channel_layers.make_backend("default")
+        await self.layer.flush()
+        try:
+            channel = await other_worker.new_channel()
+            await other_worker.group_add(self.group, channel)
+
+            await self.layer.group_send(self.group, {"type": "chat_message", "message": "across"})
+            self.assertEqual((await other_worker.receive(channel))["message"], "across")
+        finally:
+            await self.layer.flush()
+
+
+class ChatConsumerTests(LookupTestCase):
+    '''Рассылка сообщений комнаты через ChatConsumer'''
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_profile("alice")
+        self.bob = self.create_profile("bob")
+        self.room = Group.objects.create(name="room", description="", creator=self.alice)
+        self.other_room = Group.objects.create(name="other", description="", creator=self.bob)
+        self.application = URLRouter(websocket_urlpatterns)
+        self.layer = use_new_channel_layer(self)
+
+    async def connect(self, user, room):
+        communicator = WebsocketCommunicator(self.application, f"/ws/chat/{room.id}/")
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive(self, communicator):
+        return json.loads(await communicator.receive_from(timeout=RECEIVE_TIMEOUT))
+
+    async def test_message_fans_out_to_room(self):
+        await self.layer.flush()
+        sender = await self.connect(self.alice.user, self.room)
+        listener = await self.connect(self.bob.user, self.room)
+        outsider = await self.connect(self.bob.user, self.other_room)
+        try:
+            await sender.send_to(text_data=json.dumps({"message": "hello"}))
+
+            expected = {"message": "hello", "username": "alice", "lastname": "alice"}
+            self.assertEqual(await self.receive(sender), expected)
+            self.assertEqual(await self.receive(listener), expected)
+            self.assertTrue(await outsider.receive_nothing(timeout=0.2))
+        finally:
+            for communicator in (sender, listener, outsider):
+                await communicator.disconnect()
+            await self.layer.flush()
+
+        self.assertEqual(
+            [
+                (chat.messages, chat.profile_id)
+                async for chat in Chat.objects.filter(group=self.room)
+            ],
+            [("hello", self.alice.id)],
+        )
+
+    async def test_history_is_sent_on_connect(self):
+        await self.layer.flush()
+        await Chat.objects.acreate(messages="earlier", profile=self.alice, group=self.room)
+        listener = await self.connect(self.bob.user, self.room)
+        try:
+            self.assertEqual(
+                await self.receive(listener),
+                {"message": "earlier", "username": "alice", "lastname": "alice"},
+            )
+        finally:
+            await listener.disconnect()
+            await self.layer.flush()
+
+    async def test_anonymous_user_cannot_post(self):
+        await self.layer.flush()
+        anonymous = await self.connect(AnonymousUser(), self.room)
+        listener = await self.connect(self.bob.user, self.room)
+        try:
+            await anonymous.send_to(text_data=json.dumps({"message": "spam"}))
+            self.assertTrue(await listener.receive_nothing(timeout=0.2))
+        finally:
+            await anonymous.disconnect()
+            await listener.disconnect()
+            await self.layer.flush()
+
+        self.assertFalse(await Chat.objects.filter(group=self.room).aexists())
+
+
+class ChatWriteBufferTests(LookupTestCase):
+    '''Буфер отложенной записи сообщений чата'''
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_profile("author")
+        self.room = Group.objects.create(name="room", description="", creator=self.author)
+
+    @override_settings(CHAT_WRITE_BEHIND={"ENABLED": True, "MAX_ATTEMPTS": 5, "STATS_INTERVAL_S": 10})
+    def test_settings_are_applied(self):
+        with mock.patch.object(chat_buffer, "_buffer", None), \
+                mock.patch.object(chat_buffer, "_buffer_initialized", False), \
+                mock.patch.object(chat_buffer.atexit, "register"):
+            buffer = chat_buffer.get_chat_write_buffer()
+        self.assertEqual((buffer.max_attempts, buffer.stats_interval), (5, 10))
+
+    async def test_stats_are_logged_on_flush(self):
+        buffer = ChatWriteBuffer(stats_interval_s=0)
+        await buffer.add("hello", self.author.id, self.room.id)
+        with self.assertLogs("socnet.chat_buffer", "INFO") as logs:
+            await buffer.flush()
+        self.assertEqual(
+            logs.output, ["INFO:socnet.chat_buffer:Буфер чата: buffered=1, flushed=1, dropped=0, pending=0"]
+        )
+        self.assertTrue(await Chat.objects.filter(group=self.room, messages="hello").aexists())